@@ -2,16 +2,23 @@ import argparse
 import logging
 import sys
 import threading
+import time
 
 import cv2
 import numpy as np
 
-from image_management.ApplicationController import SharedConfig
+from calibrations.CalibrationWatcher import CalibrationWatcher
+from image_management.ApplicationController import SharedConfig, DerivedConfigValue
+from image_management.ImageTransformerBase import ImageTransformerBase
 from image_management.ImageTransformerDepth import ImageTransformerDepth
 from interfaces.PrincipalApplicationInterface import instantiate_principal_application_interface
 from interfaces.SelectorScreenInterface import selector_screens
 from kinect_controller.KinectController import KinectController
-from literals import KinectFrames, ConfigControllerEnum, CONTOURS_EPSILON_FACTOR, CONTOURS_MIN_AREA
+from literals import KinectFrames, ConfigControllerEnum, CONTOURS_EPSILON_FACTOR, CONTOURS_MIN_AREA, \
+    CALIBRATION_WATCH_SECONDS, PREVIEW_SIZE, PREVIEW_PUBLISH_SECONDS
+from performance.PipelineMetrics import pipeline_metrics
+from performance.SamplingProfiler import add_profile_arguments, start_profiler
+from performance.StageInstrumentation import instrumentation, register_image_pipeline
 
 
 def get_args():
@@ -22,6 +29,15 @@ def get_args():
 
     parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
                         type=int, required=False, default=logging.INFO)
+    add_profile_arguments(parser)
+    parser.add_argument('--shadow', help='Run this registered equivalence case in shadow mode over live frames',
+                        type=str, required=False, default=None)
+    parser.add_argument('--shadow-every', help='Compare one of every N frames in shadow mode',
+                        type=int, required=False, default=10)
+    parser.add_argument('--watch-calibrations', help='Seconds between calibration file checks (0 disables reloads)',
+                        type=float, required=False, default=CALIBRATION_WATCH_SECONDS)
+    parser.add_argument('--instrument', help='Enable per-stage timing instrumentation from startup',
+                        action='store_true', required=False, default=False)
 
     args, unknown = parser.parse_known_args()
     return args
@@ -42,123 +58,192 @@ def calculate_smoothed_contours(image, config_values):
     return smooth_contours
 
 
-def projector_application(projector_screen, kinect, config: SharedConfig):
-    previous_min_depth = config.get_value(ConfigControllerEnum.MIN_DEPTH.name)
-    previous_max_depth = config.get_value(ConfigControllerEnum.MAX_DEPTH.name)
+def process_depth_frame(depth_image, previous_depth, config_values, depth_calibration=None, colormap_lut=None):
+    # REMOVE ERRORS IN IMAGE
+    depth_image_no_zeros = ImageTransformerDepth.remove_zeros(image=depth_image)
+
+    # COMBINE WITH PREVIOUS IMAGE DATA OUT OF THE SANDBOX RANGE (MIN AND MAX DEPTH)
+    last_depth_image, mask_with_neighbors = ImageTransformerDepth.remove_data_between_distance_neighbors(
+        image=depth_image_no_zeros,
+        min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
+        max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name],
+        other_image=previous_depth, iterations=30)
+
+    # REMOVE NOISE (CHANGES < 5 MM)
+    condition = (mask_with_neighbors == 0) & (np.abs(last_depth_image - previous_depth) < config_values[
+        ConfigControllerEnum.ERRORS_UMBRAL.name])
+    value = previous_depth
+    depth_image_no_errors = ImageTransformerDepth.apply_mask(image=last_depth_image, condition=condition,
+                                                             value=value)
+
+    # COMBINE MEDIUM NOISE (CHANGES BETWEEN 5MM AND 15MM) --> 10% ACTUAL, 90% PREVIOUS
+    condition = (
+            (mask_with_neighbors == 0) &
+            (config_values[ConfigControllerEnum.ERRORS_UMBRAL.name] <= np.abs(
+                depth_image_no_errors - previous_depth)) &
+            (np.abs(depth_image_no_errors - previous_depth) <= config_values[
+                ConfigControllerEnum.MEDIUM_NOISE.name])
+    )
+    value = previous_depth * 0.9 + depth_image_no_errors * 0.1
+    depth_image_no_noise = ImageTransformerDepth.apply_mask(image=depth_image_no_errors,
+                                                            condition=condition,
+                                                            value=value)
+
+    # REMOVE BIG NOISE (CHANGES BETWEEN 15MM AND 30MM) --> 50% ACTUAL, 50% PREVIOUS
+    condition = (
+            (mask_with_neighbors == 0) &
+            (config_values[ConfigControllerEnum.MEDIUM_NOISE.name] <= np.abs(
+                depth_image_no_noise - previous_depth)) &
+            (np.abs(depth_image_no_noise - previous_depth) <= config_values[
+                ConfigControllerEnum.BIG_NOISE.name])
+    )
+    value = previous_depth * 0.5 + depth_image_no_noise * 0.5
+    last_depth_image = ImageTransformerDepth.apply_mask(image=depth_image_no_noise, condition=condition,
+                                                        value=value)
+
+    # SAVE PREVIOUS IMAGE
+    previous_depth = ImageTransformerDepth.duplicate(image=last_depth_image)
+
+    # APPLY CAMERA FOCUS
+    depth_image_transformed = last_depth_image
+    if depth_calibration is not None:
+        depth_image_transformed = depth_calibration.applied_camera_focus(image=last_depth_image)
+
+    # NORMALIZE IMAGE
+    depth_image_normalized = ImageTransformerDepth.normalize_between_distance(image=depth_image_transformed,
+                                                                              min_depth=config_values[
+                                                                                  ConfigControllerEnum.MIN_DEPTH.name],
+                                                                              max_depth=config_values[
+                                                                                  ConfigControllerEnum.MAX_DEPTH.name])
+
+    # TRANSFORM IMAGE TO UINT8
+    depth_image_uint8 = ImageTransformerDepth.transform_dtype(image=depth_image_normalized, dtype=np.uint8)
+
+    # BLURRED IMAGE FOR CALCULATIONS
+    depth_image_blurred = ImageTransformerDepth.degaussing(image=depth_image_uint8, ksize=(11, 11), sigma_x=0)
+
+    # CONTOURS (LEVEL LINES)
+    smoothed_contours = calculate_smoothed_contours(image=depth_image_blurred, config_values=config_values)
+
+    # GENERATE COLOR IMAGE (INVERT + APPLY COLORMAP)
+    depth_image_uint8_inverted = ImageTransformerDepth.invert(image=depth_image_uint8)
+    colormap = colormap_lut if colormap_lut is not None else config_values[ConfigControllerEnum.COLORMAP.name]
+    colormap_image = ImageTransformerDepth.apply_colormap(image=depth_image_uint8_inverted, colormap=colormap)
+
+    # DRAW INFORMATION IN COLORMAP IMAGE
+    colormap_with_contours = ImageTransformerDepth.draw_contours(image=colormap_image, thickness=1,
+                                                                 contours=smoothed_contours, color=(0, 0, 0))
+
+    final_image = colormap_with_contours
+    return final_image, previous_depth
+
+
+def watch_calibrations(projector_screen, kinect, config: SharedConfig, interval):
+    calibration_watcher = CalibrationWatcher(interval=interval)
+
+    def apply_depth_calibration(new_calibration):
+        kinect.kinect_calibrations[KinectFrames.DEPTH.name] = new_calibration
+        min_depth, max_depth = new_calibration.get_depth()
+        config.update(MIN_DEPTH=min_depth, MAX_DEPTH=max_depth)
+
+    def apply_color_calibration(new_calibration):
+        kinect.kinect_calibrations[KinectFrames.COLOR.name] = new_calibration
+
+    def apply_projector_calibration(new_calibration):
+        projector_screen.calibration = new_calibration
+
+    calibration_watcher.watch(name=KinectFrames.DEPTH.name,
+                              calibration=kinect.kinect_calibrations[KinectFrames.DEPTH.name],
+                              apply_calibration=apply_depth_calibration)
+    calibration_watcher.watch(name=KinectFrames.COLOR.name,
+                              calibration=kinect.kinect_calibrations[KinectFrames.COLOR.name],
+                              apply_calibration=apply_color_calibration)
+    if projector_screen.calibration is not None:
+        calibration_watcher.watch(name="PROJECTOR", calibration=projector_screen.calibration,
+                                  apply_calibration=apply_projector_calibration)
+    calibration_watcher.start()
+    return calibration_watcher
+
+
+def generate_preview(image, preview_size=PREVIEW_SIZE):
+    # Downscale first (INTER_AREA), then convert only the small image to RGB for Tk
+    preview = ImageTransformerBase.resize(image=image, width=preview_size[0], height=preview_size[1])
+    if len(preview.shape) == 2:
+        return ImageTransformerBase.change_color(image=preview, color=cv2.COLOR_GRAY2RGB)
+    return ImageTransformerBase.change_color(image=preview, color=cv2.COLOR_BGR2RGB)
+
+
+def projector_application(projector_screen, kinect, config: SharedConfig, shadow=None, calibration_watcher=None):
+    config_values = config.get_values()
+    config_version = config_values.version
+    colormap_lut = DerivedConfigValue(keys=[ConfigControllerEnum.COLORMAP.name],
+                                      build=lambda snapshot: ImageTransformerBase.generate_colormap_lut(
+                                          colormap=snapshot[ConfigControllerEnum.COLORMAP.name]))
 
     # GET FIRST DEPHT IMAGE FOR COMBINED IMAGES IN PROCESS
     depth_image = kinect.get_image_calibrate(kinect_frame=KinectFrames.DEPTH, avoid_camera_focus=True)
     depth_image_without_zeros = ImageTransformerDepth.remove_zeros(image=depth_image)
-    depth_image_set_distance_datas = ImageTransformerDepth.set_data_between_distance(image=depth_image_without_zeros,
-                                                                                     min_depth=previous_min_depth,
-                                                                                     max_depth=previous_max_depth)
+    depth_image_set_distance_datas = ImageTransformerDepth.set_data_between_distance(
+        image=depth_image_without_zeros, min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
+        max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name])
 
     previous_depth = depth_image_set_distance_datas
 
     # CREATE WINDOW SCREEN
     projector_screen.create_window_calibrate(window_name="Projector Window", image=previous_depth, fullscreen=True)
+    last_preview_time = 0
     while projector_screen.check_if_window_active(window_name="Projector Window"):
+        # SWAP RELOADED CALIBRATIONS BETWEEN FRAMES
+        if calibration_watcher is not None:
+            if config.consume_calibration_reload():
+                calibration_watcher.request_reload()
+            calibration_watcher.swap_pending()
+
+        frame_start = time.perf_counter()
         depth_image = kinect.get_image_calibrate(kinect_frame=KinectFrames.DEPTH, avoid_camera_focus=True)
         if depth_image is not None:
+            stage_ms = {"kinect_depth": (time.perf_counter() - frame_start) * 1000}
             config_values = config.get_values()
 
+            # ONLY LOOK AT THE KEYS CHANGED SINCE THE LAST FRAME
+            changed_keys = config_values.changed_since(config_version)
+            config_version = config_values.version
             if (config_values[ConfigControllerEnum.RESET_IMAGE.name] or
-                    (previous_min_depth != config_values[ConfigControllerEnum.MIN_DEPTH.name] or
-                     previous_max_depth != config_values[ConfigControllerEnum.MAX_DEPTH.name])):
+                    changed_keys & {ConfigControllerEnum.MIN_DEPTH.name, ConfigControllerEnum.MAX_DEPTH.name}):
                 depth_image_set_distance_datas = ImageTransformerDepth.set_data_between_distance(
                     image=depth_image_without_zeros,
                     min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
                     max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name])
 
                 previous_depth = depth_image_set_distance_datas
-                previous_min_depth = config_values[ConfigControllerEnum.MIN_DEPTH.name]
-                previous_max_depth = config_values[ConfigControllerEnum.MAX_DEPTH.name]
                 config.set_value(key=ConfigControllerEnum.RESET_IMAGE.name, value=False)
 
-            # REMOVE ERRORS IN IMAGE
-            depth_image_no_zeros = ImageTransformerDepth.remove_zeros(image=depth_image)
-
-            # COMBINE WITH PREVIOUS IMAGE DATA OUT OF THE SANDBOX RANGE (MIN AND MAX DEPTH)
-            last_depth_image, mask_with_neighbors = ImageTransformerDepth.remove_data_between_distance_neighbors(
-                image=depth_image_no_zeros,
-                min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
-                max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name],
-                other_image=previous_depth, iterations=30)
-
-            # REMOVE NOISE (CHANGES < 5 MM)
-            condition = (mask_with_neighbors == 0) & (np.abs(last_depth_image - previous_depth) < config_values[
-                ConfigControllerEnum.ERRORS_UMBRAL.name])
-            value = previous_depth
-            depth_image_no_errors = ImageTransformerDepth.apply_mask(image=last_depth_image, condition=condition,
-                                                                     value=value)
-
-            # COMBINE MEDIUM NOISE (CHANGES BETWEEN 5MM AND 15MM) --> 10% ACTUAL, 90% PREVIOUS
-            condition = (
-                    (mask_with_neighbors == 0) &
-                    (config_values[ConfigControllerEnum.ERRORS_UMBRAL.name] <= np.abs(
-                        depth_image_no_errors - previous_depth)) &
-                    (np.abs(depth_image_no_errors - previous_depth) <= config_values[
-                        ConfigControllerEnum.MEDIUM_NOISE.name])
-            )
-            value = previous_depth * 0.9 + depth_image_no_errors * 0.1
-            depth_image_no_noise = ImageTransformerDepth.apply_mask(image=depth_image_no_errors,
-                                                                    condition=condition,
-                                                                    value=value)
-
-            # REMOVE BIG NOISE (CHANGES BETWEEN 15MM AND 30MM) --> 50% ACTUAL, 50% PREVIOUS
-            condition = (
-                    (mask_with_neighbors == 0) &
-                    (config_values[ConfigControllerEnum.MEDIUM_NOISE.name] <= np.abs(
-                        depth_image_no_noise - previous_depth)) &
-                    (np.abs(depth_image_no_noise - previous_depth) <= config_values[
-                        ConfigControllerEnum.BIG_NOISE.name])
-            )
-            value = previous_depth * 0.5 + depth_image_no_noise * 0.5
-            last_depth_image = ImageTransformerDepth.apply_mask(image=depth_image_no_noise, condition=condition,
-                                                                value=value)
-
-            # SAVE PREVIOUS IMAGE
-            previous_depth = ImageTransformerDepth.duplicate(image=last_depth_image)
-
-            # APPLY CAMERA FOCUS
-            depth_image_transformed = kinect.apply_camera_focus(kinect_frame=KinectFrames.DEPTH,
-                                                                image=last_depth_image)
-
-            # NORMALIZE IMAGE
-            depth_image_normalized = ImageTransformerDepth.normalize_between_distance(image=depth_image_transformed,
-                                                                                      min_depth=config_values[
-                                                                                          ConfigControllerEnum.MIN_DEPTH.name],
-                                                                                      max_depth=config_values[
-                                                                                          ConfigControllerEnum.MAX_DEPTH.name])
-
-            # TRANSFORM IMAGE TO UINT8
-            depth_image_uint8 = ImageTransformerDepth.transform_dtype(image=depth_image_normalized, dtype=np.uint8)
-
-            # BLURRED IMAGE FOR CALCULATIONS
-            depth_image_blurred = ImageTransformerDepth.degaussing(image=depth_image_uint8, ksize=(11, 11), sigma_x=0)
-
-            # CONTOURS (LEVEL LINES)
-            smoothed_contours = calculate_smoothed_contours(image=depth_image_blurred, config_values=config_values)
-
-            # GENERATE COLOR IMAGE (INVERT + APPLY COLORMAP)
-            depth_image_uint8_inverted = ImageTransformerDepth.invert(image=depth_image_uint8)
-            colormap_image = ImageTransformerDepth.apply_colormap(image=depth_image_uint8_inverted,
-                                                                  colormap=config_values[
-                                                                      ConfigControllerEnum.COLORMAP.name])
-
-            # DRAW INFORMATION IN COLORMAP IMAGE
-            colormap_with_contours = ImageTransformerDepth.draw_contours(image=colormap_image, thickness=1,
-                                                                         contours=smoothed_contours, color=(0, 0, 0))
+            if shadow is not None:
+                shadow.submit(depth_image=depth_image, previous_depth=previous_depth, config_values=config_values)
+
+            stage_start = time.perf_counter()
+            final_image, previous_depth = process_depth_frame(
+                depth_image=depth_image, previous_depth=previous_depth, config_values=config_values,
+                depth_calibration=kinect.kinect_calibrations.get(KinectFrames.DEPTH.name),
+                colormap_lut=colormap_lut.get(config_values))
+            stage_ms["process_depth"] = (time.perf_counter() - stage_start) * 1000
 
             # UPDATE IMAGE PROJECTED
-            final_image = colormap_with_contours
+            stage_start = time.perf_counter()
             projector_screen.update_window_image_calibrate(window_name="Projector Window", image=final_image)
+            stage_ms["projector_show"] = (time.perf_counter() - stage_start) * 1000
 
-            rgb_image = kinect.get_image_calibrate(kinect_frame=KinectFrames.COLOR)
-            with config.lock:
-                config.current_image = final_image
-                if rgb_image is not None:
-                    config.second_image = rgb_image
+            # PUBLISH PREVIEWS FOR THE CONFIGURATION INTERFACE (THE COLOR FRAME IS ONLY READ FOR THEM)
+            if time.perf_counter() - last_preview_time >= PREVIEW_PUBLISH_SECONDS:
+                last_preview_time = stage_start = time.perf_counter()
+                rgb_image = kinect.get_image_calibrate(kinect_frame=KinectFrames.COLOR)
+                config.set_previews(current_preview=generate_preview(image=final_image),
+                                    second_preview=generate_preview(image=rgb_image) if rgb_image is not None else None)
+                stage_ms["previews"] = (time.perf_counter() - stage_start) * 1000
+
+            stage_ms["frame"] = (time.perf_counter() - frame_start) * 1000
+            pipeline_metrics.record_frame(stage_ms=stage_ms,
+                                          frame_arrival=kinect.last_frame_arrivals.get(KinectFrames.DEPTH.name))
 
 
 def main():
@@ -170,12 +255,25 @@ def main():
                         format='%(asctime)s %(levelname)-4s %(message)s',
                         datefmt='%H:%M:%S')
 
+    profiler = start_profiler(args=args, program_name="app")
+
+    # Register instrumented stages (only wrapped while enabled)
+    register_image_pipeline()
+    if args.instrument:
+        instrumentation.enable()
+
     # Initialize Kinect, Principal Screen and Projector Screen
+    kinect = None
     try:
+        # Sensor warm-up and calibration loading run while the screens are selected
+        kinect = KinectController(kinect_frames=[KinectFrames.DEPTH, KinectFrames.COLOR], wait_ready=False)
         principal_screen, projector_screen = selector_screens()
-        kinect = KinectController(kinect_frames=[KinectFrames.DEPTH, KinectFrames.COLOR])
+        kinect.mark_startup("screens selected")
+        kinect.wait_until_ready()
     except Exception as error:
         logging.error(f"Error trying to instantiate screens/kinect: {error}")
+        if kinect is not None:
+            kinect.close()
         raise error
 
     # GENERATE SHARED CONFIG
@@ -184,13 +282,33 @@ def main():
     config.set_value(key=ConfigControllerEnum.MIN_DEPTH.name, value=min_depth)
     config.set_value(key=ConfigControllerEnum.MAX_DEPTH.name, value=max_depth)
 
-    projector_application_thread = threading.Thread(target=projector_application,
-                                                    args=(projector_screen, kinect, config))
+    shadow = None
+    if args.shadow:
+        from performance.equivalence_harness import create_shadow_comparator
+        shadow = create_shadow_comparator(case_name=args.shadow, every_frames=args.shadow_every)
+
+    calibration_watcher = None
+    if args.watch_calibrations > 0:
+        calibration_watcher = watch_calibrations(projector_screen=projector_screen, kinect=kinect, config=config,
+                                                 interval=args.watch_calibrations)
+
+    projector_application_thread = threading.Thread(target=projector_application, name="projector_application",
+                                                    args=(projector_screen, kinect, config, shadow,
+                                                          calibration_watcher))
     projector_application_thread.start()
 
     instantiate_principal_application_interface(config=config, principal_screen=principal_screen)
 
     projector_application_thread.join()
+    if calibration_watcher is not None:
+        calibration_watcher.stop()
+
+    if instrumentation.records:
+        instrumentation.log_summary()
+    if shadow is not None:
+        shadow.log_summary()
+    if profiler:
+        profiler.stop()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,10 @@
+import hashlib
+import json
 import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 import cv2
 import numpy as np
@@ -9,7 +14,9 @@ from literals import CAMERA_CALIBRATION_VARIABLE, CAMERA_DISTORTION_VARIABLE, CA
     CAMERA_TRANSLATION_VARIABLE, OBJ_POINTS_KEY, IMG_POINTS_KEY, FOCUS_HOMOGRAPHY_VARIABLE, \
     FOCUS_INV_HOMOGRAPHY_VARIABLE, FOCUS_CORDS_VARIABLE, FOCUS_CORDS_ORIGINAL_VARIABLE, \
     FOCUS_DIMENSION_ORIGINAL_VARIABLE, MIN_DEPTH_VARIABLE, MAX_DEPTH_VARIABLE, STANDARD_MIN_DEPTH, STANDARD_MAX_DEPTH, \
-    IMG_SHAPE_KEY
+    IMG_SHAPE_KEY, CALIBRATION_BUNDLE_VERSION, CALIBRATION_BUNDLE_SUFFIX, CALIBRATION_MANIFEST_FILENAME, \
+    UNDISTORT_MAPS_VARIABLE, UNDISTORT_FOCUS_MAPS_VARIABLE, HOMOGRAPHY_RANSAC_THRESHOLD, \
+    CALIBRATION_BUNDLE_LOCK_FILENAME, CALIBRATION_BUNDLE_LOCK_TIMEOUT
 from utils import generate_folders, ordering_points
 
 
@@ -39,6 +46,11 @@ class CalibrationClass:
         # FILES
         self.calibration_path_file = calibration_path_file
 
+        # DERIVED MAPS (remap tables built from the matrices, cached in memory and in the bundle)
+        self.derived_maps = {}
+        self.bundle_manifest = None
+        self.bundle_lock = threading.Lock()
+
     def set_calibrations(self, calibration):
         if CAMERA_CALIBRATION_VARIABLE in calibration.keys():
             self.camera_matrix = calibration[CAMERA_CALIBRATION_VARIABLE]
@@ -66,14 +78,19 @@ class CalibrationClass:
             self.min_depth = int(calibration[MIN_DEPTH_VARIABLE])
         if MAX_DEPTH_VARIABLE in calibration.keys():
             self.max_depth = int(calibration[MAX_DEPTH_VARIABLE])
+        self.derived_maps.clear()
 
     def read_calibration(self, calibration_path_file=None):
+        # Returns False when nothing could be loaded, the calibration keeps its previous values
         if calibration_path_file:
             self.calibration_path_file = calibration_path_file
 
         if not self.calibration_path_file:
             raise FileNotFoundError("Missing calibration path file to load")
 
+        if self.read_bundle():
+            return True
+
         if os.path.exists(self.calibration_path_file) and os.path.isfile(self.calibration_path_file):
             try:
                 calibration = np.load(self.calibration_path_file)
@@ -81,16 +98,15 @@ class CalibrationClass:
 
             except Exception as error:
                 logging.error(f"Kinect error loading file {self.calibration_path_file}: {error}")
-        else:
-            logging.warning("Not found any calibration files for Kinect, please calibrate camera.")
+                return False
 
-    def save_calibration(self, calibration_path_file=None):
-        if calibration_path_file:
-            self.calibration_path_file = calibration_path_file
+            # Readers never write the bundle (a calibration could be saving it), it is created on the next save
+            return True
 
-        if not self.calibration_path_file:
-            raise FileNotFoundError("Missing calibration path file to save")
+        logging.warning("Not found any calibration files for Kinect, please calibrate camera.")
+        return False
 
+    def get_calibration_arguments(self):
         arguments_saved = {}
 
         if self.camera_matrix is not None:
@@ -121,9 +137,346 @@ class CalibrationClass:
         if self.max_depth is not None:
             arguments_saved[MAX_DEPTH_VARIABLE] = self.max_depth
 
-        # Save calibrate file
+        return arguments_saved
+
+    def save_calibration(self, calibration_path_file=None):
+        if calibration_path_file:
+            self.calibration_path_file = calibration_path_file
+
+        if not self.calibration_path_file:
+            raise FileNotFoundError("Missing calibration path file to save")
+
+        # Save the bundle (manifest written last) and the calibrate file (npz kept for older versions)
         generate_folders(self.calibration_path_file)
-        np.savez(self.calibration_path_file, **arguments_saved)
+        self.save_bundle()
+        temporal_path = f"{self.calibration_path_file}.{os.getpid()}.tmp"
+        with open(temporal_path, "wb") as calibration_file:
+            np.savez(calibration_file, **self.get_calibration_arguments())
+        os.replace(temporal_path, self.calibration_path_file)
+
+    # region Calibration bundle
+    def get_bundle_path(self):
+        return os.path.splitext(self.calibration_path_file)[0] + CALIBRATION_BUNDLE_SUFFIX
+
+    def calculate_content_hash(self, arguments=None):
+        if arguments is None:
+            arguments = self.get_calibration_arguments()
+
+        content_hash = hashlib.sha1()
+        for key in sorted(arguments.keys()):
+            values = arguments[key] if isinstance(arguments[key], (list, tuple)) else [arguments[key]]
+            content_hash.update(key.encode())
+            for value in values:
+                value = np.ascontiguousarray(value)
+                content_hash.update(f"{value.dtype.str}{value.shape}".encode())
+                content_hash.update(value.tobytes())
+        return content_hash.hexdigest()
+
+    def save_bundle(self):
+        bundle_path = self.get_bundle_path()
+        arguments = self.get_calibration_arguments()
+
+        os.makedirs(bundle_path, exist_ok=True)
+        with self.bundle_lock, self._bundle_file_lock(bundle_path=bundle_path,
+                                                      timeout=CALIBRATION_BUNDLE_LOCK_TIMEOUT) as locked:
+            if not locked:
+                # Nobody holds a lock that long, left by a process that died while saving
+                logging.warning(f"Calibration bundle {bundle_path} lock expired, saving anyway")
+            content_hash = self.calculate_content_hash(arguments=arguments)
+            # Derived maps of the same matrices are still valid (re-saving a calibration loaded from the bundle)
+            disk_manifest = self._read_manifest(bundle_path=bundle_path)
+            previous_derived = dict(disk_manifest["derived"]) if disk_manifest is not None else {}
+            if self.bundle_manifest is not None:
+                previous_derived.update(self.bundle_manifest["derived"])
+            manifest = {
+                "version": CALIBRATION_BUNDLE_VERSION,
+                "content_hash": content_hash,
+                "arrays": {},
+                "derived": {key: entry for key, entry in previous_derived.items()
+                            if entry["source_hash"] == content_hash and
+                            all(os.path.isfile(os.path.join(bundle_path, file)) for file in entry["files"])}
+            }
+
+            for key, value in arguments.items():
+                if isinstance(value, (list, tuple)) or key == OBJ_POINTS_KEY:
+                    manifest["arrays"][key] = self._save_bundle_list(bundle_path=bundle_path, key=key, values=value)
+                else:
+                    manifest["arrays"][key] = {"file": self._save_bundle_array(bundle_path=bundle_path, key=key,
+                                                                               value=value)}
+
+            # Readers (and the calibration watcher) only see the new arrays once the manifest is replaced
+            self.bundle_manifest = manifest
+            self._write_manifest(bundle_path=bundle_path, manifest=manifest)
+            self._remove_unreferenced_files(bundle_path=bundle_path)
+            if not locked:
+                self._remove_stale_lock(bundle_path=bundle_path)
+
+        # Precompute the maps for the calibrated image size, startup then only maps them
+        if self.image_shape is not None:
+            image_size = (int(self.image_shape[1]), int(self.image_shape[0]))
+            if self.camera_matrix is not None and self.cof_distortion is not None:
+                self.get_derived_maps(name=UNDISTORT_MAPS_VARIABLE, image_size=image_size)
+            if self.camera_matrix is not None and self.cof_distortion is not None and \
+                    self.matrix_homography is not None:
+                self.get_derived_maps(name=UNDISTORT_FOCUS_MAPS_VARIABLE, image_size=image_size)
+
+    @staticmethod
+    def _save_bundle_array(bundle_path, key, value):
+        # File named after its content: a file already on disk (maybe memory mapped by a reader) is never rewritten
+        value = np.asarray(value)
+        array_hash = hashlib.sha1(f"{value.dtype.str}{value.shape}".encode())
+        array_hash.update(value.tobytes())
+        file_name = f"{key}.{array_hash.hexdigest()[:16]}.npy"
+
+        file_path = os.path.join(bundle_path, file_name)
+        if not os.path.isfile(file_path):
+            temporal_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(temporal_path, "wb") as array_file:
+                np.save(array_file, value)
+            os.replace(temporal_path, file_path)
+        return file_name
+
+    @staticmethod
+    @contextmanager
+    def _bundle_file_lock(bundle_path, timeout):
+        # Lock file shared by every process using the bundle, bundle_lock only covers the threads of this one.
+        # Yields False when it could not be taken before the timeout
+        lock_path = os.path.join(bundle_path, CALIBRATION_BUNDLE_LOCK_FILENAME)
+        deadline = time.perf_counter() + timeout
+        lock_file = None
+        while lock_file is None:
+            try:
+                lock_file = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if time.perf_counter() >= deadline:
+                    break
+                time.sleep(0.01)
+
+        try:
+            yield lock_file is not None
+        finally:
+            if lock_file is not None:
+                os.close(lock_file)
+                os.remove(lock_path)
+
+    @staticmethod
+    def _remove_stale_lock(bundle_path):
+        try:
+            os.remove(os.path.join(bundle_path, CALIBRATION_BUNDLE_LOCK_FILENAME))
+        except OSError as error:
+            logging.debug(f"Cannot remove calibration bundle lock in {bundle_path}: {error}")
+
+    @staticmethod
+    def _read_manifest(bundle_path):
+        try:
+            with open(os.path.join(bundle_path, CALIBRATION_MANIFEST_FILENAME), encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_unreferenced_files(self, bundle_path):
+        referenced = set()
+        for entry in list(self.bundle_manifest["arrays"].values()) + list(self.bundle_manifest["derived"].values()):
+            referenced.update(entry.get("files", []))
+            referenced.update(entry[key] for key in ("file", "index") if key in entry)
+
+        for file_name in os.listdir(bundle_path):
+            if not file_name.endswith(".npy") or file_name in referenced:
+                continue
+            try:
+                os.remove(os.path.join(bundle_path, file_name))
+            except OSError as error:
+                # Still memory mapped by a reader (Windows), removed on a later save
+                logging.debug(f"Cannot remove old calibration bundle file {file_name}: {error}")
+
+    @staticmethod
+    def _save_bundle_list(bundle_path, key, values):
+        # Repeated items (obj_points is the same board for every view) are stored once plus an index per view
+        unique_values = []
+        index = []
+        for value in values:
+            value = np.asarray(value)
+            for unique_index, unique_value in enumerate(unique_values):
+                if unique_value.shape == value.shape and unique_value.dtype == value.dtype and \
+                        np.array_equal(unique_value, value):
+                    index.append(unique_index)
+                    break
+            else:
+                index.append(len(unique_values))
+                unique_values.append(value)
+
+        entry = {"index": CalibrationClass._save_bundle_array(bundle_path=bundle_path, key=f"{key}_index",
+                                                              value=np.array(index, dtype=np.int32))}
+        if unique_values and all(value.shape == unique_values[0].shape and value.dtype == unique_values[0].dtype
+                                 for value in unique_values):
+            entry["file"] = CalibrationClass._save_bundle_array(bundle_path=bundle_path, key=key,
+                                                                value=np.stack(unique_values))
+        else:
+            entry["files"] = [CalibrationClass._save_bundle_array(bundle_path=bundle_path, key=f"{key}_{unique_index}",
+                                                                  value=value)
+                              for unique_index, value in enumerate(unique_values)]
+        return entry
+
+    @staticmethod
+    def _write_manifest(bundle_path, manifest):
+        manifest_path = os.path.join(bundle_path, CALIBRATION_MANIFEST_FILENAME)
+        temporal_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temporal_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporal_path, manifest_path)
+
+    def read_bundle(self):
+        bundle_path = self.get_bundle_path()
+        manifest_path = os.path.join(bundle_path, CALIBRATION_MANIFEST_FILENAME)
+        if not os.path.isfile(manifest_path):
+            return False
+
+        try:
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("version") != CALIBRATION_BUNDLE_VERSION:
+                logging.warning(f"Calibration bundle {bundle_path} has version {manifest.get('version')}, "
+                                f"expected {CALIBRATION_BUNDLE_VERSION}")
+                return False
+
+            calibration = {}
+            for key, entry in manifest["arrays"].items():
+                if "index" not in entry:
+                    calibration[key] = np.load(os.path.join(bundle_path, entry["file"]), mmap_mode="r")
+                    continue
+                index = np.load(os.path.join(bundle_path, entry["index"]))
+                if "file" in entry:
+                    unique_values = np.load(os.path.join(bundle_path, entry["file"]), mmap_mode="r")
+                else:
+                    unique_values = [np.load(os.path.join(bundle_path, file), mmap_mode="r")
+                                     for file in entry["files"]]
+                calibration[key] = [unique_values[unique_index] for unique_index in index]
+        except Exception as error:
+            logging.error(f"Error loading calibration bundle {bundle_path}: {error}")
+            return False
+
+        self.set_calibrations(calibration=calibration)
+
+        if self.calculate_content_hash() != manifest["content_hash"]:
+            logging.warning(f"Calibration bundle {bundle_path} does not match its content hash, "
+                            f"derived maps will be rebuilt")
+            manifest["content_hash"] = self.calculate_content_hash()
+        self.bundle_manifest = manifest
+        return True
+
+    def get_derived_maps(self, name, image_size):
+        key = f"{name}_{image_size[0]}x{image_size[1]}"
+        derived_maps = self.derived_maps.get(key)
+        if derived_maps is not None:
+            return derived_maps
+
+        # Maps are only valid for the matrices they were built from
+        content_hash = self.calculate_content_hash()
+        derived_maps = self._load_derived_maps(key=key, content_hash=content_hash)
+        if derived_maps is None:
+            builders = {
+                UNDISTORT_MAPS_VARIABLE: self.build_undistort_maps,
+                UNDISTORT_FOCUS_MAPS_VARIABLE: self.build_undistort_focus_maps
+            }
+            derived_maps = builders[name](image_size=image_size)
+            self._save_derived_maps(key=key, image_size=image_size, derived_maps=derived_maps,
+                                    content_hash=content_hash)
+
+        self.derived_maps[key] = derived_maps
+        return derived_maps
+
+    def _load_derived_maps(self, key, content_hash):
+        if self.bundle_manifest is None:
+            return None
+
+        entry = self.bundle_manifest["derived"].get(key)
+        if entry is None or entry["source_hash"] != content_hash:
+            return None
+
+        bundle_path = self.get_bundle_path()
+        try:
+            return tuple(np.load(os.path.join(bundle_path, file), mmap_mode="r") for file in entry["files"])
+        except Exception as error:
+            logging.warning(f"Cannot load derived maps {key} from {bundle_path}, rebuilding: {error}")
+            return None
+
+    def _save_derived_maps(self, key, image_size, derived_maps, content_hash):
+        # Only persisted while the bundle on disk holds the same matrices. Only the entry is added to the manifest
+        # read again from disk, a busy bundle (being saved by another process) is skipped, maps are just a cache
+        if self.bundle_manifest is None or self.bundle_manifest["content_hash"] != content_hash:
+            return
+
+        bundle_path = self.get_bundle_path()
+        try:
+            with self.bundle_lock, self._bundle_file_lock(bundle_path=bundle_path, timeout=0) as locked:
+                if not locked:
+                    logging.debug(f"Calibration bundle {bundle_path} busy, derived maps {key} not saved")
+                    return
+                manifest = self._read_manifest(bundle_path=bundle_path)
+                if manifest is None or manifest.get("content_hash") != content_hash:
+                    logging.debug(f"Calibration bundle {bundle_path} changed on disk, derived maps {key} not saved")
+                    return
+
+                files = [self._save_bundle_array(bundle_path=bundle_path, key=f"{key}_{map_index}", value=derived_map)
+                         for map_index, derived_map in enumerate(derived_maps)]
+                entry = {"files": files, "image_size": list(image_size), "source_hash": content_hash}
+                manifest["derived"][key] = entry
+                self._write_manifest(bundle_path=bundle_path, manifest=manifest)
+                self.bundle_manifest["derived"][key] = entry
+        except Exception as error:
+            logging.warning(f"Cannot save derived maps {key} in {bundle_path}: {error}")
+
+    def warm_derived_maps(self, calibration):
+        # Build the same maps the other calibration is using, before it is replaced by this one
+        for key in list(calibration.derived_maps.keys()):
+            name, image_size = key.rsplit("_", 1)
+            width, height = image_size.split("x")
+            if self.get_derived_maps_source(name=name):
+                self.get_derived_maps(name=name, image_size=(int(width), int(height)))
+
+    def get_derived_maps_source(self, name):
+        if name == UNDISTORT_MAPS_VARIABLE:
+            return self.camera_matrix is not None and self.cof_distortion is not None
+        return self.camera_matrix is not None and self.cof_distortion is not None and \
+            self.matrix_homography is not None
+
+    def get_file_signature(self):
+        # With a bundle only its manifest counts: it is replaced once every array is written, and derived map
+        # updates rewrite it keeping the content hash (not a new calibration). The npz is only used without bundle
+        if not self.calibration_path_file:
+            return None
+
+        manifest_path = os.path.join(self.get_bundle_path(), CALIBRATION_MANIFEST_FILENAME)
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, encoding="utf-8") as manifest_file:
+                    return "bundle", json.load(manifest_file).get("content_hash")
+            except (OSError, ValueError):
+                # Manifest being replaced right now, checked again on the next poll
+                return None
+
+        if os.path.isfile(self.calibration_path_file):
+            npz_stat = os.stat(self.calibration_path_file)
+            return "npz", (npz_stat.st_mtime_ns, npz_stat.st_size)
+        return None
+
+    def build_undistort_maps(self, image_size):
+        # Fixed point maps, same tables cv2.undistort builds on every call
+        return cv2.initUndistortRectifyMap(self.camera_matrix, self.cof_distortion, None, self.camera_matrix,
+                                           tuple(image_size), cv2.CV_16SC2)
+
+    def build_undistort_focus_maps(self, image_size):
+        # Undistort followed by the focus homography in one remap, source pixel = undistort_map(H^-1 * pixel)
+        map_x, map_y = cv2.initUndistortRectifyMap(self.camera_matrix, self.cof_distortion, None, self.camera_matrix,
+                                                   tuple(image_size), cv2.CV_32FC1)
+        homography = np.asarray(self.matrix_homography, dtype=np.float64)
+        map_x = cv2.warpPerspective(map_x, homography, tuple(image_size), flags=cv2.INTER_LINEAR,
+                                    borderMode=cv2.BORDER_CONSTANT, borderValue=-1)
+        map_y = cv2.warpPerspective(map_y, homography, tuple(image_size), flags=cv2.INTER_LINEAR,
+                                    borderMode=cv2.BORDER_CONSTANT, borderValue=-1)
+        return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    # endregion
 
     def calculate_inverse_homography(self, matrix_homography=None):
         if matrix_homography is not None:
@@ -137,10 +490,12 @@ class CalibrationClass:
 
         if success:
             self.matrix_inverse_homography = homography_inverse
+            self.derived_maps.clear()
         else:
             logging.error("Cannot calculate inverse homography, error matrix")
 
-    def calculate_homography(self, cords=None, original_cords=None):
+    def calculate_homography(self, cords=None, original_cords=None, method=cv2.RANSAC,
+                             reprojection_threshold=HOMOGRAPHY_RANSAC_THRESHOLD):
         if cords is not None:
             self.cords = cords
         if original_cords is not None:
@@ -155,13 +510,24 @@ class CalibrationClass:
         original_cords = np.array(self.original_cords, dtype=np.float32)
 
         cords_ordered = np.float32(ordering_points(original_cords, cords))
-        self.matrix_homography = cv2.getPerspectiveTransform(cords_ordered, original_cords)
+        if len(cords_ordered) == 4:
+            self.matrix_homography = cv2.getPerspectiveTransform(cords_ordered, original_cords)
+        else:
+            # Dense correspondences, robust fit discarding outliers (method: cv2.RANSAC, cv2.LMEDS or 0)
+            matrix_homography, inliers = cv2.findHomography(cords_ordered, original_cords, method,
+                                                            reprojection_threshold)
+            if matrix_homography is None:
+                logging.error(f"Cannot calculate homography from {len(cords_ordered)} points")
+                return
+            logging.info(f"Homography calculated with {int(np.sum(inliers))}/{len(cords_ordered)} inliers")
+            self.matrix_homography = matrix_homography
         self.calculate_inverse_homography()
 
     def applied_camera_calibration(self, image):
         if self.camera_matrix is not None and self.cof_distortion is not None:
-            return ImageTransformerBase.distort(image=image, camera_matrix=self.camera_matrix,
-                                                distortion_coefficients=self.cof_distortion)
+            width, height = ImageTransformerBase.get_image_width_and_height(image=image)
+            map_1, map_2 = self.get_derived_maps(name=UNDISTORT_MAPS_VARIABLE, image_size=(width, height))
+            return ImageTransformerBase.remap(image=image, map_1=map_1, map_2=map_2)
         return image
 
     @staticmethod
@@ -175,6 +541,14 @@ class CalibrationClass:
     def applied_camera_focus(self, image, output_size=None):
         return self._applied_camera_matrix(image=image, matrix=self.matrix_homography, output_size=output_size)
 
+    def applied_camera_calibration_and_focus(self, image):
+        if self.camera_matrix is None or self.cof_distortion is None or self.matrix_homography is None:
+            return self.applied_camera_focus(image=self.applied_camera_calibration(image=image))
+
+        width, height = ImageTransformerBase.get_image_width_and_height(image=image)
+        map_1, map_2 = self.get_derived_maps(name=UNDISTORT_FOCUS_MAPS_VARIABLE, image_size=(width, height))
+        return ImageTransformerBase.remap(image=image, map_1=map_1, map_2=map_2)
+
     def applied_inverse_camera_focus(self, image, output_size=None):
         return self._applied_camera_matrix(image=image, matrix=self.matrix_inverse_homography, output_size=output_size)
 
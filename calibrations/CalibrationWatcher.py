@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+
+from calibrations.CalibrationFile import CalibrationClass
+from literals import CALIBRATION_WATCH_SECONDS
+
+
+class CalibrationWatcher(threading.Thread):
+    """
+    Polls the calibration files and builds the new CalibrationClass (and its remap tables) in this thread. The
+    projector loop calls swap_pending() between frames, so a recalibration never stalls the projection.
+    """
+
+    def __init__(self, interval=CALIBRATION_WATCH_SECONDS):
+        super(CalibrationWatcher, self).__init__(name="calibration_watcher", daemon=True)
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.wake_up = threading.Event()
+        self.watched = {}
+        self.signatures = {}
+        self.pending = {}
+        self.reload_requested = set()
+        self.stopped = False
+
+    def watch(self, name, calibration: CalibrationClass, apply_calibration):
+        # apply_calibration(new_calibration) is called from swap_pending, in the thread that owns the calibration
+        with self.lock:
+            self.watched[name] = (calibration, apply_calibration)
+            self.signatures[name] = calibration.get_file_signature()
+
+    def request_reload(self, name=None):
+        with self.lock:
+            self.reload_requested.update([name] if name else self.watched.keys())
+        self.wake_up.set()
+
+    def run(self):
+        while not self.stopped:
+            self.check_calibrations()
+            self.wake_up.wait(self.interval)
+            self.wake_up.clear()
+
+    def check_calibrations(self):
+        with self.lock:
+            watched = dict(self.watched)
+            reload_requested = set(self.reload_requested)
+            self.reload_requested.clear()
+
+        for name, (calibration, _) in watched.items():
+            signature = calibration.get_file_signature()
+            if name not in reload_requested and signature in (None, self.signatures.get(name)):
+                continue
+
+            start = time.perf_counter()
+            try:
+                new_calibration = CalibrationClass(calibration_path_file=calibration.calibration_path_file)
+                if not new_calibration.read_calibration():
+                    raise ValueError("calibration files cannot be read")
+                self.check_calibration(calibration=calibration, new_calibration=new_calibration)
+                new_calibration.warm_derived_maps(calibration=calibration)
+            except Exception as error:
+                # Keep the current calibration, the signature is not updated so the next poll tries again
+                logging.error(f"Cannot reload calibration {name}, keeping the current one: {error}")
+                continue
+
+            with self.lock:
+                self.signatures[name] = signature
+                self.pending[name] = new_calibration
+            logging.info(f"Calibration {name} reloaded in {(time.perf_counter() - start) * 1000:.1f} ms, "
+                         f"waiting for the next frame to apply it")
+
+    @staticmethod
+    def check_calibration(calibration, new_calibration):
+        # A reload never drops the matrices the projection is using (half written or empty files)
+        missing = [key for key in calibration.get_calibration_arguments().keys()
+                   if key not in new_calibration.get_calibration_arguments().keys()]
+        if missing:
+            raise ValueError(f"new calibration is missing {missing}")
+
+    def swap_pending(self):
+        with self.lock:
+            if not self.pending:
+                return []
+            pending = self.pending
+            self.pending = {}
+
+            swapped = []
+            for name, new_calibration in pending.items():
+                calibration, apply_calibration = self.watched[name]
+                apply_calibration(new_calibration)
+                self.watched[name] = (new_calibration, apply_calibration)
+                swapped.append(name)
+
+        logging.info(f"Calibrations swapped: {swapped}")
+        return swapped
+
+    def stop(self):
+        self.stopped = True
+        self.wake_up.set()
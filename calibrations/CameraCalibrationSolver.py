@@ -0,0 +1,150 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from literals import CALIBRATION_MAX_VIEWS, CALIBRATION_COVERAGE_GRID
+
+CALIBRATION_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 120, 0.001)
+
+
+# region View selection
+def get_view_features(img_points, image_size):
+    # Pose descriptors available before calibrating: board position, size, rotation and perspective in the image
+    width, height = image_size
+    corners = np.asarray(img_points, dtype=np.float32).reshape(-1, 2)
+    hull = cv2.convexHull(corners)
+    rect = cv2.minAreaRect(corners)
+
+    side_lengths = np.linalg.norm(np.roll(hull.reshape(-1, 2), -1, axis=0) - hull.reshape(-1, 2), axis=1)
+    return np.array([
+        corners[:, 0].mean() / width,
+        corners[:, 1].mean() / height,
+        np.sqrt(cv2.contourArea(hull) / (width * height)),
+        np.sin(np.deg2rad(rect[2]) * 2),
+        np.cos(np.deg2rad(rect[2]) * 2),
+        np.std(side_lengths) / max(np.mean(side_lengths), 1e-6)
+    ], dtype=np.float64)
+
+
+def get_view_coverage(img_points, image_size, grid=CALIBRATION_COVERAGE_GRID):
+    width, height = image_size
+    corners = np.asarray(img_points, dtype=np.float32).reshape(-1, 2)
+    cells_x = np.clip((corners[:, 0] / width * grid[0]).astype(int), 0, grid[0] - 1)
+    cells_y = np.clip((corners[:, 1] / height * grid[1]).astype(int), 0, grid[1] - 1)
+    return set(zip(cells_x.tolist(), cells_y.tolist()))
+
+
+def select_views(img_points, image_size, max_views=CALIBRATION_MAX_VIEWS):
+    # Greedy: each step takes the view adding most uncovered image cells plus pose distance to the chosen views
+    if max_views is None or len(img_points) <= max_views:
+        return list(range(len(img_points)))
+
+    features = np.array([get_view_features(points, image_size) for points in img_points])
+    coverages = [get_view_coverage(points, image_size) for points in img_points]
+    total_cells = CALIBRATION_COVERAGE_GRID[0] * CALIBRATION_COVERAGE_GRID[1]
+
+    selected = [int(np.argmax(features[:, 2]))]
+    covered = set(coverages[selected[0]])
+    min_distances = np.linalg.norm(features - features[selected[0]], axis=1)
+    while len(selected) < max_views:
+        scores = np.array([len(coverages[index] - covered) / total_cells for index in range(len(img_points))])
+        scores += min_distances
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+
+        selected.append(best)
+        covered |= coverages[best]
+        min_distances = np.minimum(min_distances, np.linalg.norm(features - features[best], axis=1))
+
+    return sorted(selected)
+
+
+# endregion
+
+def calculate_view_errors(obj_points, img_points, camera_matrix, dist_coefs, rvecs, tvecs):
+    errors = []
+    for view_obj_points, view_img_points, rvec, tvec in zip(obj_points, img_points, rvecs, tvecs):
+        projected, _ = cv2.projectPoints(view_obj_points, rvec, tvec, camera_matrix, dist_coefs)
+        difference = projected.reshape(-1, 2) - np.asarray(view_img_points).reshape(-1, 2)
+        errors.append(float(np.sqrt(np.mean(np.sum(difference ** 2, axis=1)))))
+    return errors
+
+
+def solve_camera_calibration(obj_points, img_points, image_size, max_views=CALIBRATION_MAX_VIEWS,
+                             criteria=CALIBRATION_CRITERIA, flags=0):
+    # Runs in a worker process. Solves with the selected views, the rest only get their pose (solvePnP)
+    start = time.perf_counter()
+    selected = select_views(img_points=img_points, image_size=image_size, max_views=max_views)
+
+    rms, camera_matrix, dist_coefs, selected_rvecs, selected_tvecs = cv2.calibrateCamera(
+        [obj_points[index] for index in selected], [img_points[index] for index in selected], image_size, None, None,
+        criteria=criteria, flags=flags)
+
+    rvecs, tvecs = [], []
+    selected_poses = dict(zip(selected, zip(selected_rvecs, selected_tvecs)))
+    for index, (view_obj_points, view_img_points) in enumerate(zip(obj_points, img_points)):
+        if index in selected_poses:
+            rvec, tvec = selected_poses[index]
+        else:
+            _, rvec, tvec = cv2.solvePnP(view_obj_points, np.asarray(view_img_points, dtype=np.float32),
+                                         camera_matrix, dist_coefs)
+        rvecs.append(rvec)
+        tvecs.append(tvec)
+
+    return {
+        "rms": rms,
+        "camera_matrix": camera_matrix,
+        "dist_coefs": dist_coefs,
+        "rvecs": tuple(rvecs),
+        "tvecs": tuple(tvecs),
+        "selected_views": selected,
+        "view_errors": calculate_view_errors(obj_points=obj_points, img_points=img_points,
+                                             camera_matrix=camera_matrix, dist_coefs=dist_coefs, rvecs=rvecs,
+                                             tvecs=tvecs),
+        "solve_seconds": time.perf_counter() - start
+    }
+
+
+class CameraCalibrationSolver:
+    """
+    Calibrates every stream in its own process. Like PatternDetector, poll() is called from Tk after() callbacks.
+    """
+
+    def __init__(self, max_views=CALIBRATION_MAX_VIEWS, max_workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.max_views = max_views
+        self.futures = {}
+        self.results = {}
+        self.view_names = {}
+
+    def submit(self, stream, obj_points, img_points, image_size, view_names=None):
+        self.view_names[stream] = view_names
+        self.futures[stream] = self.executor.submit(solve_camera_calibration, obj_points, img_points,
+                                                    tuple(int(value) for value in image_size), self.max_views)
+
+    def poll(self):
+        for stream, future in list(self.futures.items()):
+            if not future.done():
+                continue
+            self.futures.pop(stream)
+            self.results[stream] = future.result()
+            self.log_result(stream=stream, result=self.results[stream], view_names=self.view_names[stream])
+        return not self.futures
+
+    @staticmethod
+    def log_result(stream, result, view_names=None):
+        view_names = view_names if view_names is not None else list(range(len(result["view_errors"])))
+        logging.info(f"Camera {stream} calibrated in {result['solve_seconds']:.2f} s with "
+                     f"{len(result['selected_views'])}/{len(result['view_errors'])} views, RMS {result['rms']:.3f} px")
+        for index, (view_name, error) in enumerate(zip(view_names, result["view_errors"])):
+            used = "used" if index in result["selected_views"] else "not used"
+            logging.info(f"    {stream} view {view_name}: reprojection error {error:.3f} px ({used})")
+
+    def shutdown(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=False)
@@ -3,6 +3,8 @@ import logging
 import os
 import sys
 
+from image_management.AsyncImageWriter import AsyncImageWriter
+from image_management.ImageMemoryBudget import ImageMemoryBudget
 from image_management.ImageObject import ImageObject
 from image_management.ImageTransformerDepth import ImageTransformerDepth
 from image_management.ImageTransformerIR import ImageTransformerIR
@@ -12,7 +14,8 @@ from interfaces.CalibrateKinectInterface import instantiate_calibrate_kinect_int
 from interfaces.SelectorScreenInterface import selector_screens
 from kinect_controller.KinectController import KinectController
 from literals import IMAGE_BASE_PATH, NOT_FOUND_IMAGE_NAME, IMAGE_KINECT_SAVE_PATH, CALIBRATE_PATTERN_IMAGES, \
-    KinectFrames
+    KinectFrames, PHOTO_THUMBNAIL_WIDTH, CALIBRATION_IMAGE_EXTENSIONS, CALIBRATION_IMAGE_LEGACY_EXTENSION
+from performance.SamplingProfiler import add_profile_arguments, start_profiler
 from utils import generate_relative_path
 
 
@@ -24,12 +27,18 @@ def get_args():
 
     parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
                         type=int, required=False, default=logging.INFO)
+    add_profile_arguments(parser)
 
     args, unknown = parser.parse_known_args()
     return args
 
 
-def load_kinect_images(path):
+def get_calibration_image_filename(image_name, type_image):
+    return f"{image_name}{CALIBRATION_IMAGE_EXTENSIONS[type_image]}"
+
+
+def load_kinect_images(path, memory_budget=None):
+    # Only headers are read here, pixels are loaded on access and kept under the memory budget
     previous_images = {}
     for type_image in CALIBRATE_PATTERN_IMAGES:
         tmp_kinect_image_path = generate_relative_path([path, type_image])
@@ -37,40 +46,59 @@ def load_kinect_images(path):
             logging.debug(f"Not found images in path: {tmp_kinect_image_path}")
             return previous_images
 
-        for image_file in os.listdir(tmp_kinect_image_path):
-            if image_file.endswith(".jpg"):
-                image_path = os.path.join(tmp_kinect_image_path, image_file)
-                if type_image == KinectFrames.DEPTH.name:
-                    image_obj = ImageObject(image_absolute_path=image_path, image_transform_class=ImageTransformerDepth)
-                elif type_image == KinectFrames.INFRARED.name:
-                    image_obj = ImageObject(image_absolute_path=image_path, image_transform_class=ImageTransformerIR)
-                else:
-                    image_obj = ImageObject(image_absolute_path=image_path, image_transform_class=ImageTransformerRGB)
-
-                if image_file not in previous_images.keys():
-                    previous_images[image_file] = {}
-                previous_images[image_file][type_image] = image_obj
+        for image_file in sorted(os.listdir(tmp_kinect_image_path)):
+            image_name, extension = os.path.splitext(image_file)
+            if extension not in (CALIBRATION_IMAGE_EXTENSIONS[type_image], CALIBRATION_IMAGE_LEGACY_EXTENSION):
+                continue
+            # Lossless files win over the 8 bit ones saved by previous versions
+            if type_image in previous_images.get(image_name, {}) and \
+                    extension != CALIBRATION_IMAGE_EXTENSIONS[type_image]:
+                continue
+
+            image_path = os.path.join(tmp_kinect_image_path, image_file)
+            if type_image == KinectFrames.DEPTH.name:
+                image_transform_class = ImageTransformerDepth
+            elif type_image == KinectFrames.INFRARED.name:
+                image_transform_class = ImageTransformerIR
+            else:
+                image_transform_class = ImageTransformerRGB
+            thumbnail_width = PHOTO_THUMBNAIL_WIDTH if type_image == KinectFrames.COLOR.name else None
+            image_obj = ImageObject(image_absolute_path=image_path, image_transform_class=image_transform_class,
+                                    lazy=True, memory_budget=memory_budget, thumbnail_width=thumbnail_width)
+
+            if image_name not in previous_images.keys():
+                previous_images[image_name] = {}
+            previous_images[image_name][type_image] = image_obj
 
     return previous_images
 
 
-def save_kinect_images(path, images_map):
-    for image_name, image_map in images_map.items():
-        for type_image in CALIBRATE_PATTERN_IMAGES:
-            tmp_kinect_image_path = generate_relative_path([path, type_image])
-            if not os.path.exists(tmp_kinect_image_path):
-                os.makedirs(tmp_kinect_image_path)
-            if image_name not in os.listdir(tmp_kinect_image_path):
-                image_map[type_image].restore()
-                image_map[type_image].save(output_path=os.path.join(tmp_kinect_image_path, image_name))
+def save_kinect_images(path, images_map, image_writer):
+    # Encoding runs in the writer threads, the caller flushes it before exiting
+    for type_image in CALIBRATE_PATTERN_IMAGES:
+        tmp_kinect_image_path = generate_relative_path([path, type_image])
+        if not os.path.exists(tmp_kinect_image_path):
+            os.makedirs(tmp_kinect_image_path)
+
+        for image_name, image_map in images_map.items():
+            image_path = os.path.join(tmp_kinect_image_path,
+                                      get_calibration_image_filename(image_name=image_name, type_image=type_image))
+            legacy_image_path = os.path.join(tmp_kinect_image_path, f"{image_name}{CALIBRATION_IMAGE_LEGACY_EXTENSION}")
+            if os.path.exists(image_path) or os.path.exists(legacy_image_path):
+                continue
+            # Initial image, without the corners drawn over it
+            image_obj = image_map[type_image]
+            image_writer.write(save_function=image_obj.image_transform_class.save, image=image_obj.initial_image,
+                               output_path=image_path)
 
 
 def calibrate_kinect(kinect, principal_screen, projector_screen, use_previous_images, save_new_images):
     logging.info("Kinect will be calibrated using chess board pattern")
 
+    memory_budget = ImageMemoryBudget()
     previous_images = {}
     if use_previous_images:
-        previous_images = load_kinect_images(path=IMAGE_KINECT_SAVE_PATH)
+        previous_images = load_kinect_images(path=IMAGE_KINECT_SAVE_PATH, memory_budget=memory_budget)
 
     # Read necessary images for calibration
     background_color_image = ImageGenerator.generate_color_image(shape=projector_screen.screen_resolution)
@@ -81,13 +109,19 @@ def calibrate_kinect(kinect, principal_screen, projector_screen, use_previous_im
     projector_screen.create_window(window_name="FullScreen Projector", image=background_color_image, fullscreen=True)
 
     app = instantiate_calibrate_kinect_interface(kinect=kinect, previous_images=previous_images,
-                                                 not_found_image=not_found_image, principal_screen=principal_screen)
+                                                 not_found_image=not_found_image, principal_screen=principal_screen,
+                                                 memory_budget=memory_budget)
 
     # Manage Information returned
     logging.info("App finished, checking camera information")
 
     if save_new_images:
-        save_kinect_images(path=IMAGE_KINECT_SAVE_PATH, images_map=app.photos_taken)
+        image_writer = AsyncImageWriter()
+        try:
+            save_kinect_images(path=IMAGE_KINECT_SAVE_PATH, images_map=app.photos_taken, image_writer=image_writer)
+        finally:
+            image_writer.close()
+    memory_budget.close()
 
     for type_image in CALIBRATE_PATTERN_IMAGES:
         kinect.kinect_calibrations[type_image].set_calibrations(calibration=app.camera_information[type_image])
@@ -112,12 +146,21 @@ def main():
                         format='%(asctime)s %(levelname)-4s %(message)s',
                         datefmt='%H:%M:%S')
 
+    profiler = start_profiler(args=args, program_name="calibrate_cameras")
+
     # Initialize Kinect, Principal Screen and Projector Screen
+    kinect = None
     try:
+        # Sensor warm-up and calibration loading run while the screens are selected
+        kinect = KinectController(kinect_frames=[KinectFrames.COLOR, KinectFrames.DEPTH, KinectFrames.INFRARED],
+                                  wait_ready=False)
         principal_screen, projector_screen = selector_screens()
-        kinect = KinectController(kinect_frames=[KinectFrames.COLOR, KinectFrames.DEPTH, KinectFrames.INFRARED])
+        kinect.mark_startup("screens selected")
+        kinect.wait_until_ready()
     except Exception as error:
         logging.error(f"Error trying to instantiate screens/kinect: {error}")
+        if kinect is not None:
+            kinect.close()
         raise error
 
     # Initiate calibrations
@@ -132,6 +175,8 @@ def main():
         principal_screen.close_windows()
         projector_screen.close_windows()
         kinect.close()
+        if profiler:
+            profiler.stop()
 
 
 if __name__ == '__main__':
@@ -15,8 +15,8 @@ from interfaces.DrawPolygonInterface import instantiate_draw_polygon_interface
 from interfaces.MoveProjectorPointsInterface import instantiate_move_projector_interface
 from interfaces.SelectorScreenInterface import selector_screens
 from kinect_controller.KinectController import KinectFrames, KinectController
-from kinect_module.PyKinectV2 import _DepthSpacePoint
 from literals import BOX_HEIGHT
+from performance.SamplingProfiler import add_profile_arguments, start_profiler
 from utils import generate_cords
 
 
@@ -28,6 +28,7 @@ def get_args():
 
     parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
                         type=int, required=False, default=logging.INFO)
+    add_profile_arguments(parser)
 
     args, unknown = parser.parse_known_args()
     return args
@@ -217,12 +218,21 @@ def main():
                         format='%(asctime)s %(levelname)-4s %(message)s',
                         datefmt='%H:%M:%S')
 
+    profiler = start_profiler(args=args, program_name="calibrate_sandbox")
+
     # Initialize Kinect, Principal Screen and Projector Screen
+    kinect = None
     try:
+        # Sensor warm-up and calibration loading run while the screens are selected
+        kinect = KinectController(kinect_frames=[KinectFrames.COLOR, KinectFrames.DEPTH, KinectFrames.INFRARED],
+                                  wait_ready=False)
         principal_screen, projector_screen = selector_screens()
-        kinect = KinectController(kinect_frames=[KinectFrames.COLOR, KinectFrames.DEPTH, KinectFrames.INFRARED])
+        kinect.mark_startup("screens selected")
+        kinect.wait_until_ready()
     except Exception as error:
         logging.error(f"Error trying to instantiate screens/kinect: {error}")
+        if kinect is not None:
+            kinect.close()
         raise error
 
     # Initiate calibrations
@@ -241,6 +251,8 @@ def main():
         principal_screen.close_windows()
         projector_screen.close_windows()
         kinect.close()
+        if profiler:
+            profiler.stop()
 
 
 if __name__ == '__main__':
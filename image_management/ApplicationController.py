@@ -1,32 +1,135 @@
 import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
 
 from literals import ConfigControllerEnum
+from performance.PipelineMetrics import pipeline_metrics
+
+
+class ConfigSnapshot(Mapping):
+    """
+    Immutable view of the configuration values. A new snapshot (and version) is created on every change, so readers
+    keep using the one they got without locks and compare versions to know what changed.
+    """
+
+    def __init__(self, values, version=0, key_versions=None):
+        self._values = MappingProxyType(dict(values))
+        self.version = version
+        self.key_versions = MappingProxyType(dict(key_versions) if key_versions else {key: 0 for key in values})
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def changed_since(self, version):
+        return {key for key, key_version in self.key_versions.items() if key_version > version}
+
+
+class DerivedConfigValue:
+    """
+    Value computed from some configuration keys (colormap LUT...), rebuilt only when one of those keys changes.
+    """
+
+    def __init__(self, keys, build):
+        self.keys = set(keys)
+        self.build = build
+        self.version = None
+        self.value = None
+
+    def get(self, snapshot: ConfigSnapshot):
+        if self.version is None or self.keys & snapshot.changed_since(self.version):
+            self.value = self.build(snapshot)
+        self.version = snapshot.version
+        return self.value
 
 
 class SharedConfig:
     def __init__(self):
         self.lock = threading.Lock()
 
-        self.current_image = None
-        self.second_image = None
+        # RGB thumbnails published by the projector thread, the version changes with every publication
+        self.current_preview = None
+        self.second_preview = None
+        self.preview_version = 0
 
         for config in ConfigControllerEnum:
             setattr(self, config.name, config.value)
+        self.snapshot = ConfigSnapshot(values={config.name: config.value for config in ConfigControllerEnum})
+        self.subscribers = []
+
+        # One-shot request from the configuration interface, consumed by the projector loop
+        self.calibration_reload_requested = threading.Event()
 
     def update(self, **kwargs):
+        unknown_keys = [key for key in kwargs.keys() if key not in self.snapshot]
+        if unknown_keys:
+            raise KeyError(f"Unknown configuration keys {unknown_keys}, expected ConfigControllerEnum names")
+
         with self.lock:
             for key, value in kwargs.items():
-                if hasattr(self, key):
-                    setattr(self, key, value)
+                setattr(self, key, value)
 
-    def get_values(self):
+            # Publish a new snapshot only with the configuration keys that really changed
+            changed_keys = {key for key, value in kwargs.items() if self.snapshot[key] != value}
+            if not changed_keys:
+                return
+            version = self.snapshot.version + 1
+            values = dict(self.snapshot)
+            values.update({key: kwargs[key] for key in changed_keys})
+            key_versions = dict(self.snapshot.key_versions)
+            key_versions.update({key: version for key in changed_keys})
+            self.snapshot = snapshot = ConfigSnapshot(values=values, version=version, key_versions=key_versions)
+            subscribers = list(self.subscribers)
+
+        for keys, callback in subscribers:
+            if keys is None or keys & changed_keys:
+                callback(snapshot, changed_keys)
+
+    def subscribe(self, callback, keys=None):
+        # callback(snapshot, changed_keys) runs in the thread that changed the configuration
         with self.lock:
-            return {key.name: getattr(self, key.name) for key in ConfigControllerEnum}
+            self.subscribers.append((set(keys) if keys is not None else None, callback))
+
+    def get_values(self):
+        # Reading the attribute is atomic, the snapshot itself never changes
+        return self.snapshot
 
     def get_value(self, key):
+        snapshot = self.snapshot
+        if key in snapshot:
+            return snapshot[key]
         with self.lock:
             return getattr(self, key)
 
     def set_value(self, key, value):
+        self.update(**{key: value})
+
+    def request_calibration_reload(self):
+        self.calibration_reload_requested.set()
+
+    def consume_calibration_reload(self):
+        if not self.calibration_reload_requested.is_set():
+            return False
+        self.calibration_reload_requested.clear()
+        return True
+
+    def set_previews(self, current_preview=None, second_preview=None):
+        wait_start = time.perf_counter()
+        with self.lock:
+            wait_seconds = time.perf_counter() - wait_start
+            if current_preview is not None:
+                self.current_preview = current_preview
+            if second_preview is not None:
+                self.second_preview = second_preview
+            self.preview_version += 1
+        pipeline_metrics.record_lock_wait(lock_name="config", wait_seconds=wait_seconds)
+
+    def get_previews(self):
         with self.lock:
-            setattr(self, key, value)
+            return self.preview_version, self.current_preview, self.second_preview
@@ -0,0 +1,75 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from literals import IMAGE_WRITER_WORKERS, IMAGE_WRITER_QUEUE_SIZE
+
+
+class AsyncImageWriter:
+    """
+    Encodes and writes images in worker threads. The queue is bounded, so write() blocks when the workers fall behind
+    instead of holding every pending image in memory. flush() waits for the queued writes, close() also stops the
+    workers. Files are written to a temporal name and renamed, a partial file never keeps the final name.
+    """
+
+    def __init__(self, workers=IMAGE_WRITER_WORKERS, queue_size=IMAGE_WRITER_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.written = 0
+        self.write_seconds = 0.0
+        self.workers = [threading.Thread(target=self.run, name=f"image_writer_{index}", daemon=True)
+                        for index in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def write(self, save_function, image, output_path):
+        # save_function(image=..., output_path=...), for example ImageTransformerDepth.save
+        self.queue.put((save_function, image, output_path))
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                self.write_task(*task)
+            finally:
+                self.queue.task_done()
+
+    def write_task(self, save_function, image, output_path):
+        start = time.perf_counter()
+        root, extension = os.path.splitext(output_path)
+        temporal_path = f"{root}.tmp{extension}"
+        try:
+            save_function(image=image, output_path=temporal_path)
+            os.replace(temporal_path, output_path)
+        except Exception as error:
+            logging.error(f"Cannot write image {output_path}: {error}")
+            with self.lock:
+                self.errors.append((output_path, error))
+            if os.path.exists(temporal_path):
+                os.remove(temporal_path)
+            return
+
+        with self.lock:
+            self.written += 1
+            self.write_seconds += time.perf_counter() - start
+
+    def flush(self):
+        self.queue.join()
+        with self.lock:
+            errors = list(self.errors)
+        logging.info(f"Image writer: {self.written} images written "
+                     f"({self.write_seconds * 1000 / max(self.written, 1):.1f} ms mean), {len(errors)} errors")
+        return errors
+
+    def close(self):
+        errors = self.flush()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        return errors
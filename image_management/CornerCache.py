@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from utils import generate_folders
+
+
+class CornerCache:
+    """
+    Detected chessboard corners stored on disk, keyed by the image content, the pattern size and the detector
+    configuration. Images that did not change since the last session are not searched again.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.seen = set()
+        self.modified = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def get_key(image, pattern_size, detector_signature):
+        image = np.ascontiguousarray(image)
+        content_hash = hashlib.sha1()
+        content_hash.update(f"{image.dtype.str}{image.shape}".encode())
+        content_hash.update(image.tobytes())
+        return f"{content_hash.hexdigest()}_{pattern_size[0]}x{pattern_size[1]}_{detector_signature}"
+
+    def load(self):
+        if not os.path.isfile(self.cache_path):
+            return
+
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as cache_file:
+                self.entries = {key: cache_file[key] for key in cache_file.files}
+        except Exception as error:
+            logging.warning(f"Corner cache {self.cache_path} cannot be read, it will be rebuilt: {error}")
+            self.entries = {}
+        logging.debug(f"Corner cache loaded with {len(self.entries)} entries")
+
+    def contains(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        # Images without pattern are stored as empty arrays so they are not searched again either
+        corners = self.entries[key]
+        self.seen.add(key)
+        self.hits += 1
+        return corners if corners.size else None
+
+    def set(self, key, corners):
+        self.entries[key] = np.zeros((0, 1, 2), dtype=np.float32) if corners is None else np.asarray(corners)
+        self.seen.add(key)
+        self.misses += 1
+        self.modified = True
+
+    def prune(self):
+        # Entries of photos that were not searched this session (deleted photos) are dropped
+        unseen = [key for key in self.entries.keys() if key not in self.seen]
+        for key in unseen:
+            self.entries.pop(key)
+        if unseen:
+            self.modified = True
+            logging.debug(f"Corner cache pruned {len(unseen)} entries")
+
+    def save(self, prune=False):
+        # prune only when every photo of the session has been searched, otherwise valid entries would be lost
+        if prune:
+            self.prune()
+        if not self.modified:
+            return
+
+        generate_folders(self.cache_path)
+        temporal_path = self.cache_path + ".tmp.npz"
+        np.savez(temporal_path, **self.entries)
+        os.replace(temporal_path, self.cache_path)
+        self.modified = False
+        logging.info(f"Corner cache saved with {len(self.entries)} entries ({self.hits} hits, {self.misses} misses "
+                     f"this session)")
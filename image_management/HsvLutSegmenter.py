@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+
+class HsvLutSegmenter:
+    """
+    HSV threshold with one 256 entry LUT per channel. The LUTs are rebuilt only when a bound changes and the mask
+    buffers are reused, so the same object can segment the live color stream at video rate. A hue lower bound above
+    the upper bound wraps around 179 (red markers), otherwise the result is the same as cv2.inRange.
+    """
+
+    def __init__(self, lower_bound=(0, 100, 100), upper_bound=(10, 255, 255)):
+        self.lower_bound = None
+        self.upper_bound = None
+        self.luts = [np.zeros(256, dtype=np.uint8) for _ in range(3)]
+        self.mask = None
+        self.channel_mask = None
+        self.set_bounds(lower_bound=lower_bound, upper_bound=upper_bound)
+
+    def set_bounds(self, lower_bound, upper_bound):
+        lower_bound = tuple(int(value) for value in lower_bound)
+        upper_bound = tuple(int(value) for value in upper_bound)
+        for channel, (lower, upper) in enumerate(zip(lower_bound, upper_bound)):
+            if self.lower_bound is not None and (lower, upper) == (self.lower_bound[channel],
+                                                                   self.upper_bound[channel]):
+                continue
+            lut = self.luts[channel]
+            lut[:] = 0
+            if lower <= upper:
+                lut[max(lower, 0):upper + 1] = 255
+            elif channel == 0:
+                lut[lower:180] = 255
+                lut[:upper + 1] = 255
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+
+    def get_mask(self, hsv_planes):
+        # hsv_planes: cv2.split of the HSV image, the caller keeps them when the image does not change
+        if self.mask is None or self.mask.shape != hsv_planes[0].shape:
+            self.mask = np.empty(hsv_planes[0].shape, dtype=np.uint8)
+            self.channel_mask = np.empty_like(self.mask)
+
+        cv2.LUT(hsv_planes[0], self.luts[0], dst=self.mask)
+        for plane, lut in zip(hsv_planes[1:], self.luts[1:]):
+            cv2.LUT(plane, lut, dst=self.channel_mask)
+            cv2.bitwise_and(self.mask, self.channel_mask, dst=self.mask)
+        return self.mask
+
+    def get_mask_from_bgr(self, image):
+        return self.get_mask(hsv_planes=cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV)))
+
+    def segment(self, image, hsv_planes=None):
+        mask = self.get_mask(hsv_planes=hsv_planes) if hsv_planes is not None else self.get_mask_from_bgr(image=image)
+        return cv2.bitwise_and(image, image, mask=mask)
@@ -10,25 +10,38 @@ class ImageGenerator:
         return image
 
     @staticmethod
-    def generate_image_with_other_image(image, position, image_shape, shape, background_color=(0, 0, 0)):
-        background_image = ImageGenerator.generate_color_image(shape=shape, color=background_color)
-        resized_image = cv2.resize(image, (image_shape[1], image_shape[0]))
-
+    def get_overlap_region(position, image_size, shape):
+        # Slices (background, image) of an image_size=(width, height) image placed at position inside shape
         x, y = position
-        resized_height, resized_width = resized_image.shape[:2]
-        height, width = background_image.shape[:2]
+        resized_width, resized_height = image_size
+        width, height = shape
 
         start_x = max(x, 0)
         start_y = max(y, 0)
         end_x = min(x + resized_width, width)
         end_y = min(y + resized_height, height)
+        if end_x <= start_x or end_y <= start_y:
+            return None
 
         img_start_x = 0 if x >= 0 else -x
         img_start_y = 0 if y >= 0 else -y
         img_end_x = resized_width if x + resized_width <= width else width - x
         img_end_y = resized_height if y + resized_height <= height else height - y
 
-        background_image[start_y:end_y, start_x:end_x] = resized_image[img_start_y:img_end_y, img_start_x:img_end_x]
+        return ((slice(start_y, end_y), slice(start_x, end_x)),
+                (slice(img_start_y, img_end_y), slice(img_start_x, img_end_x)))
+
+    @staticmethod
+    def generate_image_with_other_image(image, position, image_shape, shape, background_color=(0, 0, 0)):
+        background_image = ImageGenerator.generate_color_image(shape=shape, color=background_color)
+        resized_image = cv2.resize(image, (image_shape[1], image_shape[0]))
+
+        region = ImageGenerator.get_overlap_region(position=position,
+                                                   image_size=(resized_image.shape[1], resized_image.shape[0]),
+                                                   shape=(background_image.shape[1], background_image.shape[0]))
+        if region is not None:
+            background_region, image_region = region
+            background_image[background_region] = resized_image[image_region]
 
         return background_image
 
@@ -0,0 +1,86 @@
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+from literals import PHOTO_MEMORY_BUDGET_MB
+
+
+class ImageMemoryBudget:
+    """
+    Least recently used ImageObjects keep their pixels while the total stays under the budget. Older ones are
+    unloaded (spilled to a temporal folder when they cannot be read again from their file) and load back on access.
+    """
+
+    def __init__(self, budget_mb=PHOTO_MEMORY_BUDGET_MB, spill_folder=None):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.spill_folder = spill_folder
+        self.image_objects = {}
+        # Running total, ImageObjects report their changes (update_memory) so an access never sums every object
+        self.object_bytes = {}
+        self.memory_bytes = 0
+        # Least recently used first, only objects with pixels in memory
+        self.loaded_objects = OrderedDict()
+        self.unloaded_count = 0
+
+    def register(self, image_object):
+        self.image_objects[id(image_object)] = image_object
+        self.update_memory(image_object=image_object)
+        self.enforce()
+
+    def unregister(self, image_object):
+        key = id(image_object)
+        self.image_objects.pop(key, None)
+        self.memory_bytes -= self.object_bytes.pop(key, 0)
+        self.loaded_objects.pop(key, None)
+
+    def update_memory(self, image_object):
+        key = id(image_object)
+        if key not in self.image_objects:
+            return
+        memory_bytes = image_object.get_memory_bytes()
+        self.memory_bytes += memory_bytes - self.object_bytes.get(key, 0)
+        self.object_bytes[key] = memory_bytes
+        if memory_bytes:
+            if key not in self.loaded_objects:
+                self.loaded_objects[key] = image_object
+        else:
+            self.loaded_objects.pop(key, None)
+
+    def touch(self, image_object):
+        key = id(image_object)
+        if key in self.loaded_objects and next(reversed(self.loaded_objects)) != key:
+            self.loaded_objects.move_to_end(key)
+        if self.memory_bytes > self.budget_bytes:
+            self.enforce()
+
+    def get_memory_bytes(self):
+        return self.memory_bytes
+
+    def enforce(self):
+        if self.memory_bytes <= self.budget_bytes:
+            return
+
+        # The most recent object is never unloaded, it is the one being used. unload() reports the freed bytes
+        for image_object in list(self.loaded_objects.values())[:-1]:
+            image_object.unload()
+            self.unloaded_count += 1
+            if self.memory_bytes <= self.budget_bytes:
+                break
+        logging.debug(f"Image memory budget: {self.memory_bytes / 1024 / 1024:.0f} MB loaded after unloading "
+                      f"({self.unloaded_count} unloads in total)")
+
+    def get_spill_path(self, image_object, suffix):
+        if self.spill_folder is None:
+            self.spill_folder = tempfile.mkdtemp(prefix="sandbox_images_")
+        os.makedirs(self.spill_folder, exist_ok=True)
+        return os.path.join(self.spill_folder, f"{id(image_object)}_{suffix}.npy")
+
+    def close(self):
+        self.image_objects.clear()
+        self.object_bytes.clear()
+        self.loaded_objects.clear()
+        self.memory_bytes = 0
+        if self.spill_folder is not None and os.path.isdir(self.spill_folder):
+            shutil.rmtree(self.spill_folder, ignore_errors=True)
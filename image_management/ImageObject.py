@@ -1,37 +1,213 @@
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
 from image_management.ImageTransformerBase import ImageTransformerBase
 
 
 class ImageObject:
-    def __init__(self, image=None, image_absolute_path=None, image_transform_class=ImageTransformerBase):
+    def __init__(self, image=None, image_absolute_path=None, image_transform_class=ImageTransformerBase, lazy=False,
+                 copy_on_write=False, memory_budget=None, thumbnail_width=None):
         self.image_transform_class = image_transform_class
 
+        # Copy on write: initial_image shares the (read only) pixels with image until image is updated
+        self.copy_on_write = copy_on_write or memory_budget is not None
+        self.memory_budget = memory_budget
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail = None
+
+        self.source_path = image_absolute_path
+        self._image = None
+        self._initial_image = None
+        self._image_is_initial = True
+        self._image_spill_path = None
+        self._initial_spill_path = None
+        self._image_spilled = False
+
+        self.image_shape = None
+        self.width, self.height = None, None
+
         if image_absolute_path is not None:
-            self.image = self.image_transform_class.load(image_path=image_absolute_path)
+            if lazy:
+                # Only the header (and a reduced decode for the thumbnail) is read, pixels are loaded on first need
+                with Image.open(image_absolute_path) as image_header:
+                    self.width, self.height = image_header.size
+                    self.thumbnail = self.read_thumbnail(image_header=image_header)
+                self.image_shape = (self.height, self.width)
+            else:
+                self.set_initial_image(image=self.image_transform_class.load(image_path=image_absolute_path))
         elif image is not None:
-            self.image = image
+            self.set_initial_image(image=image)
         else:
             raise AttributeError("ImageObject class needs at least an image path or an image object")
 
-        self.initial_image = self.image_transform_class.duplicate(image=self.image)
-        self.image_shape = None
-        self.width, self.height = None, None
-        self.update_image_information()
+        if self.memory_budget is not None:
+            self.memory_budget.register(image_object=self)
 
     def update_image_information(self):
-        self.image_shape = self.image_transform_class.get_image_shape(image=self.image)
-        self.width, self.height = self.image_transform_class.get_image_width_and_height(image=self.image)
+        self.image_shape = self.image_transform_class.get_image_shape(image=self._image)
+        self.width, self.height = self.image_transform_class.get_image_width_and_height(image=self._image)
+
+    # region Pixels management
+    @property
+    def image(self):
+        if self._image is None:
+            self.load_pixels()
+        if self.memory_budget is not None:
+            self.memory_budget.touch(image_object=self)
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self.update(image=image)
+
+    @property
+    def initial_image(self):
+        if self._initial_image is None:
+            self.load_initial_pixels()
+        return self._initial_image
+
+    def set_initial_image(self, image):
+        if self.copy_on_write:
+            image = image.view()
+            image.setflags(write=False)
+            self._initial_image = image
+        else:
+            self._initial_image = self.image_transform_class.duplicate(image=image)
+        self._image = image
+        self._image_is_initial = self.copy_on_write
+        self.update_image_information()
+        self.update_thumbnail()
+        self.update_memory()
+
+    def get_writable_image(self):
+        # Image that can be modified in place (drawings), copied first if it is still shared with initial_image
+        image = self.image
+        if not image.flags.writeable:
+            image = image.copy()
+            self.update(image=image)
+        return image
+
+    def is_loaded(self):
+        return self._image is not None or self._initial_image is not None
+
+    def get_memory_bytes(self):
+        memory_bytes = self._image.nbytes if self._image is not None else 0
+        if self._initial_image is not None and self._initial_image is not self._image:
+            memory_bytes += self._initial_image.nbytes
+        return memory_bytes
+
+    def load_initial_pixels(self):
+        if self._initial_spill_path is not None:
+            image = np.load(self._initial_spill_path)
+        else:
+            image = self.image_transform_class.load(image_path=self.source_path)
+        image.setflags(write=False)
+        self._initial_image = image
+        self.update_memory()
+
+    def load_pixels(self):
+        if self._image_is_initial:
+            self._image = self.initial_image
+        else:
+            self._image = np.load(self._image_spill_path)
+            # In place changes would not reach the spilled copy, get_writable_image() copies and updates it
+            self._image.setflags(write=False)
+        self.update_image_information()
+        if self.thumbnail is None:
+            self.update_thumbnail()
+        self.update_memory()
+
+    def unload(self):
+        # Pixels that cannot be read again from the source file are spilled to the budget folder first
+        if not self.is_loaded():
+            return
+
+        if self._initial_image is not None and self.source_path is None and self._initial_spill_path is None:
+            self._initial_spill_path = self.memory_budget.get_spill_path(image_object=self, suffix="initial")
+            np.save(self._initial_spill_path, self._initial_image)
+        if self._image is not None and not self._image_is_initial and not self._image_spilled:
+            self._image_spill_path = self.memory_budget.get_spill_path(image_object=self, suffix="image")
+            np.save(self._image_spill_path, self._image)
+            self._image_spilled = True
+
+        self._image = None
+        self._initial_image = None
+        self.update_memory()
+
+    def release(self):
+        # Photo discarded, stop tracking it and remove the spilled pixels
+        if self.memory_budget is not None:
+            self.memory_budget.unregister(image_object=self)
+        for spill_path in [self._image_spill_path, self._initial_spill_path]:
+            if spill_path is not None and os.path.isfile(spill_path):
+                os.remove(spill_path)
+
+    def get_thumbnail_size(self, width, height):
+        return self.thumbnail_width, max(int(height * self.thumbnail_width / width), 1)
+
+    def read_thumbnail(self, image_header):
+        # JPEG files are decoded directly at a reduced scale (draft), other 8 bit files are decoded and resized.
+        # 16 bit images get their thumbnail when the pixels are loaded
+        if not self.thumbnail_width or image_header.mode not in ("RGB", "L"):
+            return None
+        thumbnail_size = self.get_thumbnail_size(width=self.width, height=self.height)
+        image_header.draft(image_header.mode, thumbnail_size)
+        thumbnail = np.asarray(image_header.resize(thumbnail_size, Image.BOX))
+        # Same channel order as the loaded pixels (OpenCV BGR)
+        return thumbnail[..., ::-1].copy() if thumbnail.ndim == 3 else thumbnail
+
+    def update_memory(self):
+        if self.memory_budget is not None:
+            self.memory_budget.update_memory(image_object=self)
+
+    def update_thumbnail(self):
+        if not self.thumbnail_width or self._image is None:
+            return
+        width, height = self.image_transform_class.get_image_width_and_height(image=self._image)
+        self.thumbnail = cv2.resize(self._image, self.get_thumbnail_size(width=width, height=height),
+                                    interpolation=cv2.INTER_AREA)
+
+    # endregion
 
     # region Basic Operations
     def update(self, image):
-        self.image = image
+        if self._initial_image is not None and image is self._initial_image:
+            self.restore()
+            return
+
+        self._image = image
+        self._image_is_initial = False
+        self._image_spilled = False
         self.update_image_information()
+        self.update_thumbnail()
+        self.update_memory()
+        if self.memory_budget is not None:
+            self.memory_budget.touch(image_object=self)
 
     def overwrite(self):
-        self.initial_image = self.image_transform_class.duplicate(image=self.image)
+        if self._image_is_initial:
+            return
+        self.set_initial_image(image=self.image)
+        self.source_path = None
+        if self._initial_spill_path is not None and os.path.isfile(self._initial_spill_path):
+            os.remove(self._initial_spill_path)
+        self._initial_spill_path = None
 
     def restore(self):
-        image = self.image_transform_class.duplicate(image=self.initial_image)
-        self.update(image=image)
+        if not self.copy_on_write:
+            image = self.image_transform_class.duplicate(image=self.initial_image)
+            self.update(image=image)
+            return
+
+        self._image = self.initial_image
+        self._image_is_initial = True
+        self._image_spilled = False
+        self.update_image_information()
+        self.update_thumbnail()
+        self.update_memory()
 
     def save(self, output_path):
         self.image_transform_class.save(image=self.image, output_path=output_path)
@@ -3,6 +3,8 @@ from copy import deepcopy
 import cv2
 import numpy as np
 
+from literals import CHESSBOARD_COARSE_WIDTH, CHESSBOARD_ROI_MARGIN, CHESSBOARD_USE_SB
+
 
 class ImageTransformerBase:
 
@@ -41,6 +43,12 @@ class ImageTransformerBase:
     def load(image_path):
         return cv2.imread(image_path)
 
+    @staticmethod
+    def encode_decode(image, extension):
+        # Pixels read back from a file saved with this extension (lossy formats like .jpg change them)
+        _, image_buffer = cv2.imencode(extension, image)
+        return cv2.imdecode(image_buffer, cv2.IMREAD_UNCHANGED)
+
     # endregion
 
     # region Basic transformations
@@ -86,6 +94,10 @@ class ImageTransformerBase:
 
         return cv2.warpPerspective(image, warp_matrix, output_size)
 
+    @staticmethod
+    def remap(image, map_1, map_2, interpolation=cv2.INTER_LINEAR):
+        return cv2.remap(image, map_1, map_2, interpolation)
+
     # endregion
 
     # region Filter Image
@@ -125,8 +137,13 @@ class ImageTransformerBase:
 
     @staticmethod
     def apply_colormap(image, colormap=cv2.COLORMAP_JET):
+        # colormap can be a cv2.COLORMAP_* value or a 256x1x3 LUT (generate_colormap_lut)
         return cv2.applyColorMap(image, colormap)
 
+    @staticmethod
+    def generate_colormap_lut(colormap=cv2.COLORMAP_JET):
+        return cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), colormap)
+
     @staticmethod
     def change_color(image, color=cv2.COLOR_BGR2GRAY):
         return cv2.cvtColor(image, color)
@@ -148,17 +165,78 @@ class ImageTransformerBase:
 
     # region Search information in image
     @staticmethod
-    def find_chessboard_corners(image, pattern_size, flags=cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE):
-        gray_image = ImageTransformerBase.change_color(image=image, color=cv2.COLOR_BGR2GRAY)
-        ret, corners = cv2.findChessboardCorners(image=gray_image, patternSize=pattern_size, flags=flags)
+    def get_gray_image(image):
+        if len(image.shape) == 2:
+            return image
+        return ImageTransformerBase.change_color(image=image, color=cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def find_chessboard_corners(image, pattern_size, flags=cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE,
+                                coarse_width=CHESSBOARD_COARSE_WIDTH, use_sb=CHESSBOARD_USE_SB):
+        gray_image = ImageTransformerBase.get_gray_image(image=image)
+        return ImageTransformerBase.search_chessboard(gray_image=gray_image, pattern_size=pattern_size, flags=flags,
+                                                      coarse_width=coarse_width, use_sb=use_sb)
+
+    @staticmethod
+    def search_chessboard(gray_image, pattern_size, flags=cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE,
+                          coarse_width=CHESSBOARD_COARSE_WIDTH, use_sb=CHESSBOARD_USE_SB):
+        # Returns (ret, corners) in full resolution coordinates, already refined (subpixel) when found
+        width, height = ImageTransformerBase.get_image_width_and_height(image=gray_image)
+        if not coarse_width or width <= coarse_width:
+            return ImageTransformerBase.search_chessboard_in_region(gray_image=gray_image, pattern_size=pattern_size,
+                                                                    flags=flags, use_sb=use_sb)
+
+        # COARSE SEARCH, FAST CHECK DISCARDS IMAGES WITHOUT BOARD
+        scale = coarse_width / width
+        coarse_image = cv2.resize(gray_image, (coarse_width, int(round(height * scale))), interpolation=cv2.INTER_AREA)
+        ret, coarse_corners = cv2.findChessboardCorners(image=coarse_image, patternSize=pattern_size,
+                                                        flags=flags + cv2.CALIB_CB_FAST_CHECK)
+        if not ret:
+            return False, None
+
+        # FINE SEARCH ONLY AROUND THE COARSE BOARD
+        x_min, y_min = coarse_corners.reshape(-1, 2).min(axis=0) / scale
+        x_max, y_max = coarse_corners.reshape(-1, 2).max(axis=0) / scale
+        margin_x = (x_max - x_min) * CHESSBOARD_ROI_MARGIN
+        margin_y = (y_max - y_min) * CHESSBOARD_ROI_MARGIN
+        x_0, y_0 = max(int(x_min - margin_x), 0), max(int(y_min - margin_y), 0)
+        x_1, y_1 = min(int(x_max + margin_x) + 1, width), min(int(y_max + margin_y) + 1, height)
+
+        ret, corners = ImageTransformerBase.search_chessboard_in_region(gray_image=gray_image[y_0:y_1, x_0:x_1],
+                                                                        pattern_size=pattern_size, flags=flags,
+                                                                        use_sb=use_sb)
+        if not ret:
+            # The crop lost the board (bad coarse hit), fall back to the whole image
+            return ImageTransformerBase.search_chessboard_in_region(gray_image=gray_image, pattern_size=pattern_size,
+                                                                    flags=flags, use_sb=use_sb)
+
+        corners = corners + np.array([x_0, y_0], dtype=corners.dtype)
         return ret, corners
 
+    @staticmethod
+    def search_chessboard_in_region(gray_image, pattern_size,
+                                    flags=cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE,
+                                    use_sb=CHESSBOARD_USE_SB):
+        if use_sb:
+            # Sector based detector is already subpixel accurate
+            return cv2.findChessboardCornersSB(gray_image, pattern_size,
+                                               flags=cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_EXHAUSTIVE +
+                                               cv2.CALIB_CB_ACCURACY)
+
+        ret, corners = cv2.findChessboardCorners(image=gray_image, patternSize=pattern_size, flags=flags)
+        if not ret:
+            return ret, corners
+        return ret, ImageTransformerBase.sub_pix_corner(gray_image=gray_image, corners=corners)
+
     @staticmethod
     def calculate_sub_pix_corner(image, corners,
                                  criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)):
-        gray_image = ImageTransformerBase.change_color(image=image, color=cv2.COLOR_BGR2GRAY)
-        corners = cv2.cornerSubPix(gray_image, corners, (5, 5), (-1, -1), criteria)
-        return corners
+        gray_image = ImageTransformerBase.get_gray_image(image=image)
+        return ImageTransformerBase.sub_pix_corner(gray_image=gray_image, corners=corners, criteria=criteria)
+
+    @staticmethod
+    def sub_pix_corner(gray_image, corners, criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)):
+        return cv2.cornerSubPix(gray_image, corners, (5, 5), (-1, -1), criteria)
 
     @staticmethod
     def find_contours(image, mode=cv2.RETR_TREE, flags=cv2.CHAIN_APPROX_SIMPLE):
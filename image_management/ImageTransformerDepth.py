@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 
 from image_management.ImageTransformerBase import ImageTransformerBase
+from literals import LOSSLESS_EXTENSIONS
 
 
 class ImageTransformerDepth(ImageTransformerBase):
@@ -11,6 +12,10 @@ class ImageTransformerDepth(ImageTransformerBase):
 
     @staticmethod
     def save(image, output_path):
+        if output_path.lower().endswith(LOSSLESS_EXTENSIONS):
+            # Raw uint16 values, PNG is lossless for 16 bit single channel images
+            ImageTransformerBase.save(image=image, output_path=output_path)
+            return
         image = ImageTransformerDepth.normalize(image=image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
         image = ImageTransformerDepth.transform_dtype(image=image, dtype=np.uint8)
         ImageTransformerBase.save(image=image, output_path=output_path)
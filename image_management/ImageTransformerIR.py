@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 
 from image_management.ImageTransformerBase import ImageTransformerBase
+from literals import CHESSBOARD_COARSE_WIDTH, CHESSBOARD_USE_SB, LOSSLESS_EXTENSIONS
 
 
 class ImageTransformerIR(ImageTransformerBase):
@@ -12,23 +13,28 @@ class ImageTransformerIR(ImageTransformerBase):
 
     @staticmethod
     def save(image, output_path):
+        if output_path.lower().endswith(LOSSLESS_EXTENSIONS):
+            # Raw uint16 values, PNG is lossless for 16 bit single channel images
+            ImageTransformerBase.save(image=image, output_path=output_path)
+            return
         image = ImageTransformerIR.normalize(image=image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
         image = ImageTransformerIR.transform_dtype(image=image, dtype=np.uint8)
         ImageTransformerBase.save(image=image, output_path=output_path)
 
     @staticmethod
-    def find_chessboard_corners(image, pattern_size, flags=cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE):
+    def get_gray_image(image):
         image_normalized = ImageTransformerIR.normalize(image=image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
-        image_uint8 = ImageTransformerIR.transform_dtype(image=image_normalized, dtype=np.uint8)
+        return ImageTransformerIR.transform_dtype(image=image_normalized, dtype=np.uint8)
 
-        ret, corners = cv2.findChessboardCorners(image=image_uint8, patternSize=pattern_size, flags=flags)
-        return ret, corners
+    @staticmethod
+    def find_chessboard_corners(image, pattern_size, flags=cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE,
+                                coarse_width=CHESSBOARD_COARSE_WIDTH, use_sb=CHESSBOARD_USE_SB):
+        gray_image = ImageTransformerIR.get_gray_image(image=image)
+        return ImageTransformerIR.search_chessboard(gray_image=gray_image, pattern_size=pattern_size, flags=flags,
+                                                    coarse_width=coarse_width, use_sb=use_sb)
 
     @staticmethod
     def calculate_sub_pix_corner(image, corners,
                                  criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)):
-        image_normalized = ImageTransformerIR.normalize(image=image, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
-        image_uint8 = ImageTransformerIR.transform_dtype(image=image_normalized, dtype=np.uint8)
-
-        corners = cv2.cornerSubPix(image_uint8, corners, (5, 5), (-1, -1), criteria)
-        return corners
+        gray_image = ImageTransformerIR.get_gray_image(image=image)
+        return ImageTransformerIR.sub_pix_corner(gray_image=gray_image, corners=corners, criteria=criteria)
@@ -0,0 +1,129 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_management.ImageTransformerBase import ImageTransformerBase
+from literals import CHESSBOARD_USE_SB, CHESSBOARD_COARSE_WIDTH
+
+
+def detect_chessboard(image, pattern_size, image_transform_class=ImageTransformerBase, use_sb=CHESSBOARD_USE_SB):
+    # Runs in a worker process, arguments and result must be picklable. Corners are already refined
+    ret, corners = image_transform_class.find_chessboard_corners(image=image, pattern_size=pattern_size,
+                                                                 use_sb=use_sb)
+    if not ret:
+        return None
+    return corners
+
+
+def timed_detect_chessboard(image, pattern_size, image_transform_class=ImageTransformerBase,
+                            use_sb=CHESSBOARD_USE_SB):
+    start = time.perf_counter()
+    corners = detect_chessboard(image=image, pattern_size=pattern_size, image_transform_class=image_transform_class,
+                                use_sb=use_sb)
+    return corners, (time.perf_counter() - start) * 1000
+
+
+class PatternDetector:
+    """
+    Fans chessboard detections out to a process pool. The Tk thread calls poll() from after() callbacks and gets the
+    finished detections one by one, so the window keeps responding while the rest are computed. Detections whose
+    worker failed are not returned by poll() (they are not "pattern not found"), their keys are kept in failed.
+    """
+
+    def __init__(self, max_workers=None, use_sb=CHESSBOARD_USE_SB, corner_cache=None):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.use_sb = use_sb
+        self.corner_cache = corner_cache
+        self.futures = {}
+        self.cache_keys = {}
+        self.cached_results = []
+        self.failed = []
+        self.total = 0
+        self.completed = 0
+        self.found = 0
+        self.cache_hits = 0
+        self.detection_times_ms = []
+
+    def get_detector_signature(self):
+        flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE
+        return f"{'sb' if self.use_sb else 'classic'}{flags}_{CHESSBOARD_COARSE_WIDTH}"
+
+    def submit(self, key, image, pattern_size, image_transform_class=ImageTransformerBase, cache_image=None):
+        # cache_image: pixels the image will have when it is read again from disk (default image)
+        self.total += 1
+        if self.corner_cache is not None:
+            cache_key = self.corner_cache.get_key(image=image if cache_image is None else cache_image,
+                                                  pattern_size=pattern_size,
+                                                  detector_signature=self.get_detector_signature())
+            if self.corner_cache.contains(cache_key):
+                # Returned on the next poll like any other detection, no worker process involved
+                self.cached_results.append((key, self.corner_cache.get(cache_key)))
+                return
+            self.cache_keys[key] = cache_key
+
+        self.futures[key] = self.executor.submit(timed_detect_chessboard, image, pattern_size, image_transform_class,
+                                                 self.use_sb)
+
+    def poll(self):
+        results = []
+        for key, corners in self.cached_results:
+            self.completed += 1
+            self.cache_hits += 1
+            if corners is not None:
+                self.found += 1
+            results.append((key, corners))
+        self.cached_results = []
+
+        for key, future in list(self.futures.items()):
+            if not future.done():
+                continue
+            self.futures.pop(key)
+            self.completed += 1
+            try:
+                corners, detection_time_ms = future.result()
+            except Exception as error:
+                logging.error(f"Pattern detection failed for {key}: {error}")
+                self.cache_keys.pop(key, None)
+                self.failed.append(key)
+                continue
+
+            self.detection_times_ms.append(detection_time_ms)
+            if self.corner_cache is not None:
+                self.corner_cache.set(self.cache_keys.pop(key), corners)
+            if corners is not None:
+                self.found += 1
+            logging.debug(f"Pattern detection {key}: {'found' if corners is not None else 'not found'} "
+                          f"in {detection_time_ms:.1f} ms")
+            results.append((key, corners))
+        return results
+
+    def is_finished(self):
+        return not self.futures and not self.cached_results
+
+    def get_statistics(self):
+        return {
+            "images": self.completed,
+            "found": self.found,
+            "cache_hits": self.cache_hits,
+            "failed": len(self.failed),
+            "hit_rate": self.found / self.completed if self.completed else 0.0,
+            "mean_ms": float(np.mean(self.detection_times_ms)) if self.detection_times_ms else 0.0,
+            "max_ms": float(np.max(self.detection_times_ms)) if self.detection_times_ms else 0.0
+        }
+
+    def log_statistics(self):
+        statistics = self.get_statistics()
+        logging.info(f"Pattern detection: {statistics['found']}/{statistics['images']} images with pattern "
+                     f"(hit rate {statistics['hit_rate'] * 100:.0f}%), {statistics['cache_hits']} from corner cache, "
+                     f"{statistics['failed']} failed, "
+                     f"{statistics['mean_ms']:.1f} ms mean, {statistics['max_ms']:.1f} ms max per detected image")
+
+    def shutdown(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.cached_results = []
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+import cv2
+
+from image_management.ImageGenerator import ImageGenerator
+from literals import PATTERN_RENDER_CACHE_SIZE
+
+
+class PatternRenderer:
+    """
+    Projects a pattern over a persistent projector canvas. Resized patterns are cached by size and a move only clears
+    the previous region and blits the new one, same result as ImageGenerator.generate_image_with_other_image.
+    """
+
+    def __init__(self, pattern_image, shape, background_color=(0, 0, 0), cache_size=PATTERN_RENDER_CACHE_SIZE):
+        self.pattern_image = pattern_image
+        self.shape = shape
+        self.background_color = background_color
+        self.cache_size = cache_size
+
+        self.canvas = ImageGenerator.generate_color_image(shape=shape, color=background_color)
+        self.resized_patterns = OrderedDict()
+        self.last_region = None
+
+    def get_resized_pattern(self, image_shape):
+        image_shape = (int(image_shape[0]), int(image_shape[1]))
+        resized_pattern = self.resized_patterns.get(image_shape)
+        if resized_pattern is None:
+            resized_pattern = cv2.resize(self.pattern_image, (image_shape[1], image_shape[0]))
+            self.resized_patterns[image_shape] = resized_pattern
+            while len(self.resized_patterns) > self.cache_size:
+                self.resized_patterns.popitem(last=False)
+        else:
+            self.resized_patterns.move_to_end(image_shape)
+        return resized_pattern
+
+    def clear(self):
+        if self.last_region is not None:
+            self.canvas[self.last_region] = self.background_color
+            self.last_region = None
+        return self.canvas
+
+    def clear_uncovered(self, new_region):
+        # Only the strips of the previous region that the new blit does not overwrite
+        (last_y, last_x), (new_y, new_x) = self.last_region, new_region
+        overlap_start_y, overlap_end_y = max(last_y.start, new_y.start), min(last_y.stop, new_y.stop)
+        overlap_start_x, overlap_end_x = max(last_x.start, new_x.start), min(last_x.stop, new_x.stop)
+        if overlap_end_y <= overlap_start_y or overlap_end_x <= overlap_start_x:
+            self.clear()
+            return
+
+        self.canvas[last_y.start:overlap_start_y, last_x] = self.background_color
+        self.canvas[overlap_end_y:last_y.stop, last_x] = self.background_color
+        self.canvas[overlap_start_y:overlap_end_y, last_x.start:overlap_start_x] = self.background_color
+        self.canvas[overlap_start_y:overlap_end_y, overlap_end_x:last_x.stop] = self.background_color
+        self.last_region = None
+
+    def render(self, position, image_shape):
+        # The canvas is modified in place, the caller must not let the projector show it while rendering
+        resized_pattern = self.get_resized_pattern(image_shape=image_shape)
+        region = ImageGenerator.get_overlap_region(position=position,
+                                                   image_size=(resized_pattern.shape[1], resized_pattern.shape[0]),
+                                                   shape=self.shape)
+        if region is None:
+            return self.clear()
+
+        canvas_region, pattern_region = region
+        if self.last_region is not None:
+            self.clear_uncovered(new_region=canvas_region)
+        self.canvas[canvas_region] = resized_pattern[pattern_region]
+        self.last_region = canvas_region
+        return self.canvas
@@ -1,31 +1,40 @@
+import logging
 import tkinter as tk
 from datetime import datetime
 from tkinter import messagebox
 
-import cv2
 import numpy as np
 
+from calibrations.CameraCalibrationSolver import CameraCalibrationSolver
+from image_management.CornerCache import CornerCache
+from image_management.ImageMemoryBudget import ImageMemoryBudget
 from image_management.ImageObject import ImageObject
+from image_management.PatternDetector import PatternDetector
 from image_management.ImageTransformerDepth import ImageTransformerDepth
 from image_management.ImageTransformerIR import ImageTransformerIR
 from image_management.ImageTransformerRGB import ImageTransformerRGB
 from literals import OBJ_POINTS_KEY, IMG_POINTS_KEY, CALIBRATE_PATTERN_IMAGES, CAMERA_CALIBRATION_VARIABLE, \
     CAMERA_DISTORTION_VARIABLE, CAMERA_ROTATION_VARIABLE, \
-    CAMERA_TRANSLATION_VARIABLE, KinectFrames, IMG_SHAPE_KEY
+    CAMERA_TRANSLATION_VARIABLE, KinectFrames, IMG_SHAPE_KEY, PATTERN_DETECTION_POLL_MS, IMAGE_KINECT_SAVE_PATH, \
+    CORNER_CACHE_FILENAME, PHOTO_THUMBNAIL_WIDTH, PHOTO_FULL_RESOLUTION_DELAY_MS, CALIBRATION_IMAGE_EXTENSIONS, \
+    LOSSLESS_EXTENSIONS
 
 from PIL import Image, ImageTk
 
 from literals_control import PATTERN_SIZE, PATTERN_METERS
+from utils import generate_relative_path
 
 
-def instantiate_calibrate_kinect_interface(kinect, previous_images, not_found_image, principal_screen):
+def instantiate_calibrate_kinect_interface(kinect, previous_images, not_found_image, principal_screen,
+                                           memory_budget=None):
     window_size = (principal_screen.width_resolution - 25, principal_screen.height_resolution - 90)
     calibrate_window = tk.Tk()
     calibrate_window.geometry(
         f"{window_size[0]}x{window_size[1]}+{principal_screen.position[0]}+{principal_screen.position[1]}")
     window_size = (principal_screen.width_resolution - 30, principal_screen.height_resolution - 300)
     app = CalibrateKinectInterface(window=calibrate_window, kinect=kinect, previous_images=previous_images,
-                                   not_found_image=not_found_image, window_image_size=window_size)
+                                   not_found_image=not_found_image, window_image_size=window_size,
+                                   memory_budget=memory_budget)
     calibrate_window.mainloop()
 
     if app.process_interrupted:
@@ -36,7 +45,8 @@ def instantiate_calibrate_kinect_interface(kinect, previous_images, not_found_im
 
 class CalibrateKinectInterface:
 
-    def __init__(self, window, kinect, previous_images, not_found_image, window_image_size=(960, 540)):
+    def __init__(self, window, kinect, previous_images, not_found_image, window_image_size=(960, 540),
+                 memory_budget=None):
         # Necessary variables
         self.kinect = kinect
         self.pattern_size = PATTERN_SIZE
@@ -45,10 +55,21 @@ class CalibrateKinectInterface:
 
         self.window_image_size = window_image_size
         self.not_found_image = not_found_image
+        self.memory_budget = memory_budget if memory_budget is not None else ImageMemoryBudget()
 
         self.image_information = {}  # Map with image name as key
         self.camera_information = {}  # Map with camera name as key
 
+        # Pattern detection running in background processes
+        self.pattern_detector = None
+        self.camera_solver = None
+        self.burst_future = None
+        self.corner_cache = CornerCache(cache_path=generate_relative_path([IMAGE_KINECT_SAVE_PATH,
+                                                                           CORNER_CACHE_FILENAME]))
+        self.pending_corners = {}
+        self.patterns_finished_callbacks = []
+        self.image_names_to_delete = []
+
         # Initiate window
         self.window = window
         self.window.title("Calibrate Kinect Cameras")
@@ -129,6 +150,12 @@ class CalibrateKinectInterface:
     def on_closing(self):
         if messagebox.askokcancel("Cerrar", "¿Seguro que quieres cerrar la ventana? El proceso terminará."):
             self.process_interrupted = True
+            if self.pattern_detector is not None:
+                self.pattern_detector.shutdown()
+            if self.camera_solver is not None:
+                self.camera_solver.shutdown()
+            # Keep the detections finished before closing for the next session
+            self.corner_cache.save()
             self.window.destroy()
 
     def countdown(self, number):
@@ -140,7 +167,9 @@ class CalibrateKinectInterface:
             messagebox.showerror("Missing photos", "Se necesita al menos 1 imagen para la calibración.")
             return
 
-        self.calculate_patterns()
+        self.calculate_patterns(on_finish=self.destroy_if_patterns_complete)
+
+    def destroy_if_patterns_complete(self):
         if len(self.photos_taken) != len(self.image_information):
             return
 
@@ -180,17 +209,31 @@ class CalibrateKinectInterface:
             return
 
         image_obj = list(self.photos_taken.values())[self.current_index][KinectFrames.COLOR.name]
-        image = Image.fromarray(image_obj.image_transform_class.invert(image_obj.image))
-        image = image.resize(self.window_image_size)
-        photo = ImageTk.PhotoImage(image)
-        self.last_image.config(image=photo)
-        self.last_image.image = photo
+        if not image_obj.is_loaded() and image_obj.thumbnail is not None:
+            # Show the thumbnail at once while browsing, the full image is loaded if the photo is still selected
+            self.show_image(image_obj=image_obj, image=image_obj.thumbnail)
+            self.window.after(PHOTO_FULL_RESOLUTION_DELAY_MS, self.update_full_resolution_image, self.current_index)
+        else:
+            self.show_image(image_obj=image_obj, image=image_obj.image)
 
         self.index_label.config(text="{} / {}".format(self.current_index + 1, len(self.photos_taken)))
         self.prev_button.config(state=tk.NORMAL)
         self.button_delete_photo.config(state=tk.NORMAL)
         self.next_button.config(state=tk.NORMAL)
 
+    def update_full_resolution_image(self, index):
+        if index != self.current_index or index >= len(self.photos_taken):
+            return
+        image_obj = list(self.photos_taken.values())[index][KinectFrames.COLOR.name]
+        self.show_image(image_obj=image_obj, image=image_obj.image)
+
+    def show_image(self, image_obj, image):
+        image = Image.fromarray(image_obj.image_transform_class.invert(image))
+        image = image.resize(self.window_image_size)
+        photo = ImageTk.PhotoImage(image)
+        self.last_image.config(image=photo)
+        self.last_image.image = photo
+
     # endregion
 
     # region Manage Buttons Image
@@ -218,7 +261,8 @@ class CalibrateKinectInterface:
 
     def delete_image_name(self, image_name):
         if self.photos_taken and image_name in self.photos_taken.keys():
-            self.photos_taken.pop(image_name)
+            for image_obj in self.photos_taken.pop(image_name).values():
+                image_obj.release()
             self.delete_image_information(image_name=image_name)
 
     def take_image(self):
@@ -226,29 +270,55 @@ class CalibrateKinectInterface:
 
         self.countdown_label.place(relx=0.5, rely=0.5, anchor="center")
         self.countdown_label.lift()
-        for i in range(3, 0, -1):
-            self.countdown(i)
-            self.window.update()
-            self.window.after(1000)
+        self.take_image_countdown(number=3)
+
+    def take_image_countdown(self, number):
+        # Countdown with after, the window keeps responding while waiting
+        if number > 0:
+            self.countdown(number)
+            self.window.after(1000, lambda: self.take_image_countdown(number=number - 1))
+            return
+
+        self.countdown(number="...")
+        self.burst_future = self.kinect.capture_burst_async(
+            kinect_frames=[KinectFrames.COLOR, KinectFrames.INFRARED, KinectFrames.DEPTH])
+        self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_burst_capture)
+
+    def poll_burst_capture(self):
+        if self.burst_future is None:
+            return
+        if not self.burst_future.done():
+            self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_burst_capture)
+            return
 
         self.countdown_label.place_forget()
+        try:
+            images = self.burst_future.result()
+        except Exception as error:
+            logging.error(f"Cannot take image: {error}")
+            messagebox.showerror("Error", "No se han recibido imágenes de la Kinect, inténtalo de nuevo.")
+            self.enable_buttons()
+            return
+        finally:
+            self.burst_future = None
 
-        image_name = f'{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.jpg'
+        # Extension is added per stream when the images are saved
+        image_name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
         self.photos_taken[image_name] = {}
-        # GET RGB IMAGE
-        image = self.kinect.get_image(kinect_frame=KinectFrames.COLOR)
-        image_obj = ImageObject(image=image, image_transform_class=ImageTransformerRGB)
+        # RGB IMAGE (mean of the burst)
+        image_obj = ImageObject(image=images[KinectFrames.COLOR], image_transform_class=ImageTransformerRGB,
+                                memory_budget=self.memory_budget, thumbnail_width=PHOTO_THUMBNAIL_WIDTH)
         self.photos_taken[image_name][KinectFrames.COLOR.name] = image_obj
 
-        # GET IR IMAGE
-        image = self.kinect.get_image(kinect_frame=KinectFrames.INFRARED)
-        image_obj = ImageObject(image=image, image_transform_class=ImageTransformerIR)
+        # IR IMAGE (median of the burst)
+        image_obj = ImageObject(image=images[KinectFrames.INFRARED], image_transform_class=ImageTransformerIR,
+                                memory_budget=self.memory_budget)
         self.photos_taken[image_name][KinectFrames.INFRARED.name] = image_obj
 
-        # GET DEPTH IMAGE
-        image = self.kinect.get_image(kinect_frame=KinectFrames.DEPTH)
-        image_obj = ImageObject(image=image, image_transform_class=ImageTransformerDepth)
+        # DEPTH IMAGE (median of the valid depths of the burst)
+        image_obj = ImageObject(image=images[KinectFrames.DEPTH], image_transform_class=ImageTransformerDepth,
+                                memory_budget=self.memory_budget)
         self.photos_taken[image_name][KinectFrames.DEPTH.name] = image_obj
 
         self.current_index = len(self.photos_taken) - 1
@@ -275,113 +345,201 @@ class CalibrateKinectInterface:
             self.update_image()
 
     def calibrate_cameras(self):
-        self.calculate_patterns()
+        self.calculate_patterns(on_finish=self.calibrate_cameras_with_patterns)
 
-        # CALIBRATE CAMERAS RGB AND IR
-        obj_points = {}
-        img_points = {}
-        example_img = {}
+    def calibrate_cameras_with_patterns(self):
+        # CALIBRATE CAMERAS RGB AND IR, ONE PROCESS PER CAMERA
+        if not self.image_information:
+            messagebox.showerror("Missing photos", "Se necesita al menos 1 imagen con patrón para la calibración.")
+            return
+
+        self.disable_buttons()
+        self.camera_solver = CameraCalibrationSolver(max_workers=len(CALIBRATE_PATTERN_IMAGES))
         for calibrate_cameras in CALIBRATE_PATTERN_IMAGES:
-            obj_points[calibrate_cameras] = []
-            img_points[calibrate_cameras] = []
-            example_img[calibrate_cameras] = None
-            for image_name, image_map in self.image_information.items():
-                obj_points[calibrate_cameras].append(image_map[calibrate_cameras][OBJ_POINTS_KEY])
-                img_points[calibrate_cameras].append(image_map[calibrate_cameras][IMG_POINTS_KEY])
-                example_img[calibrate_cameras] = self.photos_taken[image_name][calibrate_cameras]
-
-            rms, camera_matrix, dist_coefs, rvecs, tvecs = cv2.calibrateCamera(obj_points[calibrate_cameras],
-                                                                               img_points[calibrate_cameras],
-                                                                               example_img[calibrate_cameras].image_shape[::-1],
-                                                                               None,
-                                                                               None,
-                                                                               criteria=(
-                                                                                   cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER,
-                                                                                   120, 0.001),
-                                                                               flags=0)
+            image_names = list(self.image_information.keys())
+            example_img = self.photos_taken[image_names[-1]][calibrate_cameras]
+            self.camera_solver.submit(
+                stream=calibrate_cameras,
+                obj_points=[self.image_information[name][calibrate_cameras][OBJ_POINTS_KEY] for name in image_names],
+                img_points=[self.image_information[name][calibrate_cameras][IMG_POINTS_KEY] for name in image_names],
+                image_size=example_img.image_shape[::-1], view_names=image_names)
+
+        self.countdown_label.place(relx=0.5, rely=0.05, anchor="n")
+        self.countdown_label.lift()
+        self.countdown_label.config(text="Calibrando cámaras", font=("Helvetica", 25))
+        self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_camera_calibrations)
+
+    def poll_camera_calibrations(self):
+        if self.camera_solver is None:
+            return
+        try:
+            finished = self.camera_solver.poll()
+        except Exception as error:
+            logging.error(f"Cannot calibrate cameras: {error}")
+            messagebox.showerror("Error", "No se han podido calibrar las cámaras, revisa las imágenes con patrón.")
+            self.camera_solver.shutdown()
+            self.camera_solver = None
+            self.countdown_label.place_forget()
+            self.enable_buttons()
+            return
+        if not finished:
+            self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_camera_calibrations)
+            return
 
+        image_names = list(self.image_information.keys())
+        for calibrate_cameras in CALIBRATE_PATTERN_IMAGES:
+            result = self.camera_solver.results[calibrate_cameras]
             self.camera_information[calibrate_cameras] = {
-                CAMERA_CALIBRATION_VARIABLE: camera_matrix,
-                CAMERA_DISTORTION_VARIABLE: dist_coefs,
-                CAMERA_ROTATION_VARIABLE: rvecs,
-                CAMERA_TRANSLATION_VARIABLE: tvecs,
-                IMG_SHAPE_KEY: example_img[calibrate_cameras].image_shape,
-                OBJ_POINTS_KEY: obj_points[calibrate_cameras],
-                IMG_POINTS_KEY: img_points[calibrate_cameras]
+                CAMERA_CALIBRATION_VARIABLE: result["camera_matrix"],
+                CAMERA_DISTORTION_VARIABLE: result["dist_coefs"],
+                CAMERA_ROTATION_VARIABLE: result["rvecs"],
+                CAMERA_TRANSLATION_VARIABLE: result["tvecs"],
+                IMG_SHAPE_KEY: self.photos_taken[image_names[-1]][calibrate_cameras].image_shape,
+                OBJ_POINTS_KEY: [self.image_information[name][calibrate_cameras][OBJ_POINTS_KEY]
+                                 for name in image_names],
+                IMG_POINTS_KEY: [self.image_information[name][calibrate_cameras][IMG_POINTS_KEY]
+                                 for name in image_names]
             }
 
+        self.camera_solver.shutdown()
+        self.camera_solver = None
+        self.countdown_label.place_forget()
+        self.enable_buttons()
         self.exit_after()
 
-    def calculate_patterns(self):
+    def calculate_patterns(self, on_finish=None):
+        if on_finish is not None:
+            self.patterns_finished_callbacks.append(on_finish)
+        if self.pattern_detector is not None:
+            # Detection already running, on_finish is called when it ends
+            return
+
         # Check if we have the pattern size
         board_x_value = self.entry_size_x.get()
         board_y_value = self.entry_size_y.get()
         if not board_x_value or not board_y_value:
             messagebox.showerror("Missing argument", "Se necesita el tamaño del tablero para calcular los patrones.")
+            self.patterns_finished_callbacks.clear()
             return
         self.pattern_size = (int(board_x_value), int(board_y_value))
 
         board_size_value = self.entry_size_z.get()
         if not board_size_value:
             messagebox.showerror("Missing argument", "Se necesita el tamaño del cuadrado para calcular los patrones.")
+            self.patterns_finished_callbacks.clear()
             return
         self.board_size = float(board_size_value)
 
-        # Stop all interactions with window
+        # SEARCH PATTERN CHESS IN BACKGROUND PROCESSES
+        images_to_detect = [image_name for image_name in self.photos_taken.keys()
+                            if image_name not in self.image_information.keys()]
+        if not images_to_detect:
+            self.finish_patterns()
+            return
+
+        # Stop interactions that change the photos, browsing is still allowed
         self.disable_buttons()
+        self.prev_button.config(state=tk.NORMAL)
+        self.next_button.config(state=tk.NORMAL)
 
-        self.countdown_label.place(relx=0.5, rely=0.5, anchor="center")
+        self.pattern_detector = PatternDetector(corner_cache=self.corner_cache)
+        self.pending_corners = {}
+        self.image_names_to_delete = []
+        for image_name in images_to_detect:
+            self.pending_corners[image_name] = {}
+            for type_image in CALIBRATE_PATTERN_IMAGES:
+                image_obj = self.photos_taken[image_name][type_image]
+                self.pattern_detector.submit(key=(image_name, type_image), image=image_obj.image,
+                                             pattern_size=self.pattern_size,
+                                             image_transform_class=image_obj.image_transform_class,
+                                             cache_image=self.get_cache_image(image_obj=image_obj,
+                                                                              type_image=type_image))
+
+        self.countdown_label.place(relx=0.5, rely=0.05, anchor="n")
         self.countdown_label.lift()
-        self.countdown_label.config(text="Calculando Patrones...", font=("Helvetica", 25))
-
-        self.window.update()
+        self.countdown_label.config(text=f"Calculando Patrones 0/{self.pattern_detector.total}",
+                                    font=("Helvetica", 25))
+        self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_patterns)
+
+    @staticmethod
+    def get_cache_image(image_obj, type_image):
+        # Corner cache key of new photos: the pixels read from their file in the next session (lossy .jpg)
+        extension = CALIBRATION_IMAGE_EXTENSIONS[type_image]
+        if image_obj.source_path is not None or extension in LOSSLESS_EXTENSIONS:
+            return None
+        return image_obj.image_transform_class.encode_decode(image=image_obj.initial_image, extension=extension)
+
+    def poll_patterns(self):
+        if self.pattern_detector is None:
+            return
 
-        # SEARCH PATTERN CHESS
         pattern_points = np.zeros((np.prod(self.pattern_size), 3), np.float32)
         pattern_points[:, :2] = np.indices(self.pattern_size).T.reshape(-1, 2)
         pattern_points *= self.board_size
 
-        image_names_to_delete = []
-        total_images_used = len(self.photos_taken.keys())
-        for image_name, image_map in self.photos_taken.items():
-            if image_name in self.image_information.keys():
+        updated_images = False
+        for (image_name, type_image), corners in self.pattern_detector.poll():
+            if image_name not in self.pending_corners.keys() or image_name not in self.photos_taken.keys():
                 continue
 
-            corners_map = {}
-            for type_image in CALIBRATE_PATTERN_IMAGES:
-                image_obj = image_map[type_image]
+            if corners is None:
+                self.pending_corners.pop(image_name)
+                self.image_names_to_delete.append(image_name)
+                continue
+
+            self.pending_corners[image_name][type_image] = corners
+            if len(self.pending_corners[image_name]) < len(CALIBRATE_PATTERN_IMAGES):
+                continue
+
+            # Both cameras found the pattern, store it and draw the corners
+            corners_map = self.pending_corners.pop(image_name)
+            self.image_information[image_name] = {}
+            for type_image_found in CALIBRATE_PATTERN_IMAGES:
+                image_obj = self.photos_taken[image_name][type_image_found]
                 image_transform_class = image_obj.image_transform_class
+                image_with_corners = image_transform_class.draw_chessboard_corners(
+                    image=image_obj.get_writable_image(), pattern_size=self.pattern_size,
+                    corners=corners_map[type_image_found])
+                image_obj.update(image=image_with_corners)
+
+                self.image_information[image_name][type_image_found] = {
+                    OBJ_POINTS_KEY: pattern_points,
+                    IMG_POINTS_KEY: corners_map[type_image_found].reshape(-1, 2)
+                }
+            updated_images = True
+
+        self.countdown_label.config(
+            text=f"Calculando Patrones {self.pattern_detector.completed}/{self.pattern_detector.total}")
+        if updated_images:
+            self.update_image()
+            self.button_delete_photo.config(state=tk.DISABLED)
+            self.countdown_label.lift()
+
+        if not self.pattern_detector.is_finished():
+            self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_patterns)
+            return
 
-                ret, corners = image_transform_class.find_chessboard_corners(image=image_obj.image,
-                                                                             pattern_size=self.pattern_size)
-                if ret:
-                    corners_map[type_image] = image_transform_class.calculate_sub_pix_corner(image=image_obj.image,
-                                                                                             corners=corners)
-
-                    image_with_corners = image_transform_class.draw_chessboard_corners(image=image_obj.image,
-                                                                                       pattern_size=self.pattern_size,
-                                                                                       corners=corners)
-
-                    image_obj.update(image=image_with_corners)
-                else:
-                    image_names_to_delete.append(image_name)
-                    total_images_used -= 1
-                    break
-            else:
-                self.image_information[image_name] = {}
-                for type_image in CALIBRATE_PATTERN_IMAGES:
-                    self.image_information[image_name][type_image] = {
-                        OBJ_POINTS_KEY: pattern_points,
-                        IMG_POINTS_KEY: corners_map[type_image].reshape(-1, 2)
-                    }
+        self.pattern_detector.log_statistics()
+        self.pattern_detector.shutdown()
+        # Photos whose detection failed are kept without pattern, "Calcular Patrones" searches them again
+        failed_image_names = sorted({image_name for image_name, _ in self.pattern_detector.failed
+                                     if image_name not in self.image_names_to_delete})
+        for image_name in failed_image_names:
+            self.pending_corners.pop(image_name, None)
+        self.pattern_detector = None
+        # Every photo of the session has been searched, entries of deleted photos can be dropped
+        if not failed_image_names:
+            self.corner_cache.save(prune=True)
+        else:
+            self.corner_cache.save()
 
         # DELETE UNNECESSARY IMAGES
-        if image_names_to_delete:
-            for image_name in image_names_to_delete:
+        if self.image_names_to_delete:
+            for image_name in self.image_names_to_delete:
                 self.delete_image_name(image_name=image_name)
 
             messagebox.showwarning("Fotos eliminadas",
-                                   f"Se han eliminado {len(image_names_to_delete)} fotos dado que el patrón no se encuentra.")
+                                   f"Se han eliminado {len(self.image_names_to_delete)} fotos dado que el patrón no se encuentra.")
 
         self.current_index = len(self.photos_taken) - 1
 
@@ -389,7 +547,19 @@ class CalibrateKinectInterface:
         self.enable_buttons()
 
         self.countdown_label.place_forget()
-
         self.update_image()
 
+        if failed_image_names:
+            # Do not calibrate or exit with photos left unsearched
+            self.patterns_finished_callbacks.clear()
+            messagebox.showerror("Error", f"Ha fallado la búsqueda del patrón en {len(failed_image_names)} fotos, "
+                                          f"se mantienen para volver a calcular los patrones.")
+        self.finish_patterns()
+
+    def finish_patterns(self):
+        callbacks = self.patterns_finished_callbacks
+        self.patterns_finished_callbacks = []
+        for callback in callbacks:
+            callback()
+
     # endregion
\ No newline at end of file
@@ -1,14 +1,17 @@
+import logging
 import tkinter as tk
 from datetime import datetime
 from tkinter import messagebox, ttk
 import numpy as np
 
 from image_management.ImageObject import ImageObject
+from image_management.PatternDetector import PatternDetector
 from image_management.ImageTransformerDepth import ImageTransformerDepth
 from image_management.ImageTransformerIR import ImageTransformerIR
-from image_management.ImageGenerator import ImageGenerator
+from image_management.PatternRenderer import PatternRenderer
 from image_management.ImageTransformerRGB import ImageTransformerRGB
-from literals import PATTERN_MOVE_SCALAR, PATTERN_RESIZE_SCALAR, KinectFrames
+from kinect_controller.KinectLock import lock
+from literals import PATTERN_MOVE_SCALAR, PATTERN_RESIZE_SCALAR, KinectFrames, PATTERN_DETECTION_POLL_MS
 
 from PIL import Image, ImageTk
 
@@ -43,12 +46,20 @@ class CalibrateKinectProjectorInterface:
         if pattern_image is not None:
             self.pattern_projected_position = (0, 0)
             self.pattern_projected_size = pattern_image.shape[:2]
+            self.pattern_renderer = PatternRenderer(pattern_image=pattern_image,
+                                                    shape=(projector_screen.width_resolution,
+                                                           projector_screen.height_resolution))
 
         self.object_points = {}
         self.image_points = {}
         self.depth_points = {}
         self.image_shape = None
 
+        # Pattern detection running in background processes
+        self.pattern_detector = None
+        self.patterns_finished_callbacks = []
+        self.image_names_to_delete = []
+
         self.window_image_size = window_image_size
         self.not_found_image = not_found_image
 
@@ -154,6 +165,8 @@ class CalibrateKinectProjectorInterface:
     def on_closing(self):
         if messagebox.askokcancel("Cerrar", "¿Seguro que quieres cerrar la ventana? El proceso terminará."):
             self.process_interrupted = True
+            if self.pattern_detector is not None:
+                self.pattern_detector.shutdown()
             self.window.destroy()
 
     def countdown(self, number):
@@ -165,7 +178,9 @@ class CalibrateKinectProjectorInterface:
             messagebox.showerror("Missing photos", "Se necesita al menos 1 imagen para la calibración.")
             return
 
-        self.calculate_patterns()
+        self.calculate_patterns(on_finish=self.destroy_if_patterns_complete)
+
+    def destroy_if_patterns_complete(self):
         if len(self.photos_taken) != len(self.object_points):
             return
 
@@ -264,18 +279,13 @@ class CalibrateKinectProjectorInterface:
         self.update_projected_pattern()
 
     def update_projected_pattern(self):
-        if self.checkbox_value.get():
-            # Generate new image
-            new_image = ImageGenerator.generate_image_with_other_image(image=self.pattern_image,
-                                                                       position=self.pattern_projected_position,
-                                                                       image_shape=self.pattern_projected_size,
-                                                                       shape=(self.projector_screen.width_resolution,
-                                                                              self.projector_screen.height_resolution),
-                                                                       background_color=(0, 0, 0))
-        else:
-            new_image = ImageGenerator.generate_color_image(
-                shape=(self.projector_screen.width_resolution, self.projector_screen.height_resolution),
-                color=(0, 0, 0))
+        # Lock: the projector window thread shows the same canvas that is being modified
+        with lock:
+            if self.checkbox_value.get():
+                new_image = self.pattern_renderer.render(position=self.pattern_projected_position,
+                                                         image_shape=self.pattern_projected_size)
+            else:
+                new_image = self.pattern_renderer.clear()
         self.projector_window.update_image(image=new_image)
 
     # endregion
@@ -316,22 +326,33 @@ class CalibrateKinectProjectorInterface:
 
         self.countdown_label.place_forget()
 
+        # GET THE CLOSEST FRAMES IN ARRIVAL TIME OF EVERY STREAM
+        try:
+            bundle = self.kinect.get_bundle(kinect_frames=[KinectFrames.COLOR, KinectFrames.DEPTH,
+                                                           KinectFrames.INFRARED])
+        except RuntimeError as error:
+            logging.error(f"Cannot take image: {error}")
+            messagebox.showerror("Error", "No se han recibido imágenes de la Kinect, inténtalo de nuevo.")
+            self.enable_buttons()
+            return
+        logging.debug(f"Frame bundle skew: {bundle.skew * 1000:.1f} ms")
+
         image_name = f'{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.png'
 
         self.photos_taken[image_name] = {}
         # GET RGB IMAGE
-        image = self.kinect.get_image(kinect_frame=KinectFrames.COLOR)
+        image = bundle.images[KinectFrames.COLOR]
         image_processor = ImageObject(image=image)
         self.photos_taken[image_name][KinectFrames.COLOR.name] = image_processor
 
         # GET DEPTH IMAGE
-        image = self.kinect.get_image(kinect_frame=KinectFrames.DEPTH)
+        image = bundle.images[KinectFrames.DEPTH]
         image = ImageTransformerDepth.normalize(image=image)
         image_processor = ImageObject(image=image)
         self.photos_taken[image_name][KinectFrames.DEPTH.name] = image_processor
 
         # GET IR IMAGE
-        image = self.kinect.get_image(kinect_frame=KinectFrames.INFRARED)
+        image = bundle.images[KinectFrames.INFRARED]
         image = ImageTransformerIR.normalize(image=image)
         image_processor = ImageObject(image=image)
         self.photos_taken[image_name][KinectFrames.INFRARED.name] = image_processor
@@ -366,65 +387,96 @@ class CalibrateKinectProjectorInterface:
 
             self.update_image()
 
-    def calculate_patterns(self):
+    def calculate_patterns(self, on_finish=None):
+        if on_finish is not None:
+            self.patterns_finished_callbacks.append(on_finish)
+        if self.pattern_detector is not None:
+            # Detection already running, on_finish is called when it ends
+            return
+
         # Check if we have the pattern size
         board_x_value = self.entry_size_x.get()
         board_y_value = self.entry_size_y.get()
         if not board_x_value or not board_y_value:
             messagebox.showerror("Missing argument", "Se necesita el tamaño del tablero para calcular los patrones.")
+            self.patterns_finished_callbacks.clear()
             return
         self.pattern_size = (int(board_x_value), int(board_y_value))
 
-        # Stop all interactions with window
+        # CALCULATE PATTERNS IN BACKGROUND PROCESSES
+        images_to_detect = [image_name for image_name in self.photos_taken.keys()
+                            if image_name not in self.object_points.keys()]
+        if not images_to_detect:
+            self.finish_patterns()
+            return
+
+        # Stop interactions that change the photos, browsing is still allowed
         self.disable_buttons()
+        self.prev_button.config(state=tk.NORMAL)
+        self.next_button.config(state=tk.NORMAL)
 
-        self.countdown_label.place(relx=0.5, rely=0.5, anchor="center")
+        self.pattern_detector = PatternDetector()
+        self.image_names_to_delete = []
+        for image_name in images_to_detect:
+            color_img = self.photos_taken[image_name][KinectFrames.COLOR.name]
+            self.image_shape = color_img.image_shape
+            self.pattern_detector.submit(key=image_name, image=color_img.image, pattern_size=self.pattern_size,
+                                         image_transform_class=ImageTransformerRGB)
+
+        self.countdown_label.place(relx=0.5, rely=0.05, anchor="n")
         self.countdown_label.lift()
-        self.countdown_label.config(text="Calculando Patrones...", font=("Helvetica", 25))
+        self.countdown_label.config(text=f"Calculando Patrones 0/{self.pattern_detector.total}",
+                                    font=("Helvetica", 25))
+        self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_patterns)
 
-        self.window.update()
+    def poll_patterns(self):
+        if self.pattern_detector is None:
+            return
 
-        # CALCULATE PATTERNS
         pattern_points = np.zeros((np.prod(self.pattern_size), 3), np.float32)
         pattern_points[:, :2] = np.indices(self.pattern_size).T.reshape(-1, 2)
 
-        image_names_to_delete = []
-        for image_name, image_map in self.photos_taken.items():
-            if image_name in self.object_points.keys():
+        updated_images = False
+        for image_name, corners in self.pattern_detector.poll():
+            if image_name not in self.photos_taken.keys():
                 continue
 
-            color_img = image_map[KinectFrames.COLOR.name]
-            self.image_shape = color_img.image_shape
-            depth_img = image_map[KinectFrames.DEPTH.name]
-
-            ret, corners = ImageTransformerRGB.find_chessboard_corners(image=color_img, pattern_size=self.pattern_size)
-            if ret:
-                self.object_points[image_name] = pattern_points
-                self.image_points[image_name] = corners
-
-                # depth_points = []
-                # for corner in corners:
-                #     x, y = int(corner[0][0]), int(corner[0][1])
-                #     x_transformed, y_transformed = transform_cords(point=(x, y), original_size=rgb_img.image_shape,
-                #                                                    new_size=depth_img.image_shape)
-                #     depth = depth_img.image[y_transformed, x_transformed]
-                #     if depth == 0:
-                #         continue
-                #     depth_points.append([x, y, depth])
-                # self.depth_points[image_name] = depth_points
-
-                # TODO ADD SUBPIX???
-                color_img = ImageTransformerRGB.draw_chessboard_corners(image=color_img, pattern_size=self.pattern_size,
-                                                                        corners=corners)
-            else:
-                # Delete image
-                image_names_to_delete.append(image_name)
+            if corners is None:
+                self.image_names_to_delete.append(image_name)
+                continue
+
+            self.object_points[image_name] = pattern_points
+            self.image_points[image_name] = corners
+
+            color_img = self.photos_taken[image_name][KinectFrames.COLOR.name]
+            color_img.update(image=ImageTransformerRGB.draw_chessboard_corners(image=color_img.image,
+                                                                               pattern_size=self.pattern_size,
+                                                                               corners=corners))
+            updated_images = True
+
+        self.countdown_label.config(
+            text=f"Calculando Patrones {self.pattern_detector.completed}/{self.pattern_detector.total}")
+        if updated_images:
+            self.update_image()
+            self.button_delete_photo.config(state=tk.DISABLED)
+            self.countdown_label.lift()
+
+        if not self.pattern_detector.is_finished():
+            self.window.after(PATTERN_DETECTION_POLL_MS, self.poll_patterns)
+            return
 
-        if image_names_to_delete:
-            for image_name in image_names_to_delete:
+        self.pattern_detector.log_statistics()
+        self.pattern_detector.shutdown()
+        # Photos whose detection failed are kept without pattern, "Calcular Patrones" searches them again
+        failed_image_names = [image_name for image_name in self.pattern_detector.failed
+                              if image_name in self.photos_taken.keys()]
+        self.pattern_detector = None
+
+        if self.image_names_to_delete:
+            for image_name in self.image_names_to_delete:
                 self.photos_taken.pop(image_name)
             messagebox.showwarning("Fotos eliminadas",
-                                   f"Se han eliminado {len(image_names_to_delete)} fotos dado que el patrón no se encuentra.")
+                                   f"Se han eliminado {len(self.image_names_to_delete)} fotos dado que el patrón no se encuentra.")
 
         self.current_index = len(self.photos_taken) - 1
 
@@ -432,7 +484,19 @@ class CalibrateKinectProjectorInterface:
         self.enable_buttons()
 
         self.countdown_label.place_forget()
-
         self.update_image()
 
+        if failed_image_names:
+            # Do not exit with photos left unsearched
+            self.patterns_finished_callbacks.clear()
+            messagebox.showerror("Error", f"Ha fallado la búsqueda del patrón en {len(failed_image_names)} fotos, "
+                                          f"se mantienen para volver a calcular los patrones.")
+        self.finish_patterns()
+
+    def finish_patterns(self):
+        callbacks = self.patterns_finished_callbacks
+        self.patterns_finished_callbacks = []
+        for callback in callbacks:
+            callback()
+
     # endregion
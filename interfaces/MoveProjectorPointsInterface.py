@@ -8,6 +8,8 @@ from image_management.ImageObject import ImageObject
 from image_management.ImageGenerator import ImageGenerator
 from image_management.ImageTransformerBase import ImageTransformerBase
 from kinect_controller.KinectController import KinectFrames
+from kinect_controller.KinectFrameProducer import KinectFrameProducer
+from literals import KINECT_BACKGROUND_REFRESH_MS
 
 
 def instantiate_move_projector_interface(kinect, rgb_points, projector_window, principal_screen):
@@ -40,6 +42,9 @@ class MoveProjectorPointsInterface:
 
         self.image_processor_kinect = None
         self.image_processor_projector = None
+        self.kinect_image_size = None
+        self.frame_producer = None
+        self.frame_sequence = None
 
         self.actual_point_kinect = None
         self.actual_point_projector = None
@@ -72,7 +77,7 @@ class MoveProjectorPointsInterface:
         # SHOW KINECT IMAGE
         self.photo = None
         self.photo_obj = None
-        self.show_kinect_image()
+        self.show_kinect_image(image=self.image_processor_kinect.image)
 
         # GENERATE KINECT POINT IN CANVAS
         self.point = None
@@ -83,12 +88,16 @@ class MoveProjectorPointsInterface:
         self.generate_project_point()
         self.draw_projector_point()
 
-        # UPDATE IMAGE BACKGROUND LOOP
+        # UPDATE IMAGE BACKGROUND LOOP (frames are grabbed, undistorted and resized in the producer thread)
+        self.frame_producer = KinectFrameProducer(kinect=self.kinect, output_size=self.window_size,
+                                                  kinect_frame=KinectFrames.COLOR, avoid_camera_focus=True)
+        self.frame_producer.start()
         self.update_background_loop()
 
     def on_closing(self):
         if messagebox.askokcancel("Cerrar", "¿Seguro que quieres cerrar la ventana? El proceso terminará."):
             self.process_interrupted = True
+            self.frame_producer.stop()
             self.window.destroy()
 
     def get_kinect_point(self):
@@ -97,8 +106,8 @@ class MoveProjectorPointsInterface:
     def draw_kinect_point(self):
         # CANVAS
         kinect_point_scaled = (
-            (self.actual_point_kinect[0] / self.image_processor_kinect.width * self.window_size[0]),
-            (self.actual_point_kinect[1] / self.image_processor_kinect.height * self.window_size[1])
+            (self.actual_point_kinect[0] / self.kinect_image_size[0] * self.window_size[0]),
+            (self.actual_point_kinect[1] / self.kinect_image_size[1] * self.window_size[1])
         )
         self.canvas.delete(self.point)
 
@@ -124,25 +133,27 @@ class MoveProjectorPointsInterface:
         self.points.append(deepcopy(self.actual_point_projector))
 
     def update_background_loop(self):
-        if self.kinect.check_if_new_image(kinect_frame=KinectFrames.COLOR):
-            image_kinect = self.kinect.get_image_calibrate(kinect_frame=KinectFrames.COLOR, avoid_camera_focus=True)
-            self.image_processor_kinect = ImageObject(image=image_kinect)
-            self.show_kinect_image()
+        # Only the PhotoImage swap happens in the Tk thread
+        self.frame_sequence, image, source_size = self.frame_producer.get_latest(sequence=self.frame_sequence)
+        if image is not None:
+            self.kinect_image_size = source_size
+            self.show_kinect_image(image=image, resize=False)
 
-        self.window.after(30, self.update_background_loop)
+        self.window.after(KINECT_BACKGROUND_REFRESH_MS, self.update_background_loop)
 
     def get_kinect_image(self):
         if self.kinect.check_if_new_image(kinect_frame=KinectFrames.COLOR):
             image_kinect = self.kinect.get_image(kinect_frame=KinectFrames.COLOR)
             self.image_processor_kinect = ImageObject(image=image_kinect)
+            self.kinect_image_size = (self.image_processor_kinect.width, self.image_processor_kinect.height)
 
     def generate_projector_image(self):
         background_color_image = ImageGenerator.generate_color_image(shape=self.projector_window.resolution)
         self.image_processor_projector = ImageObject(image=background_color_image)
 
-    def show_kinect_image(self):
-        image = Image.fromarray(self.image_processor_kinect.image[..., ::-1])
-        image = image.resize(self.window_size)
+    def show_kinect_image(self, image, resize=True):
+        # Images from the producer are already RGB with the canvas size
+        image = Image.fromarray(image[..., ::-1]).resize(self.window_size) if resize else Image.fromarray(image)
         self.photo = ImageTk.PhotoImage(image)
         if self.photo_obj:
             self.canvas.itemconfig(self.photo_obj, image=self.photo)
@@ -189,6 +200,7 @@ class MoveProjectorPointsInterface:
         self.draw_projector_point()
 
     def accept_polygon(self):
+        self.frame_producer.stop()
         self.window.destroy()
 
     def accept_polygon_after(self):
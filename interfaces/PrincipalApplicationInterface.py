@@ -5,7 +5,10 @@ import cv2
 from PIL import Image, ImageTk
 
 from image_management.ApplicationController import SharedConfig
-from literals import ConfigControllerNamesEnum, ConfigControllerSliderEnum, ConfigControllerEnum
+from literals import ConfigControllerNamesEnum, ConfigControllerSliderEnum, ConfigControllerEnum, PREVIEW_SIZE, \
+    PREVIEW_REFRESH_MS, METRICS_REFRESH_MS
+from performance.PipelineMetrics import pipeline_metrics
+from performance.StageInstrumentation import instrumentation
 
 
 def instantiate_principal_application_interface(config, principal_screen):
@@ -58,15 +61,31 @@ class PrincipalApplicationInterface:
 
         tk.Button(self.controls_frame, text="Reiniciar Imagen", command=self.reset_image).pack(pady=5)
 
+        tk.Button(self.controls_frame, text="Recargar calibración", command=self.reload_calibration).pack(pady=5)
+
         tk.Button(self.controls_frame, text="Actualizar configuración", command=self.update_config).pack(pady=10)
 
+        # INSTRUMENTATION CONTROLS
+        self.instrumentation_value = tk.BooleanVar(self.controls_frame, value=instrumentation.enabled)
+        ttk.Checkbutton(self.controls_frame, text="Medir tiempos por etapa", variable=self.instrumentation_value,
+                        command=self.toggle_instrumentation).pack(anchor="w")
+        tk.Button(self.controls_frame, text="Resumen de tiempos", command=self.show_instrumentation_summary).pack(pady=5)
+
         self.image_label = tk.Label(self.image_frame)
         self.image_label.grid(row=0, column=0, pady=5)
 
         self.second_image_label = tk.Label(self.image_frame)
         self.second_image_label.grid(row=1, column=0, pady=5)
 
+        # LIVE METRICS PANEL
+        metrics_frame = tk.LabelFrame(self.image_frame, text="Rendimiento")
+        metrics_frame.grid(row=2, column=0, sticky="we", pady=5)
+        self.metrics_label = tk.Label(metrics_frame, text="", justify="left", anchor="w", font=("Courier", 9))
+        self.metrics_label.pack(fill="x", padx=5, pady=5)
+
+        self.preview_version = None
         self.update_image()
+        self.update_metrics()
 
     def add_entry(self, frame, label_text, varname):
         tk.Label(frame, text=label_text).pack(anchor="w")
@@ -95,6 +114,29 @@ class PrincipalApplicationInterface:
         self.config.update(RESET_IMAGE=True)
         messagebox.showinfo("Imagen", "Flag de reset de imagen activado.")
 
+    def reload_calibration(self):
+        self.config.request_calibration_reload()
+        messagebox.showinfo("Calibración", "Las calibraciones se recargarán sin detener la proyección.")
+
+    def toggle_instrumentation(self):
+        if self.instrumentation_value.get():
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+
+    def show_instrumentation_summary(self):
+        summary = instrumentation.format_summary()
+        instrumentation.log_summary()
+
+        summary_window = tk.Toplevel(self.root)
+        summary_window.title("Resumen de tiempos")
+        text = tk.Text(summary_window, width=len(summary.splitlines()[0]) + 2, height=30, font=("Courier", 9))
+        text.insert(tk.END, summary)
+        text.config(state=tk.DISABLED)
+        text.pack(fill="both", expand=True)
+        tk.Button(summary_window, text="Reiniciar contadores",
+                  command=lambda: (instrumentation.reset(), summary_window.destroy())).pack(pady=5)
+
     def update_config(self):
         try:
             values = {}
@@ -130,32 +172,25 @@ class PrincipalApplicationInterface:
             messagebox.showerror("Error de validación", str(e))
 
     def update_image(self):
-        with self.config.lock:
-            frame = self.config.current_image
-            second = self.config.second_image
-
-        if frame is not None:
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_img = Image.fromarray(rgb).resize((320, 240))
-            tk_img = ImageTk.PhotoImage(pil_img)
-            self.image_label.config(image=tk_img)
-            self.image_label.image = tk_img
+        # Previews are already RGB and preview sized, only repaint when the projector thread published new ones
+        version, frame, second = self.config.get_previews()
+        if version != self.preview_version:
+            self.preview_version = version
+            self.show_preview(label=self.image_label, preview=frame, background=(80, 80, 80))
+            self.show_preview(label=self.second_image_label, preview=second, background=(120, 120, 120))
+
+        self.root.after(PREVIEW_REFRESH_MS, self.update_image)
+
+    def update_metrics(self):
+        self.metrics_label.config(text=pipeline_metrics.format_summary())
+        self.root.after(METRICS_REFRESH_MS, self.update_metrics)
+
+    @staticmethod
+    def show_preview(label, preview, background):
+        if preview is not None:
+            pil_img = Image.fromarray(preview)
         else:
-            pil_img = Image.new("RGB", (320, 240), color=(80, 80, 80))
-            tk_img = ImageTk.PhotoImage(pil_img)
-            self.image_label.config(image=tk_img)
-            self.image_label.image = tk_img
-
-        if second is not None:
-            rgb2 = cv2.cvtColor(second, cv2.COLOR_BGR2RGB)
-            pil_img2 = Image.fromarray(rgb2).resize((320, 240))
-            tk_img2 = ImageTk.PhotoImage(pil_img2)
-            self.second_image_label.config(image=tk_img2)
-            self.second_image_label.image = tk_img2
-        else:
-            pil_img2 = Image.new("RGB", (320, 240), color=(120, 120, 120))
-            tk_img2 = ImageTk.PhotoImage(pil_img2)
-            self.second_image_label.config(image=tk_img2)
-            self.second_image_label.image = tk_img2
-
-        self.root.after(100, self.update_image)
+            pil_img = Image.new("RGB", PREVIEW_SIZE, color=background)
+        tk_img = ImageTk.PhotoImage(pil_img)
+        label.config(image=tk_img)
+        label.image = tk_img
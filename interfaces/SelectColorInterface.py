@@ -1,11 +1,12 @@
 import tkinter as tk
-from copy import deepcopy
 from tkinter import messagebox, Scale
 
 import cv2
-import numpy as np
 from PIL import Image, ImageTk
 
+from image_management.HsvLutSegmenter import HsvLutSegmenter
+from literals import SLIDER_REFRESH_MS
+
 
 def instantiate_select_color_interface(image, principal_screen, window_size=(1920, 1080)):
     calibrate_window = tk.Tk()
@@ -24,10 +25,19 @@ class SelectColorInterface:
     def __init__(self, window, image, window_size=(1920, 1080)):
         # Necessary variables
         self.original_image = image
-        self.image = deepcopy(image)
-        self.hsv_image = cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV)
         self.window_size = window_size
 
+        # Conversions are done once over a copy with the window size, sliders only rebuild the LUTs
+        preview_image = cv2.resize(image, tuple(window_size), interpolation=cv2.INTER_AREA)
+        self.preview_rgb = cv2.cvtColor(preview_image, cv2.COLOR_BGR2RGB)
+        self.hsv_planes = cv2.split(cv2.cvtColor(preview_image, cv2.COLOR_BGR2HSV))
+        self.image = self.preview_rgb
+        self.segmenter = HsvLutSegmenter()
+        self.segment_job = None
+
+        self.lower_bound = None
+        self.upper_bound = None
+
         # Initiate window
         self.window = window
         self.window.title("Color Image Kinect")
@@ -45,12 +55,12 @@ class SelectColorInterface:
         self.update_image()
 
         # SLIDERS
-        self.h_lower_slider = Scale(window, from_=0, to=179, orient='horizontal', command=self.segment_color_image)
-        self.s_lower_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.segment_color_image)
-        self.v_lower_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.segment_color_image)
-        self.h_upper_slider = Scale(window, from_=0, to=179, orient='horizontal', command=self.segment_color_image)
-        self.s_upper_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.segment_color_image)
-        self.v_upper_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.segment_color_image)
+        self.h_lower_slider = Scale(window, from_=0, to=179, orient='horizontal', command=self.schedule_segment)
+        self.s_lower_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.schedule_segment)
+        self.v_lower_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.schedule_segment)
+        self.h_upper_slider = Scale(window, from_=0, to=179, orient='horizontal', command=self.schedule_segment)
+        self.s_upper_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.schedule_segment)
+        self.v_upper_slider = Scale(window, from_=0, to=255, orient='horizontal', command=self.schedule_segment)
 
         self.h_lower_slider.set(0)
         self.s_lower_slider.set(100)
@@ -97,27 +107,25 @@ class SelectColorInterface:
         self.image_label.config(image=segmented_image_tk)
         self.image_label.image = segmented_image_tk
 
-    def segment_color_image(self, *args):
-        h_lower = self.h_lower_slider.get()
-        s_lower = self.s_lower_slider.get()
-        v_lower = self.v_lower_slider.get()
-        h_upper = self.h_upper_slider.get()
-        s_upper = self.s_upper_slider.get()
-        v_upper = self.v_upper_slider.get()
-
-        lower_bound = np.array([h_lower, s_lower, v_lower])
-        upper_bound = np.array([h_upper, s_upper, v_upper])
+    def schedule_segment(self, *args):
+        # Slider events are coalesced, the image is segmented at most once per SLIDER_REFRESH_MS
+        if self.segment_job is None:
+            self.segment_job = self.window.after(SLIDER_REFRESH_MS, self.segment_color_image)
 
-        mask = cv2.inRange(self.hsv_image, lower_bound, upper_bound)
+    def read_sliders(self):
+        self.lower_bound = (self.h_lower_slider.get(), self.s_lower_slider.get(), self.v_lower_slider.get())
+        self.upper_bound = (self.h_upper_slider.get(), self.s_upper_slider.get(), self.v_upper_slider.get())
 
-        self.image = deepcopy(self.original_image)
+    def segment_color_image(self, *args):
+        self.segment_job = None
+        self.read_sliders()
 
-        segmented_image = cv2.bitwise_and(self.image, self.image, mask=mask)
-        segmented_image_rgb = cv2.cvtColor(segmented_image, cv2.COLOR_BGR2RGB)
-        self.image = segmented_image_rgb
+        self.segmenter.set_bounds(lower_bound=self.lower_bound, upper_bound=self.upper_bound)
+        self.image = self.segmenter.segment(image=self.preview_rgb, hsv_planes=self.hsv_planes)
         self.update_image()
 
     def accept(self):
+        self.read_sliders()
         self.window.destroy()
 
     def accept_after(self):
@@ -1,10 +1,12 @@
 import tkinter as tk
-from copy import deepcopy
 from tkinter import messagebox, Scale, HORIZONTAL
 
+import cv2
 import numpy as np
 from PIL import Image, ImageTk
 
+from literals import SLIDER_REFRESH_MS, DEPTH_HISTOGRAM_BINS, DEPTH_HISTOGRAM_SIZE, DEPTH_SLIDER_RANGE
+
 
 def instantiate_select_depth_interface(image, principal_screen, window_size=(1920, 1080)):
     calibrate_window = tk.Tk()
@@ -23,12 +25,17 @@ class SelectDepthInterface:
     def __init__(self, window, image, window_size=(1920, 1080)):
         # Necessary variables
         self.original_image = image
-        self.image = deepcopy(image)
         self.window_size = window_size
 
         self.minimum_depth = None
         self.maximum_depth = None
 
+        # Work is done once over a copy with the window size (nearest, depth values are not mixed)
+        self.preview_depth = cv2.resize(np.asarray(image), tuple(window_size), interpolation=cv2.INTER_NEAREST)
+        self.preview_display = cv2.normalize(self.preview_depth, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        self.image = self.preview_display
+        self.segment_job = None
+
         # Initiate window
         self.window = window
         self.window.title("Depth Image Kinect")
@@ -42,17 +49,28 @@ class SelectDepthInterface:
         self.photo_obj = None
         self.update_image()
 
-        # Sliders
-        self.slider_min = Scale(window, from_=0, to=1500, orient=HORIZONTAL, label="Profundidad Mínima",
-                                command=self.segment_depth_image)
+        # Sliders and depth histogram
+        self.controls_frame = tk.Frame(window)
+        self.controls_frame.pack()
+        sliders_frame = tk.Frame(self.controls_frame)
+        sliders_frame.pack(side=tk.LEFT, padx=10)
+
+        self.slider_min = Scale(sliders_frame, from_=DEPTH_SLIDER_RANGE[0], to=DEPTH_SLIDER_RANGE[1],
+                                orient=HORIZONTAL, label="Profundidad Mínima", command=self.schedule_segment)
         self.slider_min.set(0)
         self.slider_min.pack()
 
-        self.slider_max = Scale(window, from_=0, to=1500, orient=HORIZONTAL, label="Profundidad Máxima",
-                                command=self.segment_depth_image)
+        self.slider_max = Scale(sliders_frame, from_=DEPTH_SLIDER_RANGE[0], to=DEPTH_SLIDER_RANGE[1],
+                                orient=HORIZONTAL, label="Profundidad Máxima", command=self.schedule_segment)
         self.slider_max.set(255)
         self.slider_max.pack()
 
+        self.histogram_canvas = tk.Canvas(self.controls_frame, width=DEPTH_HISTOGRAM_SIZE[0],
+                                          height=DEPTH_HISTOGRAM_SIZE[1], bg="white")
+        self.histogram_canvas.pack(side=tk.LEFT, padx=10)
+        self.histogram_lines = []
+        self.draw_histogram()
+
         self.accept_button = tk.Button(window, text="Aceptar", command=self.accept_after)
         self.accept_button.pack()
 
@@ -65,25 +83,54 @@ class SelectDepthInterface:
             self.window.destroy()
 
     def update_image(self):
-        self.image = Image.fromarray(self.image)
-        self.image = self.image.resize(self.window_size)
-        self.photo = ImageTk.PhotoImage(self.image)
+        self.photo = ImageTk.PhotoImage(Image.fromarray(self.image))
         if self.photo_obj:
             self.canvas.itemconfig(self.photo_obj, image=self.photo)
         else:
             self.photo_obj = self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
 
-    def segment_depth_image(self, *args):
-        depth_array = np.array(deepcopy(self.original_image))
+    def draw_histogram(self):
+        # Computed once with the full resolution image, zeros are invalid depth
+        depth_values = np.asarray(self.original_image)
+        histogram, _ = np.histogram(depth_values[depth_values > 0], bins=DEPTH_HISTOGRAM_BINS,
+                                    range=DEPTH_SLIDER_RANGE)
+        width, height = DEPTH_HISTOGRAM_SIZE
+        bar_width = width / DEPTH_HISTOGRAM_BINS
+        maximum = max(int(histogram.max()), 1)
+        for index, count in enumerate(histogram):
+            bar_height = count / maximum * (height - 2)
+            self.histogram_canvas.create_rectangle(index * bar_width, height - bar_height, (index + 1) * bar_width,
+                                                   height, fill="gray40", outline="")
+        self.histogram_lines = [self.histogram_canvas.create_line(0, 0, 0, height, fill=color, width=2)
+                                for color in ["blue", "red"]]
+
+    def update_histogram_lines(self):
+        width, height = DEPTH_HISTOGRAM_SIZE
+        scale = width / (DEPTH_SLIDER_RANGE[1] - DEPTH_SLIDER_RANGE[0])
+        for line, depth in zip(self.histogram_lines, [self.minimum_depth, self.maximum_depth]):
+            x = (depth - DEPTH_SLIDER_RANGE[0]) * scale
+            self.histogram_canvas.coords(line, x, 0, x, height)
+
+    def schedule_segment(self, *args):
+        # Slider events are coalesced, the image is segmented at most once per SLIDER_REFRESH_MS
+        if self.segment_job is None:
+            self.segment_job = self.window.after(SLIDER_REFRESH_MS, self.segment_depth_image)
+
+    def read_sliders(self):
         self.minimum_depth = self.slider_min.get()
         self.maximum_depth = self.slider_max.get()
 
-        mask = (depth_array >= self.minimum_depth) & (depth_array <= self.maximum_depth)
-        segmented_array = np.where(mask, depth_array, 0)
-        self.image = segmented_array
+    def segment_depth_image(self, *args):
+        self.segment_job = None
+        self.read_sliders()
+
+        mask = (self.preview_depth >= self.minimum_depth) & (self.preview_depth <= self.maximum_depth)
+        self.image = np.where(mask, self.preview_display, 0).astype(np.uint8)
         self.update_image()
+        self.update_histogram_lines()
 
     def accept(self):
+        self.read_sliders()
         self.window.destroy()
 
     def accept_after(self):
@@ -1,5 +1,8 @@
 import logging
+import threading
 import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from typing import List
 
@@ -7,47 +10,99 @@ import cv2
 import numpy as np
 
 from calibrations.CalibrationFile import CalibrationClass
-from kinect_module import PyKinectRuntime
-
-from literals import KINECT_MAX_CHECKS_CONNECTION, KINECT_SECONDS_BETWEEN_CHECK_CONNECTION, KINECT_CALIBRATION_PATH, \
-    KINECT_CALIBRATION_FILENAME, KinectFrames
+from literals import KINECT_STARTUP_TIMEOUT, KINECT_SECONDS_BETWEEN_READY_CHECKS, KINECT_CALIBRATION_PATH, \
+    KINECT_CALIBRATION_FILENAME, KinectFrames, CALIBRATION_FUSED_REMAP, BURST_CAPTURE_FRAMES, BURST_CAPTURE_TIMEOUT, \
+    BUNDLE_TOLERANCE_SECONDS, BUNDLE_TIMEOUT
 from kinect_controller.KinectLock import lock
+from performance.PipelineMetrics import pipeline_metrics
 from utils import generate_relative_path
 
 
+class FrameBundle:
+    __slots__ = ["images", "arrivals", "skew"]
+
+    def __init__(self, images, arrivals, skew):
+        self.images = images  # {KinectFrames: image}
+        self.arrivals = arrivals  # {KinectFrames: perf_counter arrival time}
+        self.skew = skew  # seconds between the first and the last arrival
+
+
 class KinectController(object):
-    def __init__(self, kinect_frames: List[KinectFrames]):
+    def __init__(self, kinect_frames: List[KinectFrames], wait_ready=True, startup_timeout=KINECT_STARTUP_TIMEOUT):
         logging.info("Initializing Kinect Camera ...")
 
         # Instantiate values
         self.kinect = None
         self.kinect_frames = kinect_frames
+        self.startup_start = time.perf_counter()
+        self.startup_timeline = []
+        self.frames_ready = {kinect_frame.name: threading.Event() for kinect_frame in self.kinect_frames}
 
-        # Generate kinect frames list
-        kinect_frames_values = [kinect_frame.value for kinect_frame in self.kinect_frames]
-
-        # Initiate PyKinect2 runtime
-        self.kinect = PyKinectRuntime.PyKinectRuntime(kinect_frames_values[0]) if len(
-            kinect_frames_values) == 1 else PyKinectRuntime.PyKinectRuntime(
-            reduce(lambda x, y: x | y, kinect_frames_values))
-
-        # Test Connection
-        for i in range(KINECT_MAX_CHECKS_CONNECTION):
-            time.sleep(KINECT_SECONDS_BETWEEN_CHECK_CONNECTION)
-            if self.check_if_new_image(self.kinect_frames[0]):
-                break
-            logging.warning(
-                f"Retrying connection with Kinect camera, {KINECT_MAX_CHECKS_CONNECTION - i - 1} retries available")
-        else:
-            raise RuntimeError("Cannot detect Kinect Camera")
-
-        # Read calibrations
+        # Read calibrations in parallel while the sensor warms up
         self.kinect_calibrations = {}
+        self.last_frame_arrivals = {}
+        self.calibrations_executor = ThreadPoolExecutor(max_workers=len(self.kinect_frames),
+                                                        thread_name_prefix="kinect_calibration")
+        self.calibrations_futures = []
+        self.capture_executor = None
         for kinect_frame in self.kinect_frames:
             calibration_path = generate_relative_path(
                 [KINECT_CALIBRATION_PATH, kinect_frame.name, KINECT_CALIBRATION_FILENAME])
             self.kinect_calibrations[kinect_frame.name] = CalibrationClass(calibration_path_file=calibration_path)
-            self.kinect_calibrations[kinect_frame.name].read_calibration()
+            self.calibrations_futures.append(
+                self.calibrations_executor.submit(self._read_calibration, kinect_frame=kinect_frame))
+
+        # Generate kinect frames list
+        kinect_frames_values = [kinect_frame.value for kinect_frame in self.kinect_frames]
+
+        try:
+            # Initiate PyKinect2 runtime (COM bindings are only imported when a camera is really opened)
+            from kinect_module import PyKinectRuntime
+            self.kinect = PyKinectRuntime.PyKinectRuntime(kinect_frames_values[0]) if len(
+                kinect_frames_values) == 1 else PyKinectRuntime.PyKinectRuntime(
+                reduce(lambda x, y: x | y, kinect_frames_values))
+            self.mark_startup("runtime created")
+
+            if wait_ready:
+                self.wait_until_ready(timeout=startup_timeout)
+        except Exception:
+            # Do not leave the sensor opened or the calibration threads running when startup fails
+            self.close()
+            raise
+
+    # region Startup
+    def mark_startup(self, event):
+        self.startup_timeline.append((event, time.perf_counter() - self.startup_start))
+
+    def _read_calibration(self, kinect_frame: KinectFrames):
+        self.kinect_calibrations[kinect_frame.name].read_calibration()
+        self.mark_startup(f"{kinect_frame.name} calibration loaded")
+
+    def wait_until_ready(self, timeout=KINECT_STARTUP_TIMEOUT):
+        # Ready as soon as every requested stream has delivered its first frame (frames are not consumed)
+        deadline = time.perf_counter() + timeout
+        while not all(event.is_set() for event in self.frames_ready.values()):
+            for kinect_frame in self.kinect_frames:
+                if not self.frames_ready[kinect_frame.name].is_set() and self.check_if_new_image(kinect_frame):
+                    self.frames_ready[kinect_frame.name].set()
+                    self.mark_startup(f"first {kinect_frame.name} frame")
+
+            if time.perf_counter() > deadline:
+                missing = [name for name, event in self.frames_ready.items() if not event.is_set()]
+                raise RuntimeError(f"Cannot detect Kinect Camera, no frames received from {missing} "
+                                   f"after {timeout} seconds")
+            time.sleep(KINECT_SECONDS_BETWEEN_READY_CHECKS)
+
+        for future in self.calibrations_futures:
+            future.result()
+        self.calibrations_executor.shutdown(wait=False)
+        self.mark_startup("ready")
+
+        timeline = sorted(self.startup_timeline, key=lambda item: item[1])
+        logging.info("Kinect startup timeline:\n" + "\n".join(
+            f"{elapsed * 1000:>9.1f} ms  {event}" for event, elapsed in timeline))
+
+    # endregion
 
     # region Get Images
     def check_if_new_image(self, kinect_frame: KinectFrames):
@@ -60,9 +115,17 @@ class KinectController(object):
 
         raise ValueError(f"Cannot manage kinect frame {kinect_frame.name} in KinectController wrapper")
 
+    def get_frame_arrival(self, kinect_frame: KinectFrames):
+        # perf_counter value set by PyKinectRuntime when the last frame of this type arrived
+        arrival = getattr(self.kinect, f"_last_{kinect_frame.name.lower()}_frame_time", None)
+        return arrival if isinstance(arrival, float) else None
+
     def get_frame(self, kinect_frame: KinectFrames):
         if self.check_if_new_image(kinect_frame=kinect_frame):
+            wait_start = time.perf_counter()
             with lock:
+                wait_seconds = time.perf_counter() - wait_start
+                self.last_frame_arrivals[kinect_frame.name] = self.get_frame_arrival(kinect_frame=kinect_frame)
                 if kinect_frame == KinectFrames.COLOR:
                     kinect_frame_obj = self.kinect.get_last_color_frame()
                 elif kinect_frame == KinectFrames.DEPTH:
@@ -72,6 +135,7 @@ class KinectController(object):
                 else:
                     raise ValueError(f"Cannot manage kinect frame {kinect_frame.name} in KinectController wrapper")
 
+            pipeline_metrics.record_lock_wait(lock_name="kinect", wait_seconds=wait_seconds)
             return kinect_frame_obj
         else:
             logging.debug("Not found new frame to get in get_frame method")
@@ -101,10 +165,14 @@ class KinectController(object):
         image = cv2.flip(image, 1)
         return image
 
-    def get_image_calibrate(self, kinect_frame: KinectFrames, avoid_camera_matrix=False, avoid_camera_focus=False):
+    def get_image_calibrate(self, kinect_frame: KinectFrames, avoid_camera_matrix=False, avoid_camera_focus=False,
+                            fused_remap=CALIBRATION_FUSED_REMAP):
         image = self.get_image(kinect_frame=kinect_frame)
         if image is not None:
             if kinect_frame.name in self.kinect_calibrations.keys():
+                if fused_remap and not avoid_camera_matrix and not avoid_camera_focus:
+                    return self.kinect_calibrations[kinect_frame.name].applied_camera_calibration_and_focus(
+                        image=image)
                 if not avoid_camera_matrix:
                     image = self.apply_camera_calibration(kinect_frame=kinect_frame, image=image)
                 if not avoid_camera_focus:
@@ -126,7 +194,98 @@ class KinectController(object):
 
     # endregion
 
+    # region Frame bundles and burst capture
+    def get_bundle(self, kinect_frames=None, tolerance=BUNDLE_TOLERANCE_SECONDS, timeout=BUNDLE_TIMEOUT):
+        # New frames of every stream with arrival times closer than tolerance (the closest set found on timeout)
+        kinect_frames = kinect_frames if kinect_frames is not None else self.kinect_frames
+        latest = {}
+        best_bundle = None
+        deadline = time.perf_counter() + timeout
+        while True:
+            newest_arrival = max((arrival for arrival, _ in latest.values()), default=None)
+            for kinect_frame in kinect_frames:
+                # Only the missing streams and the ones too old compared with the newest are read again
+                if kinect_frame in latest and newest_arrival - latest[kinect_frame][0] <= tolerance:
+                    continue
+                image = self.get_image(kinect_frame=kinect_frame)
+                if image is not None:
+                    arrival = self.last_frame_arrivals.get(kinect_frame.name)
+                    latest[kinect_frame] = (arrival if arrival is not None else time.perf_counter(), image)
+
+            if len(latest) == len(kinect_frames):
+                arrivals = {kinect_frame: arrival for kinect_frame, (arrival, _) in latest.items()}
+                skew = max(arrivals.values()) - min(arrivals.values())
+                if best_bundle is None or skew < best_bundle.skew:
+                    best_bundle = FrameBundle(images={kinect_frame: image for kinect_frame, (_, image) in
+                                                      latest.items()}, arrivals=arrivals, skew=skew)
+                if skew <= tolerance:
+                    return best_bundle
+
+            if time.perf_counter() > deadline:
+                break
+
+        if best_bundle is None:
+            missing = [kinect_frame.name for kinect_frame in kinect_frames if kinect_frame not in latest]
+            raise RuntimeError(f"Cannot get frame bundle, no frames received from {missing} after {timeout} seconds")
+        logging.warning(f"Frame bundle skew {best_bundle.skew * 1000:.1f} ms is over the tolerance "
+                        f"{tolerance * 1000:.1f} ms")
+        return best_bundle
+
+    def capture_burst(self, kinect_frames=None, frames=BURST_CAPTURE_FRAMES, timeout=BURST_CAPTURE_TIMEOUT):
+        # One frame bundle per round, so the frames of every stream are taken at the same moments
+        kinect_frames = kinect_frames if kinect_frames is not None else self.kinect_frames
+        bursts = {kinect_frame.name: [] for kinect_frame in kinect_frames}
+        skews = []
+        deadline = time.perf_counter() + timeout
+        while len(skews) < frames and time.perf_counter() < deadline:
+            try:
+                bundle = self.get_bundle(kinect_frames=kinect_frames, timeout=deadline - time.perf_counter())
+            except RuntimeError as error:
+                logging.warning(error)
+                break
+            for kinect_frame, image in bundle.images.items():
+                bursts[kinect_frame.name].append(image)
+            skews.append(bundle.skew)
+
+        if not skews:
+            raise RuntimeError(f"Cannot capture burst, no frame bundles received after {timeout} seconds")
+        if len(skews) < frames:
+            logging.warning(f"Burst capture timed out: {len(skews)} frame bundles of {frames}")
+        logging.debug(f"Burst capture of {len(skews)} frame bundles, max skew {max(skews) * 1000:.1f} ms")
+
+        return {kinect_frame: self.combine_burst(kinect_frame=kinect_frame, images=bursts[kinect_frame.name])
+                for kinect_frame in kinect_frames}
+
+    def capture_burst_async(self, kinect_frames=None, frames=BURST_CAPTURE_FRAMES, timeout=BURST_CAPTURE_TIMEOUT):
+        # Future with {KinectFrames: image}, the Tk thread polls it with after()
+        if self.capture_executor is None:
+            self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kinect_burst")
+        return self.capture_executor.submit(self.capture_burst, kinect_frames, frames, timeout)
+
+    @staticmethod
+    def combine_burst(kinect_frame: KinectFrames, images):
+        stack = np.stack(images)
+        if len(images) == 1:
+            return stack[0]
+
+        if kinect_frame == KinectFrames.COLOR:
+            return np.round(stack.mean(axis=0, dtype=np.float32)).astype(stack.dtype)
+        if kinect_frame == KinectFrames.DEPTH:
+            # Zero depth is an invalid measure, median of the valid frames of each pixel
+            valid_stack = np.where(stack > 0, stack.astype(np.float32), np.nan)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                median = np.nanmedian(valid_stack, axis=0)
+            return np.nan_to_num(np.round(median), nan=0).astype(stack.dtype)
+        return np.median(stack, axis=0).round().astype(stack.dtype)
+
+    # endregion
+
     # region Kinect Management
     def close(self):
-        self.kinect.close()
+        self.calibrations_executor.shutdown(wait=False)
+        if self.capture_executor is not None:
+            self.capture_executor.shutdown(wait=False)
+        if self.kinect is not None:
+            self.kinect.close()
     # endregion
@@ -0,0 +1,66 @@
+import logging
+import threading
+import time
+
+import cv2
+
+from literals import KinectFrames
+
+
+class KinectFrameProducer(threading.Thread):
+    """
+    Grabs, undistorts (cached remap tables of the calibration) and downsamples Kinect frames to the canvas size in
+    this thread. The Tk loop only takes the latest frame with get_latest() and swaps its PhotoImage.
+    """
+
+    def __init__(self, kinect, output_size, kinect_frame=KinectFrames.COLOR, avoid_camera_matrix=False,
+                 avoid_camera_focus=True):
+        super(KinectFrameProducer, self).__init__(name=f"kinect_{kinect_frame.name.lower()}_producer", daemon=True)
+        self.kinect = kinect
+        self.output_size = tuple(output_size)
+        self.kinect_frame = kinect_frame
+        self.avoid_camera_matrix = avoid_camera_matrix
+        self.avoid_camera_focus = avoid_camera_focus
+
+        self.lock = threading.Lock()
+        self.latest_image = None
+        self.source_size = None
+        self.sequence = 0
+        self.stopped = False
+
+    def run(self):
+        while not self.stopped:
+            try:
+                self.produce_frame()
+            except Exception as error:
+                logging.error(f"Kinect frame producer failed: {error}")
+                time.sleep(0.1)
+
+    def produce_frame(self):
+        # get_frame already waits a bit when there is not a new frame
+        image = self.kinect.get_image_calibrate(kinect_frame=self.kinect_frame,
+                                                avoid_camera_matrix=self.avoid_camera_matrix,
+                                                avoid_camera_focus=self.avoid_camera_focus)
+        if image is None:
+            return False
+
+        source_size = (image.shape[1], image.shape[0])
+        image = cv2.resize(image, self.output_size, interpolation=cv2.INTER_AREA)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+        with self.lock:
+            self.latest_image = image
+            self.source_size = source_size
+            self.sequence += 1
+        return True
+
+    def get_latest(self, sequence=None):
+        # Returns (sequence, image, source_size), image is None when nothing newer than sequence was produced
+        with self.lock:
+            if sequence is not None and sequence == self.sequence:
+                return self.sequence, None, self.source_size
+            return self.sequence, self.latest_image, self.source_size
+
+    def stop(self):
+        self.stopped = True
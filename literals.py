@@ -1,18 +1,20 @@
 # region Kinect Control
 import enum
 
-import cv2
-
-from kinect_module import PyKinectV2
-
-KINECT_MAX_CHECKS_CONNECTION = 5
-KINECT_SECONDS_BETWEEN_CHECK_CONNECTION = 5
+KINECT_STARTUP_TIMEOUT = 25
+KINECT_SECONDS_BETWEEN_READY_CHECKS = 0.01
+KINECT_FRAMES_PER_SECOND = 30
+BURST_CAPTURE_FRAMES = 5
+BURST_CAPTURE_TIMEOUT = 3
+BUNDLE_TOLERANCE_SECONDS = 0.02
+BUNDLE_TIMEOUT = 1
 
 
+# Same values as PyKinectV2.FrameSourceTypes_*, kept literal so importing this module does not load comtypes
 class KinectFrames(enum.Enum):
-    COLOR = PyKinectV2.FrameSourceTypes_Color
-    DEPTH = PyKinectV2.FrameSourceTypes_Depth
-    INFRARED = PyKinectV2.FrameSourceTypes_Infrared
+    COLOR = 1
+    DEPTH = 8
+    INFRARED = 2
 
 
 # endregion
@@ -24,6 +26,11 @@ WINDOW_SECONDS_BETWEEN_CREATIONS = 1
 
 # region Kinect/Projector Calibration
 CALIBRATE_PATTERN_IMAGES = [KinectFrames.COLOR.name, KinectFrames.INFRARED.name]
+PATTERN_DETECTION_POLL_MS = 100
+# Chessboard search: FAST_CHECK on a frame downscaled to this width, then full resolution only around the board
+CHESSBOARD_COARSE_WIDTH = 640
+CHESSBOARD_ROI_MARGIN = 0.25
+CHESSBOARD_USE_SB = False
 
 OBJ_POINTS_KEY = "obj_points"
 IMG_POINTS_KEY = "img_points"
@@ -33,6 +40,12 @@ CAMERA_DISTORTION_VARIABLE = "coef_distorsion"
 CAMERA_ROTATION_VARIABLE = "rvecs"
 CAMERA_TRANSLATION_VARIABLE = "tvecs"
 
+HOMOGRAPHY_RANSAC_THRESHOLD = 3.0
+
+# Camera calibration solves with at most this many views (greedy pose/coverage selection), the rest only get poses
+CALIBRATION_MAX_VIEWS = 30
+CALIBRATION_COVERAGE_GRID = (8, 6)
+
 FOCUS_HOMOGRAPHY_VARIABLE = "focus_homography"
 FOCUS_INV_HOMOGRAPHY_VARIABLE = "focus_inverse_homography"
 FOCUS_CORDS_VARIABLE = "focus_cords"
@@ -46,14 +59,45 @@ KINECT_CALIBRATION_FILENAME = "kinect_calibration.npz"
 PROJECTOR_CALIBRATION_PATH = "calibration_files\\projector_calibration\\"
 PROJECTOR_CALIBRATION_FILENAME = "projector_calibration.npz"
 
+CALIBRATION_BUNDLE_VERSION = 1
+CALIBRATION_BUNDLE_SUFFIX = "_bundle"
+CALIBRATION_MANIFEST_FILENAME = "manifest.json"
+CALIBRATION_BUNDLE_LOCK_FILENAME = "manifest.lock"
+CALIBRATION_BUNDLE_LOCK_TIMEOUT = 5
+UNDISTORT_MAPS_VARIABLE = "undistort_maps"
+UNDISTORT_FOCUS_MAPS_VARIABLE = "undistort_focus_maps"
+# Undistort + focus in one remap is faster but not equal to the two steps (equivalence case "fused_remap")
+CALIBRATION_FUSED_REMAP = False
+CALIBRATION_WATCH_SECONDS = 1
+
 IMAGE_KINECT_SAVE_PATH = "calibration_images\\kinect_images\\"
+# Depth and IR are stored as lossless 16 bit PNG, color as JPG. Every stream shares the same file name
+CALIBRATION_IMAGE_EXTENSIONS = {"COLOR": ".jpg", "DEPTH": ".png", "INFRARED": ".png"}
+CALIBRATION_IMAGE_LEGACY_EXTENSION = ".jpg"
+LOSSLESS_EXTENSIONS = (".png", ".tiff", ".tif")
+IMAGE_WRITER_WORKERS = 2
+IMAGE_WRITER_QUEUE_SIZE = 8
 IMAGE_PROJECTOR_SAVE_PATH = "calibration_images\\projector_images\\"
+CORNER_CACHE_FILENAME = "corners_cache.npz"
+# Calibration photos keep their pixels loaded up to this budget, the rest are loaded again on access
+PHOTO_MEMORY_BUDGET_MB = 1024
+PHOTO_THUMBNAIL_WIDTH = 320
+PHOTO_FULL_RESOLUTION_DELAY_MS = 150
 
 # endregion
 
 # region Projector Calibration Literals
 PATTERN_MOVE_SCALAR = 15
 PATTERN_RESIZE_SCALAR = 0.1
+PATTERN_RENDER_CACHE_SIZE = 16
+# endregion
+
+# region Calibration interfaces
+SLIDER_REFRESH_MS = 33
+KINECT_BACKGROUND_REFRESH_MS = 30
+DEPTH_SLIDER_RANGE = (0, 1500)
+DEPTH_HISTOGRAM_BINS = 150
+DEPTH_HISTOGRAM_SIZE = (300, 100)
 # endregion
 
 # region General Images
@@ -70,6 +114,8 @@ CONTOURS_EPSILON_FACTOR = 0.000001
 CONTOURS_MIN_AREA = 500
 
 
+# Unique: a repeated value would make the second name an alias of the first one
+@enum.unique
 class ConfigControllerEnum(enum.Enum):
     MIN_DEPTH = STANDARD_MIN_DEPTH
     MAX_DEPTH = STANDARD_MAX_DEPTH
@@ -78,7 +124,7 @@ class ConfigControllerEnum(enum.Enum):
     MEDIUM_NOISE = 15
     BIG_NOISE = 30
     NO_SENSE_CHANGES = 80
-    COLORMAP = cv2.COLORMAP_JET
+    COLORMAP = 2  # cv2.COLORMAP_JET
     RESET_IMAGE = False
 
 
@@ -99,3 +145,14 @@ class ConfigControllerSliderEnum(enum.Enum):
     BIG_NOISE = [0, 50]
 
 # endregion
+
+# region Configuration interface previews
+PREVIEW_SIZE = (320, 240)
+PREVIEW_PUBLISH_SECONDS = 0.1
+PREVIEW_REFRESH_MS = 100
+
+# Live metrics panel
+METRICS_RING_SIZE = 600
+METRICS_WINDOW_SECONDS = 5
+METRICS_REFRESH_MS = 1000
+# endregion
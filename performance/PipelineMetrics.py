@@ -0,0 +1,153 @@
+import ctypes
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from literals import METRICS_RING_SIZE, METRICS_WINDOW_SECONDS, KINECT_FRAMES_PER_SECOND
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def get_process_rss_bytes():
+    # psutil is optional, without it the OS is asked directly
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    if sys.platform == "win32":
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+
+    try:
+        with open("/proc/self/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class FrameSample:
+    __slots__ = ["timestamp", "stage_ms", "frame_age_ms", "dropped_frames"]
+
+    def __init__(self, timestamp, stage_ms, frame_age_ms, dropped_frames):
+        self.timestamp = timestamp
+        self.stage_ms = stage_ms
+        self.frame_age_ms = frame_age_ms
+        self.dropped_frames = dropped_frames
+
+
+class PipelineMetrics:
+    """
+    Ring buffers written by the projector pipeline (one sample per frame) and by the locks (wait times). The
+    configuration interface reads a summary of the last seconds at low frequency.
+    """
+
+    def __init__(self, ring_size=METRICS_RING_SIZE):
+        self.lock = threading.Lock()
+        self.frames = deque(maxlen=ring_size)
+        self.lock_waits = {}
+        self.ring_size = ring_size
+        self.total_frames = 0
+        self.total_dropped_frames = 0
+        self.last_frame_arrival = None
+
+    def record_frame(self, stage_ms, frame_arrival=None, frame_consumed=None):
+        # frame_arrival: perf_counter when the Kinect delivered the frame. Frames delivered between two consumed
+        # ones were overwritten before the pipeline could read them (dropped)
+        now = time.perf_counter()
+        frame_age_ms = None
+        dropped_frames = 0
+        if frame_arrival is not None:
+            frame_age_ms = ((frame_consumed if frame_consumed is not None else now) - frame_arrival) * 1000
+            if self.last_frame_arrival is not None:
+                frame_intervals = (frame_arrival - self.last_frame_arrival) * KINECT_FRAMES_PER_SECOND
+                dropped_frames = max(int(round(frame_intervals)) - 1, 0)
+            self.last_frame_arrival = frame_arrival
+
+        with self.lock:
+            self.frames.append(FrameSample(timestamp=now, stage_ms=stage_ms, frame_age_ms=frame_age_ms,
+                                           dropped_frames=dropped_frames))
+            self.total_frames += 1
+            self.total_dropped_frames += dropped_frames
+
+    def record_lock_wait(self, lock_name, wait_seconds):
+        with self.lock:
+            waits = self.lock_waits.get(lock_name)
+            if waits is None:
+                waits = self.lock_waits[lock_name] = deque(maxlen=self.ring_size)
+            waits.append((time.perf_counter(), wait_seconds * 1000))
+
+    def get_summary(self, window_seconds=METRICS_WINDOW_SECONDS):
+        limit = time.perf_counter() - window_seconds
+        with self.lock:
+            frames = [sample for sample in self.frames if sample.timestamp >= limit]
+            lock_waits = {name: [wait for timestamp, wait in waits if timestamp >= limit]
+                          for name, waits in self.lock_waits.items()}
+            total_frames, total_dropped_frames = self.total_frames, self.total_dropped_frames
+
+        summary = {
+            "fps": 0.0,
+            "stages_ms": {},
+            "frame_age_ms": None,
+            "dropped_frames": sum(sample.dropped_frames for sample in frames),
+            "total_frames": total_frames,
+            "total_dropped_frames": total_dropped_frames,
+            "lock_wait_ms": {name: {"mean": float(np.mean(waits)), "max": float(np.max(waits))}
+                             for name, waits in lock_waits.items() if waits},
+            "rss_mb": None
+        }
+        if len(frames) > 1:
+            summary["fps"] = (len(frames) - 1) / max(frames[-1].timestamp - frames[0].timestamp, 1e-6)
+
+        stage_names = []
+        for sample in frames:
+            stage_names.extend(name for name in sample.stage_ms if name not in stage_names)
+        for stage_name in stage_names:
+            values = [sample.stage_ms[stage_name] for sample in frames if stage_name in sample.stage_ms]
+            summary["stages_ms"][stage_name] = {"mean": float(np.mean(values)), "max": float(np.max(values))}
+
+        ages = [sample.frame_age_ms for sample in frames if sample.frame_age_ms is not None]
+        if ages:
+            summary["frame_age_ms"] = {"mean": float(np.mean(ages)), "max": float(np.max(ages))}
+
+        rss_bytes = get_process_rss_bytes()
+        if rss_bytes is not None:
+            summary["rss_mb"] = rss_bytes / 1024 / 1024
+        return summary
+
+    def format_summary(self, window_seconds=METRICS_WINDOW_SECONDS):
+        summary = self.get_summary(window_seconds=window_seconds)
+        lines = [f"FPS: {summary['fps']:.1f}",
+                 f"Frames perdidos: {summary['dropped_frames']} ({window_seconds:.0f} s), "
+                 f"{summary['total_dropped_frames']} de {summary['total_frames']} en total"]
+        if summary["frame_age_ms"] is not None:
+            lines.append(f"Edad frame Kinect: {summary['frame_age_ms']['mean']:.1f} ms "
+                         f"(max {summary['frame_age_ms']['max']:.1f})")
+        lines.append(f"Memoria (RSS): {summary['rss_mb']:.0f} MB" if summary["rss_mb"] is not None else
+                     "Memoria (RSS): -")
+        lines.append("Etapas (media / max ms):")
+        for stage_name, stage in summary["stages_ms"].items():
+            lines.append(f"  {stage_name:<16} {stage['mean']:>7.2f} / {stage['max']:>7.2f}")
+        lines.append("Espera en locks (media / max ms):")
+        for lock_name, wait in summary["lock_wait_ms"].items():
+            lines.append(f"  {lock_name:<16} {wait['mean']:>7.3f} / {wait['max']:>7.3f}")
+        return "\n".join(lines)
+
+
+pipeline_metrics = PipelineMetrics()
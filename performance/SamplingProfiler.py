@@ -0,0 +1,93 @@
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from utils import generate_folders
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Statistical profiler that samples the stacks of every thread (projector thread, Tk main loop, window threads...)
+    and writes them as collapsed stacks ("thread;frame;frame count"), readable by flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, output_path, interval=0.005):
+        super(SamplingProfiler, self).__init__(name="sampling_profiler", daemon=True)
+        self.output_path = output_path
+        self.interval = interval
+
+        self.samples = Counter()
+        self.total_samples = 0
+        self.stopped = False
+        self.written = False
+
+    def run(self):
+        while not self.stopped:
+            self.sample()
+            time.sleep(self.interval)
+
+    def sample(self):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+
+            thread_name = thread_names.get(thread_id, f"thread-{thread_id}")
+            stack.append(thread_name)
+            self.samples[";".join(part.replace(";", ":") for part in reversed(stack))] += 1
+        self.total_samples += 1
+
+    def stop(self):
+        if self.written:
+            return
+        self.stopped = True
+        if self.is_alive():
+            self.join()
+        self.write_collapsed_stacks()
+
+    def write_collapsed_stacks(self, output_path=None):
+        if output_path:
+            self.output_path = output_path
+
+        generate_folders(os.path.abspath(self.output_path))
+        with open(self.output_path, "w", encoding="utf-8") as output_file:
+            for stack, count in self.samples.most_common():
+                output_file.write(f"{stack} {count}\n")
+
+        self.written = True
+        logging.info(f"Profiler wrote {self.total_samples} samples ({len(self.samples)} unique stacks) "
+                     f"to {self.output_path}")
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', help='Enable the sampling profiler, writing collapsed stacks to the given file '
+                                          '(default: profile_<program>_<date>.collapsed)',
+                        type=str, nargs='?', const="", required=False, default=None)
+    parser.add_argument('--profile-interval', help='Seconds between profiler samples',
+                        type=float, required=False, default=0.005)
+
+
+def start_profiler(args, program_name):
+    if args.profile is None:
+        return None
+
+    output_path = args.profile
+    if not output_path:
+        output_path = f"profile_{program_name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.collapsed"
+
+    profiler = SamplingProfiler(output_path=output_path, interval=args.profile_interval)
+    profiler.start()
+    atexit.register(profiler.stop)
+    logging.info(f"Sampling profiler started every {args.profile_interval * 1000:.1f} ms")
+    return profiler
@@ -0,0 +1,190 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+
+import numpy as np
+
+
+def _count_bytes(value, depth=0):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if depth < 2 and isinstance(value, (list, tuple)):
+        return sum(_count_bytes(item, depth + 1) for item in value)
+    return 0
+
+
+class StageRecord:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def add(self, elapsed, bytes_in, bytes_out):
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total_ms": self.total_time * 1000,
+            "mean_ms": self.total_time * 1000 / self.calls if self.calls else 0.0,
+            "max_ms": self.max_time * 1000,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out
+        }
+
+
+class StageInstrumentation:
+    """
+    Wraps registered methods with timing/bytes counters only while enabled. When disabled the original class
+    attributes are restored, so the instrumented code runs without any extra call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.records = {}
+
+        self._targets = []  # (class, method names)
+        self._patched = []  # (class, method name, original attribute or None if inherited)
+
+    # region Registration
+    def register_class(self, cls, method_names=None):
+        if method_names is None:
+            method_names = [name for name, _ in inspect.getmembers(cls)
+                            if isinstance(inspect.getattr_static(cls, name), staticmethod)]
+        self._targets.append((cls, list(method_names)))
+
+        if self.enabled:
+            # Re-apply so the new class is also wrapped
+            self.disable()
+            self.enable()
+
+    # endregion
+
+    # region Enable/Disable
+    def enable(self):
+        with self.lock:
+            if self.enabled:
+                return
+
+            # Collect every original before patching, inherited methods would be wrapped twice otherwise
+            originals = []
+            for cls, method_names in self._targets:
+                for method_name in method_names:
+                    attribute = inspect.getattr_static(cls, method_name)
+                    own_attribute = cls.__dict__.get(method_name)
+                    originals.append((cls, method_name, attribute, own_attribute))
+
+            for cls, method_name, attribute, own_attribute in originals:
+                stage_name = f"{cls.__name__}.{method_name}"
+                if isinstance(attribute, staticmethod):
+                    wrapped = staticmethod(self._wrap(function=attribute.__func__, stage_name=stage_name))
+                else:
+                    wrapped = self._wrap(function=attribute, stage_name=stage_name)
+                setattr(cls, method_name, wrapped)
+                self._patched.append((cls, method_name, own_attribute))
+
+            self.enabled = True
+        logging.info("Stage instrumentation enabled")
+
+    def disable(self):
+        with self.lock:
+            if not self.enabled:
+                return
+
+            for cls, method_name, own_attribute in reversed(self._patched):
+                if own_attribute is None:
+                    delattr(cls, method_name)
+                else:
+                    setattr(cls, method_name, own_attribute)
+            self._patched.clear()
+
+            self.enabled = False
+        logging.info("Stage instrumentation disabled")
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def _wrap(self, function, stage_name):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            bytes_in = sum(_count_bytes(arg) for arg in args) + sum(_count_bytes(arg) for arg in kwargs.values())
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            self.record(stage_name=stage_name, elapsed=elapsed, bytes_in=bytes_in, bytes_out=_count_bytes(result))
+            return result
+
+        return wrapper
+
+    # endregion
+
+    # region Records
+    def record(self, stage_name, elapsed, bytes_in=0, bytes_out=0):
+        with self.lock:
+            stage_record = self.records.get(stage_name)
+            if stage_record is None:
+                stage_record = self.records[stage_name] = StageRecord(name=stage_name)
+            stage_record.add(elapsed=elapsed, bytes_in=bytes_in, bytes_out=bytes_out)
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+
+    def get_summary(self):
+        with self.lock:
+            summary = [stage_record.to_dict() for stage_record in self.records.values()]
+        return sorted(summary, key=lambda stage: stage["total_ms"], reverse=True)
+
+    def format_summary(self):
+        header = f"{'Stage':<60} {'Calls':>8} {'Total ms':>11} {'Mean ms':>9} {'Max ms':>9} {'MB in':>10} {'MB out':>10}"
+        lines = [header, "-" * len(header)]
+        for stage in self.get_summary():
+            lines.append(f"{stage['name']:<60} {stage['calls']:>8} {stage['total_ms']:>11.2f} "
+                         f"{stage['mean_ms']:>9.3f} {stage['max_ms']:>9.3f} "
+                         f"{stage['bytes_in'] / 1e6:>10.1f} {stage['bytes_out'] / 1e6:>10.1f}")
+        if len(lines) == 2:
+            lines.append("No stages recorded")
+        return "\n".join(lines)
+
+    def log_summary(self):
+        logging.info(f"Stage instrumentation summary (inclusive times):\n{self.format_summary()}")
+
+    # endregion
+
+
+instrumentation = StageInstrumentation()
+
+
+def register_image_pipeline(stage_instrumentation=instrumentation):
+    from calibrations.CalibrationFile import CalibrationClass
+    from image_management.ImageTransformerBase import ImageTransformerBase
+    from image_management.ImageTransformerDepth import ImageTransformerDepth
+    from image_management.ImageTransformerIR import ImageTransformerIR
+
+    registered_classes = [cls for cls, _ in stage_instrumentation._targets]
+    for cls in [ImageTransformerBase, ImageTransformerDepth, ImageTransformerIR]:
+        if cls not in registered_classes:
+            stage_instrumentation.register_class(cls)
+
+    if CalibrationClass not in registered_classes:
+        stage_instrumentation.register_class(CalibrationClass,
+                                             method_names=[name for name in dir(CalibrationClass)
+                                                           if name.startswith("applied_")])
+
+    return stage_instrumentation
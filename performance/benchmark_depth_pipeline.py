@@ -0,0 +1,407 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from app.app import process_depth_frame, calculate_smoothed_contours
+from calibrations.CalibrationFile import CalibrationClass
+from image_management.ImageTransformerDepth import ImageTransformerDepth
+from literals import ConfigControllerEnum, STANDARD_MIN_DEPTH, BOX_HEIGHT
+from utils import generate_folders, generate_relative_path
+
+BENCHMARK_RESOLUTIONS = [(512, 424), (256, 212), (1024, 848)]
+BENCHMARK_CONTOUR_STEPS = [5, 10, 20]
+BENCHMARK_RESULTS_PATH = "benchmark_results"
+BENCHMARK_NATIVE_RESOLUTION = (512, 424)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog="benchmark_depth_pipeline",
+                                     description='Benchmark ImageTransformerDepth methods and the projector step '
+                                                 'over a fixed corpus of depth frames',
+                                     epilog='',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
+                        type=int, required=False, default=logging.INFO)
+    parser.add_argument('--corpus', help='Folder with recorded depth frames (.npy or 16 bit .png). A synthetic '
+                                         'seeded corpus is generated when missing',
+                        type=str, required=False, default=None)
+    parser.add_argument('--frames', help='Number of synthetic frames', type=int, required=False, default=30)
+    parser.add_argument('--warmup', help='Frames executed before measuring', type=int, required=False, default=3)
+    parser.add_argument('--resolutions', help='Resolutions to test as WIDTHxHEIGHT', nargs='+', type=str,
+                        required=False, default=[f"{width}x{height}" for width, height in BENCHMARK_RESOLUTIONS])
+    parser.add_argument('--contour-steps', help='Contour level steps to test', nargs='+', type=int,
+                        required=False, default=BENCHMARK_CONTOUR_STEPS)
+    parser.add_argument('--stages', help='Only run these stages', nargs='+', type=str, required=False, default=None)
+    parser.add_argument('--repeats', help='Times the whole corpus is replayed per scenario', type=int,
+                        required=False, default=1)
+    parser.add_argument('--output', help='JSON output file', type=str, required=False, default=None)
+
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+# region Corpus
+def generate_depth_corpus(frame_count, shape=BENCHMARK_NATIVE_RESOLUTION, seed=0):
+    # Sandbox-like surface: smooth hills at sandbox distance, a moving "hand" above it, sensor noise and holes
+    random_generator = np.random.default_rng(seed)
+    width, height = shape
+    y_grid, x_grid = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    surface = np.full((height, width), STANDARD_MIN_DEPTH + BOX_HEIGHT * 2, dtype=np.float32)
+    for _ in range(6):
+        center_x, center_y = random_generator.uniform(0, width), random_generator.uniform(0, height)
+        sigma = random_generator.uniform(width / 12, width / 5)
+        amplitude = random_generator.uniform(-BOX_HEIGHT / 2, BOX_HEIGHT / 2)
+        surface += amplitude * np.exp(-((x_grid - center_x) ** 2 + (y_grid - center_y) ** 2) / (2 * sigma ** 2))
+
+    frames = []
+    for index in range(frame_count):
+        frame = surface + random_generator.normal(0, 3, size=surface.shape).astype(np.float32)
+
+        hand_x = width * (0.2 + 0.6 * index / max(frame_count - 1, 1))
+        hand_mask = ((x_grid - hand_x) ** 2 + (y_grid - height / 2) ** 2) < (width / 16) ** 2
+        frame[hand_mask] = STANDARD_MIN_DEPTH
+
+        holes = random_generator.random(size=surface.shape) < 0.01
+        frame[holes] = 0
+        frames.append(frame.astype(np.uint16))
+
+    return frames
+
+
+def load_depth_corpus(path):
+    frames = []
+    for file_name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, file_name)
+        if file_name.endswith(".npy"):
+            frames.append(np.load(file_path))
+        elif file_name.endswith(".png"):
+            frames.append(ImageTransformerDepth.load(image_path=file_path))
+
+    if not frames:
+        raise FileNotFoundError(f"Not found depth frames (.npy/.png) in {path}")
+    return frames
+
+
+def resize_corpus(frames, shape):
+    return [cv2.resize(frame, shape, interpolation=cv2.INTER_NEAREST) for frame in frames]
+
+
+# endregion
+
+# region Stages
+def generate_config_values(min_depth, max_depth, contour_steps):
+    config_values = {config.name: config.value for config in ConfigControllerEnum}
+    config_values[ConfigControllerEnum.MIN_DEPTH.name] = min_depth
+    config_values[ConfigControllerEnum.MAX_DEPTH.name] = max_depth
+    config_values[ConfigControllerEnum.CONTOURS_LEVEL_STEPS.name] = contour_steps
+    return config_values
+
+
+def generate_depth_calibration(shape):
+    # Small perspective correction, similar to a sandbox homography
+    width, height = shape
+    original_cords = np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+    cords = np.float32([[width * 0.05, height * 0.04], [width * 0.96, height * 0.02],
+                        [width * 0.03, height * 0.97], [width * 0.98, height * 0.95]])
+
+    # Kinect v2 depth-like intrinsics scaled to the resolution
+    focal = 365.0 * width / 512
+    camera_matrix = np.array([[focal, 0, width / 2], [0, focal, height / 2], [0, 0, 1]], dtype=np.float64)
+    distortion = np.array([[0.09, -0.27, 0.0, 0.0, 0.09]], dtype=np.float64)
+    return CalibrationClass(matrix_homography=cv2.getPerspectiveTransform(cords, original_cords),
+                            camera_matrix=camera_matrix, cof_distortion=distortion)
+
+
+def generate_stage_inputs(depth_image, previous_depth, config_values):
+    min_depth = config_values[ConfigControllerEnum.MIN_DEPTH.name]
+    max_depth = config_values[ConfigControllerEnum.MAX_DEPTH.name]
+
+    inputs = {"depth": depth_image, "previous_depth": previous_depth, "config_values": config_values}
+    inputs["no_zeros"] = ImageTransformerDepth.remove_zeros(image=depth_image)
+    inputs["neighbors"], inputs["mask_neighbors"] = ImageTransformerDepth.remove_data_between_distance_neighbors(
+        image=inputs["no_zeros"], min_depth=min_depth, max_depth=max_depth, other_image=previous_depth, iterations=30)
+    inputs["condition"] = (inputs["mask_neighbors"] == 0) & (np.abs(inputs["neighbors"] - previous_depth) < config_values[
+        ConfigControllerEnum.ERRORS_UMBRAL.name])
+    inputs["normalized"] = ImageTransformerDepth.normalize_between_distance(image=inputs["neighbors"],
+                                                                            min_depth=min_depth, max_depth=max_depth)
+    inputs["uint8"] = ImageTransformerDepth.transform_dtype(image=inputs["normalized"], dtype=np.uint8)
+    inputs["blurred"] = ImageTransformerDepth.degaussing(image=inputs["uint8"], ksize=(11, 11), sigma_x=0)
+    inputs["masks"] = ImageTransformerDepth.get_masks_by_steps(
+        image=inputs["blurred"], step_value=config_values[ConfigControllerEnum.CONTOURS_LEVEL_STEPS.name])
+    inputs["inverted"] = ImageTransformerDepth.invert(image=inputs["uint8"])
+    inputs["colormap"] = ImageTransformerDepth.apply_colormap(
+        image=inputs["inverted"], colormap=config_values[ConfigControllerEnum.COLORMAP.name])
+    inputs["contours"] = calculate_smoothed_contours(image=inputs["blurred"], config_values=config_values)
+    return inputs
+
+
+def find_contours_all_masks(masks):
+    return [ImageTransformerDepth.find_contours(image=mask, mode=cv2.RETR_TREE, flags=cv2.CHAIN_APPROX_SIMPLE)
+            for mask in masks]
+
+
+def min_depth_of(inputs):
+    return inputs["config_values"][ConfigControllerEnum.MIN_DEPTH.name]
+
+
+def max_depth_of(inputs):
+    return inputs["config_values"][ConfigControllerEnum.MAX_DEPTH.name]
+
+
+BENCHMARK_STAGES = {
+    "remove_zeros": lambda inputs, context: ImageTransformerDepth.remove_zeros(image=inputs["depth"]),
+    "set_data_between_distance": lambda inputs, context: ImageTransformerDepth.set_data_between_distance(
+        image=inputs["no_zeros"], min_depth=min_depth_of(inputs), max_depth=max_depth_of(inputs)),
+    "remove_data_between_distance": lambda inputs, context: ImageTransformerDepth.remove_data_between_distance(
+        image=inputs["no_zeros"], min_depth=min_depth_of(inputs), max_depth=max_depth_of(inputs)),
+    "remove_data_between_distance_neighbors":
+        lambda inputs, context: ImageTransformerDepth.remove_data_between_distance_neighbors(
+            image=inputs["no_zeros"], min_depth=min_depth_of(inputs), max_depth=max_depth_of(inputs),
+            other_image=inputs["previous_depth"], iterations=30),
+    "apply_mask": lambda inputs, context: ImageTransformerDepth.apply_mask(
+        image=inputs["neighbors"], condition=inputs["condition"], value=inputs["previous_depth"]),
+    "duplicate": lambda inputs, context: ImageTransformerDepth.duplicate(image=inputs["neighbors"]),
+    "applied_camera_calibration": lambda inputs, context: context["depth_calibration"].applied_camera_calibration(
+        image=inputs["depth"]),
+    "applied_camera_focus": lambda inputs, context: context["depth_calibration"].applied_camera_focus(
+        image=inputs["neighbors"]),
+    "normalize_between_distance": lambda inputs, context: ImageTransformerDepth.normalize_between_distance(
+        image=inputs["neighbors"], min_depth=min_depth_of(inputs), max_depth=max_depth_of(inputs)),
+    "transform_dtype": lambda inputs, context: ImageTransformerDepth.transform_dtype(image=inputs["normalized"],
+                                                                                     dtype=np.uint8),
+    "degaussing": lambda inputs, context: ImageTransformerDepth.degaussing(image=inputs["uint8"], ksize=(11, 11),
+                                                                           sigma_x=0),
+    "get_masks_by_steps": lambda inputs, context: ImageTransformerDepth.get_masks_by_steps(
+        image=inputs["blurred"],
+        step_value=inputs["config_values"][ConfigControllerEnum.CONTOURS_LEVEL_STEPS.name]),
+    "find_contours": lambda inputs, context: find_contours_all_masks(masks=inputs["masks"]),
+    "calculate_smoothed_contours": lambda inputs, context: calculate_smoothed_contours(
+        image=inputs["blurred"], config_values=inputs["config_values"]),
+    "invert": lambda inputs, context: ImageTransformerDepth.invert(image=inputs["uint8"]),
+    "apply_colormap": lambda inputs, context: ImageTransformerDepth.apply_colormap(
+        image=inputs["inverted"], colormap=inputs["config_values"][ConfigControllerEnum.COLORMAP.name]),
+    "draw_contours": lambda inputs, context: ImageTransformerDepth.draw_contours(
+        image=inputs["colormap"], contours=inputs["contours"], color=(0, 0, 0), thickness=1),
+}
+
+PROJECTOR_STEP_STAGE = "projector_step"
+
+
+# endregion
+
+# region Measurements
+def summarize_samples(samples):
+    samples_ms = np.array(samples, dtype=np.float64) * 1000
+    mean_ms = float(np.mean(samples_ms))
+    return {
+        "count": int(samples_ms.size),
+        "mean_ms": mean_ms,
+        "std_ms": float(np.std(samples_ms)),
+        "min_ms": float(np.min(samples_ms)),
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p90_ms": float(np.percentile(samples_ms, 90)),
+        "p99_ms": float(np.percentile(samples_ms, 99)),
+        "max_ms": float(np.max(samples_ms)),
+        "throughput_fps": 1000.0 / mean_ms if mean_ms > 0 else None,
+        "samples_ms": [float(sample) for sample in samples_ms]
+    }
+
+
+def run_projector_step(frames, config_values, depth_calibration, warmup):
+    previous_depth = ImageTransformerDepth.set_data_between_distance(
+        image=ImageTransformerDepth.remove_zeros(image=frames[0]),
+        min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
+        max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name])
+
+    samples = []
+    for index, frame in enumerate(frames):
+        start = time.perf_counter()
+        _, previous_depth = process_depth_frame(depth_image=frame, previous_depth=previous_depth,
+                                                config_values=config_values, depth_calibration=depth_calibration)
+        elapsed = time.perf_counter() - start
+        if index >= warmup:
+            samples.append(elapsed)
+
+    return samples
+
+
+def measure_peak_memory(function, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_scenario(frames, contour_steps, stages=None, warmup=3):
+    shape = (frames[0].shape[1], frames[0].shape[0])
+    min_depth, max_depth = STANDARD_MIN_DEPTH + BOX_HEIGHT, STANDARD_MIN_DEPTH + BOX_HEIGHT * 3
+    config_values = generate_config_values(min_depth=min_depth, max_depth=max_depth, contour_steps=contour_steps)
+    context = {"depth_calibration": generate_depth_calibration(shape=shape)}
+
+    stage_names = [name for name in list(BENCHMARK_STAGES.keys()) + [PROJECTOR_STEP_STAGE]
+                   if stages is None or name in stages]
+
+    # PER METHOD STAGES (inputs generated outside the measured time)
+    stage_samples = {name: [] for name in stage_names if name != PROJECTOR_STEP_STAGE}
+    previous_depth = ImageTransformerDepth.set_data_between_distance(
+        image=ImageTransformerDepth.remove_zeros(image=frames[0]), min_depth=min_depth, max_depth=max_depth)
+    for index, frame in enumerate(frames):
+        inputs = generate_stage_inputs(depth_image=frame, previous_depth=previous_depth, config_values=config_values)
+        for stage_name in stage_samples.keys():
+            start = time.perf_counter()
+            BENCHMARK_STAGES[stage_name](inputs, context)
+            elapsed = time.perf_counter() - start
+            if index >= warmup:
+                stage_samples[stage_name].append(elapsed)
+        previous_depth = inputs["neighbors"]
+
+    results = {name: summarize_samples(samples) for name, samples in stage_samples.items() if samples}
+
+    # FULL PROJECTOR STEP
+    peak_memory = None
+    if PROJECTOR_STEP_STAGE in stage_names:
+        samples = run_projector_step(frames=frames, config_values=config_values,
+                                     depth_calibration=context["depth_calibration"], warmup=warmup)
+        if samples:
+            results[PROJECTOR_STEP_STAGE] = summarize_samples(samples)
+        peak_memory = measure_peak_memory(run_projector_step, frames=frames[:warmup + 2],
+                                          config_values=config_values,
+                                          depth_calibration=context["depth_calibration"], warmup=warmup)
+
+    return {
+        "resolution": list(shape),
+        "contour_steps": contour_steps,
+        "frames": len(frames),
+        "warmup": warmup,
+        "peak_memory_bytes": peak_memory,
+        "stages": results
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=generate_relative_path(["."]),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate_metadata(corpus_name):
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(),
+        "corpus": corpus_name,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def merge_scenario_repeats(repeated_scenarios):
+    # Pool the samples of every repeat and keep each repeat mean, the regression gate works over repeat means
+    scenario = dict(repeated_scenarios[0])
+    scenario["repeats"] = len(repeated_scenarios)
+    peak_memories = [repeat["peak_memory_bytes"] for repeat in repeated_scenarios
+                     if repeat["peak_memory_bytes"] is not None]
+    scenario["peak_memory_bytes"] = max(peak_memories) if peak_memories else None
+
+    stages = {}
+    for stage_name in repeated_scenarios[0]["stages"].keys():
+        samples = []
+        repeat_means = []
+        for repeat in repeated_scenarios:
+            samples.extend(repeat["stages"][stage_name]["samples_ms"])
+            repeat_means.append(repeat["stages"][stage_name]["mean_ms"])
+        stages[stage_name] = summarize_samples(samples=np.array(samples) / 1000)
+        stages[stage_name]["repeat_means_ms"] = repeat_means
+    scenario["stages"] = stages
+    return scenario
+
+
+def run_benchmark(corpus, resolutions, contour_steps, stages=None, warmup=3, corpus_name="synthetic", repeats=1):
+    results = {"metadata": generate_metadata(corpus_name=corpus_name), "scenarios": {}}
+    results["metadata"]["repeats"] = repeats
+    for resolution in resolutions:
+        frames = resize_corpus(frames=corpus, shape=resolution)
+        for steps in contour_steps:
+            scenario_name = f"{resolution[0]}x{resolution[1]}_steps{steps}"
+            logging.info(f"Running scenario {scenario_name} ({len(frames)} frames, {repeats} repeats)")
+            repeated_scenarios = [run_scenario(frames=frames, contour_steps=steps, stages=stages, warmup=warmup)
+                                  for _ in range(repeats)]
+            results["scenarios"][scenario_name] = merge_scenario_repeats(repeated_scenarios=repeated_scenarios)
+
+    return results
+
+
+def format_results(results):
+    lines = [f"{'Scenario':<22} {'Stage':<40} {'Mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'FPS':>9}"]
+    for scenario_name, scenario in results["scenarios"].items():
+        for stage_name, stage in scenario["stages"].items():
+            lines.append(f"{scenario_name:<22} {stage_name:<40} {stage['mean_ms']:>9.3f} {stage['p50_ms']:>9.3f} "
+                         f"{stage['p90_ms']:>9.3f} {stage['p99_ms']:>9.3f} {stage['throughput_fps']:>9.1f}")
+        if scenario["peak_memory_bytes"] is not None:
+            lines.append(f"{scenario_name:<22} {'peak memory (MB)':<40} {scenario['peak_memory_bytes'] / 1e6:>9.1f}")
+    return "\n".join(lines)
+
+
+def save_results(results, output_path):
+    generate_folders(os.path.abspath(output_path))
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    logging.info(f"Benchmark results saved in {output_path}")
+
+
+# endregion
+
+
+def main():
+    args = get_args()
+
+    # Initialize logging class
+    logging.basicConfig(handlers=[logging.StreamHandler(sys.stdout)],
+                        level=args.logging,
+                        format='%(asctime)s %(levelname)-4s %(message)s',
+                        datefmt='%H:%M:%S')
+
+    if args.corpus:
+        corpus = load_depth_corpus(path=args.corpus)
+        corpus_name = os.path.abspath(args.corpus)
+    else:
+        corpus = generate_depth_corpus(frame_count=args.frames)
+        corpus_name = f"synthetic_{args.frames}_frames"
+
+    resolutions = [tuple(int(value) for value in resolution.lower().split("x")) for resolution in args.resolutions]
+    results = run_benchmark(corpus=corpus, resolutions=resolutions, contour_steps=args.contour_steps,
+                            stages=args.stages, warmup=args.warmup, corpus_name=corpus_name,
+                            repeats=args.repeats)
+
+    logging.info(f"Benchmark results:\n{format_results(results)}")
+
+    output_path = args.output
+    if not output_path:
+        commit = (results["metadata"]["git_commit"] or "nocommit")[:8]
+        output_path = os.path.join(BENCHMARK_RESULTS_PATH,
+                                   f"benchmark_{commit}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    save_results(results=results, output_path=output_path)
+
+
+if __name__ == '__main__':
+    main()
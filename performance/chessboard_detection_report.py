@@ -0,0 +1,176 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from image_management.ImageTransformerIR import ImageTransformerIR
+from image_management.ImageTransformerRGB import ImageTransformerRGB
+from literals import CHESSBOARD_COARSE_WIDTH, KinectFrames
+from literals_control import PATTERN_SIZE
+from utils import generate_folders
+
+# name: (coarse_width, use_sb)
+DETECTION_MODES = {
+    "full": (None, False),
+    "coarse_to_fine": (CHESSBOARD_COARSE_WIDTH, False),
+    "sb": (None, True),
+    "sb_coarse_to_fine": (CHESSBOARD_COARSE_WIDTH, True)
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog="chessboard_detection_report",
+                                     description='Measure per-image chessboard detection time and hit rate for each '
+                                                 'detection mode',
+                                     epilog='',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
+                        type=int, required=False, default=logging.INFO)
+    parser.add_argument('--images', help='Folder with calibration photos (synthetic 1920x1080 photos if not set)',
+                        type=str, required=False, default=None)
+    parser.add_argument('--type', help='Kinect image type of the photos', type=str, required=False,
+                        default=KinectFrames.COLOR.name, choices=[KinectFrames.COLOR.name, KinectFrames.INFRARED.name])
+    parser.add_argument('--synthetic-count', help='Synthetic photos generated (half of them without board)',
+                        type=int, required=False, default=20)
+    parser.add_argument('--modes', help='Detection modes to test', nargs='+', type=str, required=False,
+                        default=list(DETECTION_MODES.keys()), choices=list(DETECTION_MODES.keys()))
+    parser.add_argument('--output', help='JSON output file', type=str, required=False, default=None)
+
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+# region Corpus
+def generate_chessboard_photos(count, pattern_size=PATTERN_SIZE, shape=(1920, 1080), seed=0):
+    # Board in a random pose for even indexes, only background clutter for odd ones
+    random_generator = np.random.default_rng(seed)
+    width, height = shape
+    square = 40
+    columns, rows = pattern_size[0] + 1, pattern_size[1] + 1
+    board = np.full(((rows + 2) * square, (columns + 2) * square), 255, dtype=np.uint8)
+    for row in range(rows):
+        for column in range(columns):
+            if (row + column) % 2 == 0:
+                board[(row + 1) * square:(row + 2) * square, (column + 1) * square:(column + 2) * square] = 0
+
+    photos = []
+    for index in range(count):
+        photo = random_generator.integers(90, 160, size=(height, width), dtype=np.uint8)
+        photo = cv2.GaussianBlur(photo, (0, 0), 8)
+        if index % 2 == 0:
+            board_height, board_width = board.shape
+            scale = random_generator.uniform(1, 2.5)
+            origin = random_generator.uniform([20, 20], [width - board_width * scale - 20,
+                                                       height - board_height * scale - 20])
+            source = np.float32([[0, 0], [board_width, 0], [board_width, board_height], [0, board_height]])
+            destination = source * scale + origin + random_generator.uniform(-20, 20, (4, 2))
+            homography = cv2.getPerspectiveTransform(source, destination.astype(np.float32))
+            warped = cv2.warpPerspective(board, homography, (width, height), borderValue=0)
+            mask = cv2.warpPerspective(np.full_like(board, 255), homography, (width, height))
+            photo = np.where(mask > 0, warped, photo)
+        photos.append((f"synthetic_{index:03d}", cv2.cvtColor(photo, cv2.COLOR_GRAY2BGR)))
+    return photos
+
+
+def load_photos(path, type_image):
+    image_transform_class = ImageTransformerIR if type_image == KinectFrames.INFRARED.name else ImageTransformerRGB
+    photos = []
+    for image_file in sorted(os.listdir(path)):
+        if image_file.endswith((".jpg", ".png")):
+            photos.append((image_file, image_transform_class.load(os.path.join(path, image_file))))
+    return photos
+
+
+# endregion
+
+def run_mode(photos, mode, image_transform_class, pattern_size=PATTERN_SIZE):
+    coarse_width, use_sb = DETECTION_MODES[mode]
+    detections = {}
+    for name, photo in photos:
+        start = time.perf_counter()
+        ret, corners = image_transform_class.find_chessboard_corners(image=photo, pattern_size=pattern_size,
+                                                                     coarse_width=coarse_width, use_sb=use_sb)
+        detections[name] = {"time_ms": (time.perf_counter() - start) * 1000,
+                            "corners": corners.reshape(-1, 2) if ret else None}
+    return detections
+
+
+def corner_difference(corners, reference_corners):
+    # The sector based detector may start the board from the opposite corner
+    return float(min(np.max(np.linalg.norm(corners - reference_corners, axis=1)),
+                     np.max(np.linalg.norm(corners[::-1] - reference_corners, axis=1))))
+
+
+def summarize_mode(mode, detections, reference=None):
+    times = [detection["time_ms"] for detection in detections.values()]
+    found = [name for name, detection in detections.items() if detection["corners"] is not None]
+    summary = {
+        "mode": mode,
+        "images": len(detections),
+        "found": len(found),
+        "hit_rate": len(found) / len(detections) if detections else 0.0,
+        "mean_ms": float(np.mean(times)) if times else 0.0,
+        "median_ms": float(np.median(times)) if times else 0.0,
+        "max_ms": float(np.max(times)) if times else 0.0,
+        "max_corner_diff_px": None,
+        "per_image_ms": {name: detection["time_ms"] for name, detection in detections.items()}
+    }
+
+    if reference is not None:
+        differences = [corner_difference(detections[name]["corners"], reference[name]["corners"])
+                       for name in found if reference[name]["corners"] is not None]
+        summary["max_corner_diff_px"] = max(differences) if differences else None
+    return summary
+
+
+def format_summaries(summaries):
+    lines = [f"{'Mode':<20} {'Found':>7} {'Hit %':>6} {'Mean ms':>9} {'Median ms':>10} {'Max ms':>8} {'Diff px':>8}"]
+    for summary in summaries:
+        difference = "-" if summary["max_corner_diff_px"] is None else f"{summary['max_corner_diff_px']:.2f}"
+        lines.append(f"{summary['mode']:<20} {summary['found']:>3}/{summary['images']:<3} "
+                     f"{summary['hit_rate'] * 100:>6.0f} {summary['mean_ms']:>9.1f} {summary['median_ms']:>10.1f} "
+                     f"{summary['max_ms']:>8.1f} {difference:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    args = get_args()
+
+    # Initialize logging class
+    logging.basicConfig(handlers=[logging.StreamHandler(sys.stdout)],
+                        level=args.logging,
+                        format='%(asctime)s %(levelname)-4s %(message)s',
+                        datefmt='%H:%M:%S')
+
+    if args.images:
+        photos = load_photos(path=args.images, type_image=args.type)
+    else:
+        photos = generate_chessboard_photos(count=args.synthetic_count)
+    image_transform_class = ImageTransformerIR if args.type == KinectFrames.INFRARED.name else ImageTransformerRGB
+    logging.info(f"Detecting {PATTERN_SIZE} chessboard in {len(photos)} photos")
+
+    reference = None
+    summaries = []
+    for mode in args.modes:
+        detections = run_mode(photos=photos, mode=mode, image_transform_class=image_transform_class)
+        # Corner differences are measured against the first mode tested
+        summaries.append(summarize_mode(mode=mode, detections=detections, reference=reference))
+        if reference is None:
+            reference = detections
+
+    logging.info(f"Chessboard detection per image:\n{format_summaries(summaries)}")
+
+    if args.output:
+        generate_folders(os.path.abspath(args.output))
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(summaries, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
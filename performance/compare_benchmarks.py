@@ -0,0 +1,275 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+
+import numpy as np
+from scipy import stats
+
+from performance.benchmark_depth_pipeline import run_benchmark, generate_depth_corpus, load_depth_corpus, \
+    save_results
+from utils import generate_folders
+
+REGRESSION_STATUS = "REGRESSION"
+INCONCLUSIVE_STATUS = "inconclusive"
+IMPROVED_STATUS = "improved"
+OK_STATUS = "ok"
+MISSING_STATUS = "missing"
+FAILURE_STATUSES = (REGRESSION_STATUS, MISSING_STATUS)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog="compare_benchmarks",
+                                     description='Rerun the depth pipeline benchmark and fail when any stage regresses '
+                                                 'against a stored baseline',
+                                     epilog='',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
+                        type=int, required=False, default=logging.INFO)
+    parser.add_argument('--baseline', help='Baseline JSON generated by benchmark_depth_pipeline',
+                        type=str, required=True)
+    parser.add_argument('--current', help='Compare against this JSON instead of rerunning the benchmark',
+                        type=str, required=False, default=None)
+    parser.add_argument('--corpus', help='Folder with recorded depth frames used by the baseline',
+                        type=str, required=False, default=None)
+    parser.add_argument('--repeats', help='Benchmark repeats per scenario (>= 2 for confidence intervals)',
+                        type=int, required=False, default=5)
+    parser.add_argument('--tolerance', help='Allowed relative slowdown per stage (0.1 = 10%%)',
+                        type=float, required=False, default=0.10)
+    parser.add_argument('--min-delta-ms', help='Ignore slowdowns smaller than this absolute value',
+                        type=float, required=False, default=0.05)
+    parser.add_argument('--confidence', help='Confidence level of the intervals', type=float, required=False,
+                        default=0.95)
+    parser.add_argument('--report', help='Write the diff report (markdown) to this file', type=str, required=False,
+                        default=None)
+    parser.add_argument('--output', help='Save the rerun results JSON to this file', type=str, required=False,
+                        default=None)
+    parser.add_argument('--update-baseline', help='Overwrite the baseline with the rerun results if no regression',
+                        action='store_true', required=False, default=False)
+
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+# region Statistics
+def get_stage_values(stage):
+    if "repeat_means_ms" in stage:
+        return list(stage["repeat_means_ms"])
+    return [stage["mean_ms"]]
+
+
+def mean_confidence_interval(values, confidence=0.95):
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(np.mean(values))
+    if values.size < 2:
+        return mean, None
+    standard_error = float(np.std(values, ddof=1)) / math.sqrt(values.size)
+    return mean, float(stats.t.ppf((1 + confidence) / 2, values.size - 1)) * standard_error
+
+
+def welch_difference_interval(baseline_values, current_values, confidence=0.95):
+    baseline_values = np.asarray(baseline_values, dtype=np.float64)
+    current_values = np.asarray(current_values, dtype=np.float64)
+    difference = float(np.mean(current_values) - np.mean(baseline_values))
+
+    if baseline_values.size < 2 or current_values.size < 2:
+        return difference, None, None
+
+    baseline_variance = float(np.var(baseline_values, ddof=1)) / baseline_values.size
+    current_variance = float(np.var(current_values, ddof=1)) / current_values.size
+    standard_error = math.sqrt(baseline_variance + current_variance)
+    if standard_error == 0:
+        return difference, difference, difference
+
+    degrees_freedom = (baseline_variance + current_variance) ** 2 / (
+            baseline_variance ** 2 / (baseline_values.size - 1) + current_variance ** 2 / (current_values.size - 1))
+    half_width = float(stats.t.ppf((1 + confidence) / 2, degrees_freedom)) * standard_error
+    return difference, difference - half_width, difference + half_width
+
+
+def compare_stage(baseline_values, current_values, tolerance=0.10, confidence=0.95, min_delta_ms=0.05):
+    baseline_mean, baseline_half_width = mean_confidence_interval(values=baseline_values, confidence=confidence)
+    current_mean, current_half_width = mean_confidence_interval(values=current_values, confidence=confidence)
+    difference, difference_low, difference_high = welch_difference_interval(baseline_values=baseline_values,
+                                                                            current_values=current_values,
+                                                                            confidence=confidence)
+
+    if difference_low is None:
+        # Without repeats there is no interval, the point estimate is the only evidence
+        difference_low = difference_high = difference
+
+    change = difference / baseline_mean if baseline_mean else 0.0
+    change_low = difference_low / baseline_mean if baseline_mean else 0.0
+    change_high = difference_high / baseline_mean if baseline_mean else 0.0
+
+    if change_low > tolerance and difference_low > min_delta_ms:
+        status = REGRESSION_STATUS
+    elif change > tolerance and difference > min_delta_ms:
+        status = INCONCLUSIVE_STATUS
+    elif change_high < -tolerance:
+        status = IMPROVED_STATUS
+    else:
+        status = OK_STATUS
+
+    return {
+        "baseline_mean_ms": baseline_mean,
+        "baseline_ci_ms": baseline_half_width,
+        "current_mean_ms": current_mean,
+        "current_ci_ms": current_half_width,
+        "change": change,
+        "change_low": change_low,
+        "change_high": change_high,
+        "baseline_repeats": len(baseline_values),
+        "current_repeats": len(current_values),
+        "status": status
+    }
+
+
+def compare_results(baseline, current, tolerance=0.10, confidence=0.95, min_delta_ms=0.05):
+    comparisons = []
+    for scenario_name, baseline_scenario in baseline["scenarios"].items():
+        current_scenario = current["scenarios"].get(scenario_name)
+        for stage_name, baseline_stage in baseline_scenario["stages"].items():
+            comparison = {"scenario": scenario_name, "stage": stage_name}
+            if current_scenario is None or stage_name not in current_scenario["stages"]:
+                comparison["status"] = MISSING_STATUS
+            else:
+                comparison.update(compare_stage(baseline_values=get_stage_values(baseline_stage),
+                                                current_values=get_stage_values(
+                                                    current_scenario["stages"][stage_name]),
+                                                tolerance=tolerance, confidence=confidence,
+                                                min_delta_ms=min_delta_ms))
+            comparisons.append(comparison)
+    return comparisons
+
+
+def get_failures(comparisons):
+    # A stage that disappeared can not be proven to be as fast as before, it fails like a regression
+    return [comparison for comparison in comparisons if comparison["status"] in FAILURE_STATUSES]
+
+
+def get_corpus_mismatch(baseline, current):
+    baseline_corpus = baseline["metadata"].get("corpus")
+    current_corpus = current["metadata"].get("corpus")
+    if baseline_corpus != current_corpus:
+        return f"Baseline corpus {baseline_corpus} and current corpus {current_corpus} differ, timings are not " \
+               f"comparable (use --corpus with the baseline frames or record a new baseline)"
+    return None
+
+
+# endregion
+
+# region Report
+def format_interval(mean, half_width):
+    if half_width is None:
+        return f"{mean:.3f}"
+    return f"{mean:.3f} ± {half_width:.3f}"
+
+
+def format_report(comparisons, baseline, current, tolerance, confidence):
+    lines = [
+        "# Benchmark comparison",
+        "",
+        f"- Baseline: commit `{baseline['metadata'].get('git_commit')}` ({baseline['metadata'].get('date')})",
+        f"- Current: commit `{current['metadata'].get('git_commit')}` ({current['metadata'].get('date')})",
+        f"- Tolerance: {tolerance * 100:.1f}% slowdown, {confidence * 100:.0f}% confidence intervals",
+        "",
+        "| Scenario | Stage | Baseline ms | Current ms | Change | Change CI | Status |",
+        "|---|---|---|---|---|---|---|"
+    ]
+    for comparison in comparisons:
+        if comparison["status"] == MISSING_STATUS:
+            lines.append(f"| {comparison['scenario']} | {comparison['stage']} | | | | | {MISSING_STATUS} |")
+            continue
+        lines.append(
+            f"| {comparison['scenario']} | {comparison['stage']} "
+            f"| {format_interval(comparison['baseline_mean_ms'], comparison['baseline_ci_ms'])} "
+            f"| {format_interval(comparison['current_mean_ms'], comparison['current_ci_ms'])} "
+            f"| {comparison['change'] * 100:+.1f}% "
+            f"| [{comparison['change_low'] * 100:+.1f}%, {comparison['change_high'] * 100:+.1f}%] "
+            f"| {comparison['status']} |")
+
+    regressions = [comparison for comparison in comparisons if comparison["status"] == REGRESSION_STATUS]
+    missing = [comparison for comparison in comparisons if comparison["status"] == MISSING_STATUS]
+    lines.extend(["", f"**{len(regressions)} regression(s)** and **{len(missing)} missing** out of "
+                      f"{len(comparisons)} stages"])
+    return "\n".join(lines)
+
+
+# endregion
+
+def load_results(path):
+    with open(path, encoding="utf-8") as results_file:
+        return json.load(results_file)
+
+
+def rerun_baseline_scenarios(baseline, corpus_path=None, repeats=5):
+    scenarios = baseline["scenarios"].values()
+    resolutions = sorted({tuple(scenario["resolution"]) for scenario in scenarios}, key=lambda shape: shape[0])
+    contour_steps = sorted({scenario["contour_steps"] for scenario in scenarios})
+    stages = sorted({stage_name for scenario in scenarios for stage_name in scenario["stages"].keys()})
+    first_scenario = next(iter(scenarios))
+
+    if corpus_path:
+        corpus = load_depth_corpus(path=corpus_path)
+        corpus_name = os.path.abspath(corpus_path)
+    else:
+        corpus = generate_depth_corpus(frame_count=first_scenario["frames"])
+        corpus_name = f"synthetic_{first_scenario['frames']}_frames"
+
+    return run_benchmark(corpus=corpus, resolutions=resolutions, contour_steps=contour_steps, stages=stages,
+                         warmup=first_scenario["warmup"], corpus_name=corpus_name, repeats=repeats)
+
+
+def main():
+    args = get_args()
+
+    # Initialize logging class
+    logging.basicConfig(handlers=[logging.StreamHandler(sys.stdout)],
+                        level=args.logging,
+                        format='%(asctime)s %(levelname)-4s %(message)s',
+                        datefmt='%H:%M:%S')
+
+    baseline = load_results(path=args.baseline)
+    if args.current:
+        current = load_results(path=args.current)
+    else:
+        current = rerun_baseline_scenarios(baseline=baseline, corpus_path=args.corpus, repeats=args.repeats)
+        if args.output:
+            save_results(results=current, output_path=args.output)
+
+    corpus_mismatch = get_corpus_mismatch(baseline=baseline, current=current)
+    if corpus_mismatch:
+        logging.error(corpus_mismatch)
+        sys.exit(1)
+
+    comparisons = compare_results(baseline=baseline, current=current, tolerance=args.tolerance,
+                                  confidence=args.confidence, min_delta_ms=args.min_delta_ms)
+    report = format_report(comparisons=comparisons, baseline=baseline, current=current, tolerance=args.tolerance,
+                           confidence=args.confidence)
+    logging.info(f"\n{report}")
+
+    if args.report:
+        generate_folders(os.path.abspath(args.report))
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            report_file.write(report + "\n")
+
+    failures = get_failures(comparisons=comparisons)
+    if failures:
+        for failure in failures:
+            if failure["status"] == MISSING_STATUS:
+                logging.error(f"Stage {failure['stage']} in {failure['scenario']} is missing in the current results")
+                continue
+            logging.error(f"Stage {failure['stage']} in {failure['scenario']} regressed "
+                          f"{failure['change'] * 100:+.1f}% (CI lower bound {failure['change_low'] * 100:+.1f}%)")
+        sys.exit(1)
+
+    if args.update_baseline and not args.current:
+        save_results(results=current, output_path=args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+from scipy.spatial.distance import directed_hausdorff
+
+from app.app import calculate_smoothed_contours
+from image_management.ImageTransformerBase import ImageTransformerBase
+from image_management.ImageTransformerDepth import ImageTransformerDepth
+from literals import ConfigControllerEnum, STANDARD_MIN_DEPTH, BOX_HEIGHT
+from performance.benchmark_depth_pipeline import generate_depth_corpus, load_depth_corpus, generate_config_values, \
+    generate_depth_calibration
+from utils import generate_folders
+
+IMAGE_CASE = "image"
+CONTOURS_CASE = "contours"
+
+
+class EquivalenceCase:
+    """
+    Reference implementation (today's code) against a fast path. Both receive the output of `prepare`, computed
+    once per frame from {"depth_image", "previous_depth", "config_values"} and not included in the timings.
+    """
+
+    def __init__(self, name, reference, candidate, kind=IMAGE_CASE, prepare=None, max_abs_error=0.0,
+                 max_hausdorff=0.0, max_mean_abs_error=None):
+        self.name = name
+        self.reference = reference
+        self.candidate = candidate
+        self.kind = kind
+        self.prepare = prepare if prepare is not None else (lambda frame_inputs: frame_inputs)
+        self.max_abs_error = max_abs_error
+        self.max_hausdorff = max_hausdorff
+        self.max_mean_abs_error = max_mean_abs_error
+
+
+EQUIVALENCE_CASES = {}
+
+
+def register_equivalence_case(name, reference, candidate, kind=IMAGE_CASE, prepare=None, max_abs_error=0.0,
+                              max_hausdorff=0.0, max_mean_abs_error=None):
+    EQUIVALENCE_CASES[name] = EquivalenceCase(name=name, reference=reference, candidate=candidate, kind=kind,
+                                              prepare=prepare, max_abs_error=max_abs_error,
+                                              max_hausdorff=max_hausdorff, max_mean_abs_error=max_mean_abs_error)
+    return EQUIVALENCE_CASES[name]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog="equivalence_harness",
+                                     description='Compare optimized image transforms against the reference '
+                                                 'implementations over a frame corpus',
+                                     epilog='',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
+                        type=int, required=False, default=logging.INFO)
+    parser.add_argument('--cases', help='Cases to run (default: all registered)', nargs='+', type=str,
+                        required=False, default=None)
+    parser.add_argument('--corpus', help='Folder with recorded depth frames (.npy or 16 bit .png)', type=str,
+                        required=False, default=None)
+    parser.add_argument('--frames', help='Number of synthetic frames', type=int, required=False, default=20)
+    parser.add_argument('--contour-steps', help='Contour level steps', type=int, required=False, default=10)
+    parser.add_argument('--output', help='JSON output file', type=str, required=False, default=None)
+
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+# region Metrics
+def compare_images(reference, candidate):
+    reference = np.asarray(reference)
+    candidate = np.asarray(candidate)
+    if reference.shape != candidate.shape:
+        raise ValueError(f"Shape mismatch between reference {reference.shape} and candidate {candidate.shape}")
+
+    difference = np.abs(reference.astype(np.float64) - candidate.astype(np.float64))
+    return {
+        "max_abs_error": float(np.max(difference)) if difference.size else 0.0,
+        "mean_abs_error": float(np.mean(difference)) if difference.size else 0.0,
+        "different_pixels": int(np.count_nonzero(difference))
+    }
+
+
+def contours_to_points(contours):
+    if not len(contours):
+        return np.zeros((0, 2), dtype=np.float64)
+    return np.concatenate([np.asarray(contour, dtype=np.float64).reshape(-1, 2) for contour in contours])
+
+
+def compare_contours(reference, candidate):
+    reference_points = contours_to_points(contours=reference)
+    candidate_points = contours_to_points(contours=candidate)
+
+    if not len(reference_points) and not len(candidate_points):
+        hausdorff = 0.0
+    elif not len(reference_points) or not len(candidate_points):
+        hausdorff = float("inf")
+    else:
+        hausdorff = max(directed_hausdorff(reference_points, candidate_points)[0],
+                        directed_hausdorff(candidate_points, reference_points)[0])
+
+    return {
+        "hausdorff": float(hausdorff),
+        "reference_contours": len(reference),
+        "candidate_contours": len(candidate)
+    }
+
+
+def compare_outputs(case, reference, candidate):
+    if case.kind == CONTOURS_CASE:
+        return compare_contours(reference=reference, candidate=candidate)
+    return compare_images(reference=reference, candidate=candidate)
+
+
+def check_image_errors(case, max_abs_error, mean_abs_error):
+    # None disables a bound, interpolation changes are checked on the mean error only
+    return (case.max_abs_error is None or max_abs_error <= case.max_abs_error) and \
+        (case.max_mean_abs_error is None or mean_abs_error <= case.max_mean_abs_error)
+
+
+def check_metrics(case, metrics):
+    if case.kind == CONTOURS_CASE:
+        return metrics["hausdorff"] <= case.max_hausdorff
+    return check_image_errors(case=case, max_abs_error=metrics["max_abs_error"],
+                              mean_abs_error=metrics["mean_abs_error"])
+
+
+# endregion
+
+# region Offline harness
+def run_case(case, frames, config_values):
+    per_frame = []
+    reference_times = []
+    candidate_times = []
+
+    previous_depth = ImageTransformerDepth.set_data_between_distance(
+        image=ImageTransformerDepth.remove_zeros(image=frames[0]),
+        min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
+        max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name])
+
+    for frame in frames:
+        inputs = case.prepare({"depth_image": frame, "previous_depth": previous_depth,
+                               "config_values": config_values})
+
+        start = time.perf_counter()
+        reference = case.reference(inputs)
+        reference_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        candidate = case.candidate(inputs)
+        candidate_times.append(time.perf_counter() - start)
+
+        per_frame.append(compare_outputs(case=case, reference=reference, candidate=candidate))
+
+    summary = summarize_case(case=case, per_frame=per_frame, reference_times=reference_times,
+                             candidate_times=candidate_times)
+    return summary
+
+
+def summarize_case(case, per_frame, reference_times, candidate_times):
+    reference_ms = float(np.mean(reference_times)) * 1000 if reference_times else 0.0
+    candidate_ms = float(np.mean(candidate_times)) * 1000 if candidate_times else 0.0
+
+    summary = {
+        "case": case.name,
+        "kind": case.kind,
+        "frames": len(per_frame),
+        "reference_mean_ms": reference_ms,
+        "candidate_mean_ms": candidate_ms,
+        "speedup": reference_ms / candidate_ms if candidate_ms else None
+    }
+    if case.kind == CONTOURS_CASE:
+        summary["max_hausdorff"] = max((metrics["hausdorff"] for metrics in per_frame), default=0.0)
+        summary["mean_hausdorff"] = float(np.mean([metrics["hausdorff"] for metrics in per_frame])) \
+            if per_frame else 0.0
+        summary["passed"] = summary["max_hausdorff"] <= case.max_hausdorff
+    else:
+        summary["max_abs_error"] = max((metrics["max_abs_error"] for metrics in per_frame), default=0.0)
+        summary["mean_abs_error"] = float(np.mean([metrics["mean_abs_error"] for metrics in per_frame])) \
+            if per_frame else 0.0
+        summary["passed"] = all(check_metrics(case=case, metrics=metrics) for metrics in per_frame)
+    return summary
+
+
+def format_summaries(summaries):
+    lines = [f"{'Case':<32} {'Frames':>6} {'Max err':>10} {'Mean err':>10} {'Hausdorff':>10} "
+             f"{'Ref ms':>9} {'Fast ms':>9} {'Speedup':>8} {'Result':>7}"]
+    for summary in summaries:
+        max_error = summary.get("max_abs_error")
+        mean_error = summary.get("mean_abs_error")
+        hausdorff = summary.get("max_hausdorff")
+        lines.append(f"{summary['case']:<32} {summary['frames']:>6} "
+                     f"{'' if max_error is None else f'{max_error:.4f}':>10} "
+                     f"{'' if mean_error is None else f'{mean_error:.4f}':>10} "
+                     f"{'' if hausdorff is None else f'{hausdorff:.3f}':>10} "
+                     f"{summary['reference_mean_ms']:>9.3f} {summary['candidate_mean_ms']:>9.3f} "
+                     f"{summary['speedup'] or 0:>8.2f} {'OK' if summary['passed'] else 'FAIL':>7}")
+    return "\n".join(lines)
+
+
+# endregion
+
+# region Shadow mode
+class ShadowComparator:
+    """
+    Runs a registered case on live frames in a background thread. Frames arriving while the previous comparison is
+    still running are skipped, so the projector loop never waits for the shadow path.
+    """
+
+    def __init__(self, case, every_frames=10):
+        self.case = case
+        self.every_frames = every_frames
+
+        self.lock = threading.Lock()
+        self.busy = threading.Event()
+        self.frame_counter = 0
+        self.skipped = 0
+
+        self.per_frame = []
+        self.reference_times = []
+        self.candidate_times = []
+        self.failures = 0
+
+    def submit(self, depth_image, previous_depth, config_values):
+        self.frame_counter += 1
+        if self.frame_counter % self.every_frames:
+            return False
+        if self.busy.is_set():
+            self.skipped += 1
+            return False
+
+        self.busy.set()
+        frame_inputs = {"depth_image": np.copy(depth_image), "previous_depth": np.copy(previous_depth),
+                        "config_values": dict(config_values)}
+        threading.Thread(target=self._compare, name=f"shadow-{self.case.name}", args=(frame_inputs,),
+                         daemon=True).start()
+        return True
+
+    def _compare(self, frame_inputs):
+        try:
+            inputs = self.case.prepare(frame_inputs)
+
+            start = time.perf_counter()
+            reference = self.case.reference(inputs)
+            reference_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            candidate = self.case.candidate(inputs)
+            candidate_time = time.perf_counter() - start
+
+            metrics = compare_outputs(case=self.case, reference=reference, candidate=candidate)
+            with self.lock:
+                self.per_frame.append(metrics)
+                self.reference_times.append(reference_time)
+                self.candidate_times.append(candidate_time)
+                if not check_metrics(case=self.case, metrics=metrics):
+                    self.failures += 1
+                    logging.warning(f"Shadow case {self.case.name} out of tolerance: {metrics}")
+        except Exception as error:
+            logging.error(f"Shadow case {self.case.name} failed: {error}")
+        finally:
+            self.busy.clear()
+
+    def summary(self):
+        with self.lock:
+            summary = summarize_case(case=self.case, per_frame=list(self.per_frame),
+                                     reference_times=list(self.reference_times),
+                                     candidate_times=list(self.candidate_times))
+        summary["skipped"] = self.skipped
+        summary["failures"] = self.failures
+        return summary
+
+    def log_summary(self):
+        logging.info(f"Shadow comparison ({self.skipped} frames skipped, {self.failures} out of tolerance):\n"
+                     f"{format_summaries([self.summary()])}")
+
+
+def create_shadow_comparator(case_name, every_frames=10):
+    if case_name not in EQUIVALENCE_CASES:
+        raise ValueError(f"Equivalence case {case_name} not registered, available: {list(EQUIVALENCE_CASES.keys())}")
+    return ShadowComparator(case=EQUIVALENCE_CASES[case_name], every_frames=every_frames)
+
+
+# endregion
+
+# region Common preparations
+def blur_depth(depth_image, config_values):
+    # Single frame simplification of process_depth_frame: remove zeros and clip to the sandbox range (no previous
+    # frame combination, noise filters or camera focus), then the same normalize, uint8 and 11x11 blur for contours
+    depth_image = ImageTransformerDepth.remove_zeros(image=depth_image)
+    depth_image = ImageTransformerDepth.set_data_between_distance(
+        image=depth_image, min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
+        max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name])
+    depth_image = ImageTransformerDepth.normalize_between_distance(
+        image=depth_image, min_depth=config_values[ConfigControllerEnum.MIN_DEPTH.name],
+        max_depth=config_values[ConfigControllerEnum.MAX_DEPTH.name])
+    depth_image_uint8 = ImageTransformerDepth.transform_dtype(image=depth_image, dtype=np.uint8)
+    return depth_image_uint8, ImageTransformerDepth.degaussing(image=depth_image_uint8, ksize=(11, 11), sigma_x=0)
+
+
+def prepare_blurred_depth(frame_inputs):
+    inputs = dict(frame_inputs)
+    inputs["depth_image_uint8"], inputs["depth_image_blurred"] = blur_depth(
+        depth_image=frame_inputs["depth_image"], config_values=frame_inputs["config_values"])
+    return inputs
+
+
+def smoothed_contours(depth_image, config_values):
+    _, depth_image_blurred = blur_depth(depth_image=depth_image, config_values=config_values)
+    return calculate_smoothed_contours(image=depth_image_blurred, config_values=config_values)
+
+
+def reference_colormap(inputs):
+    depth_image_uint8_inverted = ImageTransformerDepth.invert(image=inputs["depth_image_uint8"])
+    return ImageTransformerDepth.apply_colormap(image=depth_image_uint8_inverted,
+                                                colormap=inputs["config_values"][ConfigControllerEnum.COLORMAP.name])
+
+
+_COLORMAP_LUTS = {}
+
+
+def candidate_colormap_lut(inputs, colormap):
+    # Same LUT the application builds once per COLORMAP change (DerivedConfigValue in app.py)
+    if colormap not in _COLORMAP_LUTS:
+        _COLORMAP_LUTS[colormap] = ImageTransformerBase.generate_colormap_lut(colormap=colormap)
+    return ImageTransformerBase.apply_colormap(image=inputs["depth_image_uint8"], colormap=_COLORMAP_LUTS[colormap])
+
+
+_CALIBRATIONS = {}
+
+
+def prepare_calibration(frame_inputs):
+    # One synthetic calibration per resolution, so the derived maps are built once
+    width, height = ImageTransformerBase.get_image_width_and_height(image=frame_inputs["depth_image"])
+    if (width, height) not in _CALIBRATIONS:
+        _CALIBRATIONS[(width, height)] = generate_depth_calibration(shape=(width, height))
+
+    inputs = dict(frame_inputs)
+    inputs["calibration"] = _CALIBRATIONS[(width, height)]
+    return inputs
+
+
+def reference_undistort(inputs):
+    calibration = inputs["calibration"]
+    return ImageTransformerBase.distort(image=inputs["depth_image"], camera_matrix=calibration.camera_matrix,
+                                        distortion_coefficients=calibration.cof_distortion)
+
+
+# endregion
+
+# region Registered cases
+register_equivalence_case(
+    name="undistort_remap", reference=reference_undistort, prepare=prepare_calibration,
+    candidate=lambda inputs: inputs["calibration"].applied_camera_calibration(image=inputs["depth_image"]))
+# Single interpolation instead of two: mean error ~5 mm, but up to ~740 mm on depth edges where one interpolation
+# mixes foreground and background. Opt-in only (CALIBRATION_FUSED_REMAP), the mean is the bound checked here
+register_equivalence_case(
+    name="fused_remap", prepare=prepare_calibration, max_abs_error=None, max_mean_abs_error=10.0,
+    reference=lambda inputs: ImageTransformerBase.warp_perspective(image=reference_undistort(inputs),
+                                                                   warp_matrix=inputs["calibration"].matrix_homography),
+    candidate=lambda inputs: inputs["calibration"].applied_camera_calibration_and_focus(image=inputs["depth_image"]))
+register_equivalence_case(
+    name="undistort_remap_contours", kind=CONTOURS_CASE, prepare=prepare_calibration, max_hausdorff=0.0,
+    reference=lambda inputs: smoothed_contours(depth_image=reference_undistort(inputs),
+                                               config_values=inputs["config_values"]),
+    candidate=lambda inputs: smoothed_contours(
+        depth_image=inputs["calibration"].applied_camera_calibration(image=inputs["depth_image"]),
+        config_values=inputs["config_values"]))
+# The depth edge errors of the fused remap move level lines ~35 px on average and up to ~52 px (30 frame corpus),
+# bound kept just above that so a regression of the opt-in path is still reported
+register_equivalence_case(
+    name="fused_remap_contours", kind=CONTOURS_CASE, prepare=prepare_calibration, max_hausdorff=60.0,
+    reference=lambda inputs: smoothed_contours(
+        depth_image=ImageTransformerBase.warp_perspective(image=reference_undistort(inputs),
+                                                          warp_matrix=inputs["calibration"].matrix_homography),
+        config_values=inputs["config_values"]),
+    candidate=lambda inputs: smoothed_contours(
+        depth_image=inputs["calibration"].applied_camera_calibration_and_focus(image=inputs["depth_image"]),
+        config_values=inputs["config_values"]))
+# Colorized depth as drawn by process_depth_frame (invert + cached LUT), bit exact against the builtin colormap
+register_equivalence_case(
+    name="depth_colormap", reference=reference_colormap, prepare=prepare_blurred_depth,
+    candidate=lambda inputs: candidate_colormap_lut(
+        inputs={"depth_image_uint8": ImageTransformerDepth.invert(image=inputs["depth_image_uint8"])},
+        colormap=inputs["config_values"][ConfigControllerEnum.COLORMAP.name]))
+# Colormap LUT must be bit exact against the builtin OpenCV colormap, for every colormap available in this build
+for colormap_name in sorted(name for name in dir(cv2) if name.startswith("COLORMAP_")):
+    register_equivalence_case(
+        name=f"colormap_lut_{colormap_name[len('COLORMAP_'):].lower()}", prepare=prepare_blurred_depth,
+        reference=lambda inputs, colormap=getattr(cv2, colormap_name): ImageTransformerBase.apply_colormap(
+            image=inputs["depth_image_uint8"], colormap=colormap),
+        candidate=lambda inputs, colormap=getattr(cv2, colormap_name): candidate_colormap_lut(
+            inputs=inputs, colormap=colormap))
+# endregion
+
+
+def main():
+    args = get_args()
+
+    # Initialize logging class
+    logging.basicConfig(handlers=[logging.StreamHandler(sys.stdout)],
+                        level=args.logging,
+                        format='%(asctime)s %(levelname)-4s %(message)s',
+                        datefmt='%H:%M:%S')
+
+    case_names = args.cases if args.cases else list(EQUIVALENCE_CASES.keys())
+    if not case_names:
+        logging.warning("No equivalence cases registered, nothing to compare")
+        return
+
+    frames = load_depth_corpus(path=args.corpus) if args.corpus else generate_depth_corpus(frame_count=args.frames)
+    config_values = generate_config_values(min_depth=STANDARD_MIN_DEPTH + BOX_HEIGHT,
+                                           max_depth=STANDARD_MIN_DEPTH + BOX_HEIGHT * 3,
+                                           contour_steps=args.contour_steps)
+
+    summaries = []
+    for case_name in case_names:
+        logging.info(f"Running equivalence case {case_name}")
+        summaries.append(run_case(case=EQUIVALENCE_CASES[case_name], frames=frames, config_values=config_values))
+
+    logging.info(f"Equivalence results:\n{format_summaries(summaries)}")
+
+    if args.output:
+        generate_folders(os.path.abspath(args.output))
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(summaries, output_file, indent=2)
+
+    if not all(summary["passed"] for summary in summaries):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from utils import generate_folders
+
+DEFAULT_IMPORT_MODULES = ["literals", "utils", "image_management.ImageTransformerDepth",
+                          "kinect_controller.KinectController", "app.app"]
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog="import_time_report",
+                                     description='Measure the import time of the project modules using '
+                                                 'python -X importtime in a fresh interpreter',
+                                     epilog='',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('--logging', help='Logging level (DEBUG=10, INFO=20, WARNING=30, ERROR=40 or CRITICAL=50)',
+                        type=int, required=False, default=logging.INFO)
+    parser.add_argument('--modules', help='Modules to import', nargs='+', type=str, required=False,
+                        default=DEFAULT_IMPORT_MODULES)
+    parser.add_argument('--repeats', help='Fresh interpreters per module', type=int, required=False, default=5)
+    parser.add_argument('--top', help='Heaviest imports listed per module', type=int, required=False, default=10)
+    parser.add_argument('--output', help='JSON output file', type=str, required=False, default=None)
+
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+def parse_importtime(stderr):
+    # Lines: "import time: self [us] | cumulative | imported package", nested packages are indented
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                        "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return imports
+
+
+def measure_module(module, repeats=5, top=10):
+    totals_ms = []
+    imports = []
+    error = None
+
+    for _ in range(repeats):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=PROJECT_ROOT,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        imports = parse_importtime(process.stderr)
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "unknown error"
+            break
+        totals_ms.append(sum(entry["self_us"] for entry in imports) / 1000)
+
+    # Direct dependencies of the measured module plus the interpreter startup imports
+    heaviest = sorted((entry for entry in imports if entry["depth"] <= 1 and entry["module"] != module),
+                      key=lambda entry: entry["cumulative_us"], reverse=True)[:top]
+    return {
+        "module": module,
+        "error": error,
+        "total_ms": float(np.median(totals_ms)) if totals_ms else None,
+        "modules_loaded": len(imports),
+        "heaviest": [{"module": entry["module"], "cumulative_ms": entry["cumulative_us"] / 1000}
+                     for entry in heaviest]
+    }
+
+
+def format_report(reports):
+    lines = [f"{'Module':<40} {'Import ms':>10} {'Loaded':>7}  Heaviest"]
+    for report in reports:
+        if report["error"]:
+            lines.append(f"{report['module']:<40} {'FAILED':>10} {report['modules_loaded']:>7}  {report['error']}")
+            continue
+        heaviest = ", ".join(f"{entry['module']} {entry['cumulative_ms']:.1f}" for entry in report["heaviest"][:3])
+        lines.append(f"{report['module']:<40} {report['total_ms']:>10.1f} {report['modules_loaded']:>7}  {heaviest}")
+    return "\n".join(lines)
+
+
+def main():
+    args = get_args()
+
+    # Initialize logging class
+    logging.basicConfig(handlers=[logging.StreamHandler(sys.stdout)],
+                        level=args.logging,
+                        format='%(asctime)s %(levelname)-4s %(message)s',
+                        datefmt='%H:%M:%S')
+
+    reports = []
+    for module in args.modules:
+        logging.info(f"Measuring import of {module}")
+        reports.append(measure_module(module=module, repeats=args.repeats, top=args.top))
+
+    logging.info(f"Import times (median of {args.repeats} fresh interpreters):\n{format_report(reports)}")
+
+    if args.output:
+        generate_folders(os.path.abspath(args.output))
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(reports, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
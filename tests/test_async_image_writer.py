@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from image_management.AsyncImageWriter import AsyncImageWriter
+from image_management.ImageObject import ImageObject
+from image_management.ImageTransformerDepth import ImageTransformerDepth
+from image_management.ImageTransformerIR import ImageTransformerIR
+
+
+class TestAsyncImageWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_depth_and_ir_png_are_lossless(self):
+        depth_image = np.random.default_rng(0).integers(0, 8000, size=(424, 512), dtype=np.uint16)
+        infrared_image = np.random.default_rng(1).integers(0, 65535, size=(424, 512), dtype=np.uint16)
+        depth_path = os.path.join(self.temp_dir.name, "depth.png")
+        infrared_path = os.path.join(self.temp_dir.name, "infrared.png")
+
+        image_writer = AsyncImageWriter(workers=2, queue_size=1)
+        image_writer.write(save_function=ImageTransformerDepth.save, image=depth_image, output_path=depth_path)
+        image_writer.write(save_function=ImageTransformerIR.save, image=infrared_image, output_path=infrared_path)
+        self.assertEqual(image_writer.close(), [])
+
+        depth_obj = ImageObject(image_absolute_path=depth_path, image_transform_class=ImageTransformerDepth, lazy=True)
+        self.assertEqual(depth_obj.image_shape, (424, 512))
+        np.testing.assert_array_equal(depth_obj.image, depth_image)
+        np.testing.assert_array_equal(ImageTransformerIR.load(image_path=infrared_path), infrared_image)
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ["depth.png", "infrared.png"])
+
+    def test_jpg_keeps_normalized_8_bit(self):
+        depth_path = os.path.join(self.temp_dir.name, "depth.jpg")
+        ImageTransformerDepth.save(image=np.full((10, 10), 1200, dtype=np.uint16), output_path=depth_path)
+        self.assertEqual(ImageTransformerDepth.load(image_path=depth_path).dtype, np.uint8)
+
+    def test_failed_write_is_reported(self):
+        def failing_save(image, output_path):
+            with open(output_path, "wb") as output_file:
+                output_file.write(b"partial")
+            raise IOError("disk full")
+
+        output_path = os.path.join(self.temp_dir.name, "image.png")
+        image_writer = AsyncImageWriter(workers=1, queue_size=1)
+        image_writer.write(save_function=failing_save, image=None, output_path=output_path)
+        errors = image_writer.close()
+        self.assertEqual([path for path, _ in errors], [output_path])
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
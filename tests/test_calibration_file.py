@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from calibrations.CalibrationFile import CalibrationClass
+from literals import CALIBRATION_MANIFEST_FILENAME, OBJ_POINTS_KEY, UNDISTORT_MAPS_VARIABLE
+
+
+class TestCalibrationFile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.calibration_path = os.path.join(self.temp_dir.name, "calibration.npz")
+
+        board = np.zeros((54, 3), dtype=np.float32)
+        board[:, :2] = np.mgrid[0:9, 0:6].T.reshape(-1, 2)
+        self.calibration = CalibrationClass(
+            camera_matrix=np.array([[365.0, 0, 256], [0, 365.0, 212], [0, 0, 1]]),
+            cof_distortion=np.array([[0.09, -0.27, 0.0, 0.0, 0.09]]), obj_points=[board] * 5,
+            image_shape=(424, 512), calibration_path_file=self.calibration_path)
+        self.calibration.calculate_homography(cords=[[20, 15], [495, 10], [505, 410], [10, 400]],
+                                              original_cords=[[0, 0], [512, 0], [512, 424], [0, 424]])
+        self.image = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 255, (424, 512), dtype=np.uint8), (0, 0), 3)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_manifest(self):
+        with open(os.path.join(self.calibration.get_bundle_path(), CALIBRATION_MANIFEST_FILENAME)) as manifest_file:
+            return json.load(manifest_file)
+
+    def test_bundle_roundtrip_is_memory_mapped(self):
+        self.calibration.save_calibration()
+
+        loaded = CalibrationClass(calibration_path_file=self.calibration_path)
+        loaded.read_calibration()
+
+        self.assertIsInstance(loaded.camera_matrix, np.memmap)
+        np.testing.assert_array_equal(loaded.matrix_homography, self.calibration.matrix_homography)
+        self.assertEqual(len(loaded.obj_points), 5)
+        obj_points_file = self.read_manifest()["arrays"][OBJ_POINTS_KEY]["file"]
+        self.assertEqual(np.load(os.path.join(loaded.get_bundle_path(), obj_points_file)).shape, (1, 54, 3))
+        self.assertEqual(loaded.calculate_content_hash(), self.read_manifest()["content_hash"])
+
+    def test_undistort_matches_reference(self):
+        reference = cv2.undistort(self.image, self.calibration.camera_matrix, self.calibration.cof_distortion)
+        np.testing.assert_array_equal(self.calibration.applied_camera_calibration(image=self.image), reference)
+
+        fused = self.calibration.applied_camera_calibration_and_focus(image=self.image)
+        reference = cv2.warpPerspective(reference, self.calibration.matrix_homography, (512, 424))
+        self.assertLess(np.mean(np.abs(fused.astype(np.float64) - reference)), 1.0)
+
+    def test_stale_derived_maps_are_rebuilt(self):
+        self.calibration.save_calibration()
+        manifest = self.read_manifest()
+        self.assertTrue(all(entry["source_hash"] == manifest["content_hash"]
+                            for entry in manifest["derived"].values()))
+
+        # Edit a source array behind the manifest back
+        np.save(os.path.join(self.calibration.get_bundle_path(), manifest["arrays"]["camera_matrix"]["file"]),
+                np.array([[300.0, 0, 256], [0, 300.0, 212], [0, 0, 1]]))
+        loaded = CalibrationClass(calibration_path_file=self.calibration_path)
+        loaded.read_calibration()
+
+        reference = cv2.undistort(self.image, loaded.camera_matrix, loaded.cof_distortion)
+        np.testing.assert_array_equal(loaded.applied_camera_calibration(image=self.image), reference)
+        self.assertIn(OBJ_POINTS_KEY, self.read_manifest()["arrays"])
+
+    def test_bundle_load_save_load_roundtrip(self):
+        self.calibration.save_calibration()
+
+        # Arrays loaded from the bundle are memory mapped, saving them again must not rewrite the mapped files
+        loaded = CalibrationClass(calibration_path_file=self.calibration_path)
+        loaded.read_calibration()
+        loaded.min_depth = 800
+        loaded.save_calibration()
+        np.testing.assert_array_equal(loaded.camera_matrix, self.calibration.camera_matrix)
+
+        reloaded = CalibrationClass(calibration_path_file=self.calibration_path)
+        with patch("calibrations.CalibrationFile.logging.warning") as warning:
+            reloaded.read_calibration()
+        warning.assert_not_called()
+        np.testing.assert_array_equal(reloaded.camera_matrix, self.calibration.camera_matrix)
+        np.testing.assert_array_equal(reloaded.matrix_homography, self.calibration.matrix_homography)
+        self.assertEqual(reloaded.min_depth, 800)
+        self.assertEqual(reloaded.calculate_content_hash(), self.read_manifest()["content_hash"])
+
+        # Only the files of the last manifest are kept
+        manifest = self.read_manifest()
+        referenced = set()
+        for entry in list(manifest["arrays"].values()) + list(manifest["derived"].values()):
+            referenced.update(entry.get("files", []))
+            referenced.update(entry[key] for key in ("file", "index") if key in entry)
+        self.assertEqual(set(os.listdir(loaded.get_bundle_path())) - {CALIBRATION_MANIFEST_FILENAME}, referenced)
+
+    def test_readers_never_overwrite_a_newer_bundle(self):
+        # Old calibration only in npz: reading it does not create the bundle, only save_calibration does
+        np.savez(self.calibration_path, **self.calibration.get_calibration_arguments())
+        legacy = CalibrationClass(calibration_path_file=self.calibration_path)
+        self.assertTrue(legacy.read_calibration())
+        self.assertFalse(os.path.exists(legacy.get_bundle_path()))
+
+        self.calibration.save_calibration()
+        reader = CalibrationClass(calibration_path_file=self.calibration_path)
+        reader.read_calibration()
+
+        # Another process saves a new calibration while the reader still holds the old one
+        writer = CalibrationClass(calibration_path_file=self.calibration_path)
+        writer.read_calibration()
+        writer.min_depth = 900
+        writer.save_calibration()
+        manifest = self.read_manifest()
+
+        reader.get_derived_maps(name=UNDISTORT_MAPS_VARIABLE, image_size=(256, 212))
+        self.assertEqual(self.read_manifest(), manifest)
+        for entry in manifest["arrays"].values():
+            for file_name in entry.get("files", []) + [entry[key] for key in ("file", "index") if key in entry]:
+                self.assertTrue(os.path.isfile(os.path.join(writer.get_bundle_path(), file_name)))
+
+        # Same matrices on disk: the reader only adds its derived entry
+        writer.get_derived_maps(name=UNDISTORT_MAPS_VARIABLE, image_size=(256, 212))
+        manifest = self.read_manifest()
+        self.assertIn(f"{UNDISTORT_MAPS_VARIABLE}_256x212", manifest["derived"])
+        self.assertEqual(manifest["content_hash"], writer.calculate_content_hash())
+
+
+if __name__ == '__main__':
+    unittest.main()
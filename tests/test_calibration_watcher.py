@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from calibrations.CalibrationFile import CalibrationClass
+from calibrations.CalibrationWatcher import CalibrationWatcher
+
+
+class TestCalibrationWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.calibration = CalibrationClass(camera_matrix=np.eye(3), cof_distortion=np.zeros((1, 5)),
+                                            calibration_path_file=os.path.join(self.temp_dir.name, "calibration.npz"))
+        self.calibration.min_depth = 700
+        self.calibration.save_calibration()
+
+        self.applied = []
+        self.watcher = CalibrationWatcher(interval=0.01)
+        self.watcher.watch(name="DEPTH", calibration=self.calibration, apply_calibration=self.applied.append)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_changed_file_is_swapped_between_frames(self):
+        self.watcher.check_calibrations()
+        self.assertEqual(self.watcher.swap_pending(), [])
+
+        updated = CalibrationClass(camera_matrix=np.eye(3), cof_distortion=np.zeros((1, 5)),
+                                   calibration_path_file=self.calibration.calibration_path_file)
+        updated.min_depth = 900
+        updated.save_calibration()
+
+        self.watcher.check_calibrations()
+        self.assertEqual(self.applied, [])
+        self.assertEqual(self.watcher.swap_pending(), ["DEPTH"])
+        self.assertEqual(self.applied[0].min_depth, 900)
+
+    def test_explicit_reload(self):
+        self.watcher.request_reload()
+        self.watcher.check_calibrations()
+        self.assertEqual(self.watcher.swap_pending(), ["DEPTH"])
+        self.assertIsNot(self.applied[0], self.calibration)
+
+    def test_only_the_bundle_manifest_triggers_a_reload(self):
+        # A new npz alone (bundle arrays still being written) is not a new calibration
+        np.savez(self.calibration.calibration_path_file, min_depth=900)
+        self.watcher.check_calibrations()
+        self.assertEqual(self.watcher.swap_pending(), [])
+
+    def test_failed_reload_keeps_the_current_calibration(self):
+        # Calibration that lost its camera matrix (empty or partially written files) is not installed
+        broken = CalibrationClass(cof_distortion=np.zeros((1, 5)),
+                                  calibration_path_file=self.calibration.calibration_path_file)
+        broken.save_calibration()
+        signature = self.watcher.signatures["DEPTH"]
+
+        self.watcher.check_calibrations()
+        self.assertEqual(self.watcher.swap_pending(), [])
+        self.assertEqual(self.watcher.signatures["DEPTH"], signature)
+
+        # Unreadable files (bundle and npz removed) neither
+        with patch.object(CalibrationClass, "read_calibration", return_value=False):
+            self.watcher.request_reload()
+            self.watcher.check_calibrations()
+        self.assertEqual(self.watcher.swap_pending(), [])
+
+        # Fixed on disk, the next poll installs it
+        self.calibration.min_depth = 950
+        self.calibration.save_calibration()
+        self.watcher.check_calibrations()
+        self.assertEqual(self.watcher.swap_pending(), ["DEPTH"])
+        self.assertEqual(self.applied[0].min_depth, 950)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from concurrent.futures import wait
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import cv2
+import numpy as np
+
+from calibrations.CameraCalibrationSolver import select_views, solve_camera_calibration, CameraCalibrationSolver
+from interfaces.CalibrateKinectInterface import CalibrateKinectInterface
+
+IMAGE_SIZE = (640, 480)
+CAMERA_MATRIX = np.array([[520.0, 0, 320], [0, 520.0, 240], [0, 0, 1]])
+DIST_COEFS = np.array([0.05, -0.1, 0, 0, 0])
+
+
+def generate_views(view_count, pattern_size=(7, 5), square=0.04, seed=0):
+    random_generator = np.random.default_rng(seed)
+    obj_points = np.zeros((np.prod(pattern_size), 3), np.float32)
+    obj_points[:, :2] = np.indices(pattern_size).T.reshape(-1, 2) * square
+
+    all_obj_points, all_img_points = [], []
+    while len(all_img_points) < view_count:
+        rvec = random_generator.uniform(-0.5, 0.5, 3)
+        tvec = np.array([random_generator.uniform(-0.2, 0.05), random_generator.uniform(-0.15, 0.05),
+                         random_generator.uniform(0.5, 1.0)])
+        img_points, _ = cv2.projectPoints(obj_points, rvec, tvec, CAMERA_MATRIX, DIST_COEFS)
+        img_points = img_points.reshape(-1, 2)
+        if np.any(img_points < 0) or np.any(img_points >= IMAGE_SIZE):
+            continue
+        img_points += random_generator.normal(0, 0.1, img_points.shape)
+        all_obj_points.append(obj_points)
+        all_img_points.append(img_points.astype(np.float32))
+    return all_obj_points, all_img_points
+
+
+class TestCameraCalibrationSolver(unittest.TestCase):
+
+    def test_select_views(self):
+        _, img_points = generate_views(view_count=40)
+        self.assertEqual(select_views(img_points=img_points[:10], image_size=IMAGE_SIZE, max_views=20),
+                         list(range(10)))
+
+        selected = select_views(img_points=img_points, image_size=IMAGE_SIZE, max_views=15)
+        self.assertEqual(len(selected), 15)
+        self.assertEqual(len(set(selected)), 15)
+
+    def test_solve_with_view_subset(self):
+        obj_points, img_points = generate_views(view_count=40)
+        result = solve_camera_calibration(obj_points=obj_points, img_points=img_points, image_size=IMAGE_SIZE,
+                                          max_views=15)
+
+        self.assertEqual(len(result["selected_views"]), 15)
+        self.assertEqual(len(result["view_errors"]), 40)
+        self.assertEqual(len(result["rvecs"]), 40)
+        self.assertLess(max(result["view_errors"]), 1.0)
+        np.testing.assert_allclose(result["camera_matrix"][[0, 1], [0, 1]], [520, 520], rtol=0.02)
+
+    @patch("interfaces.CalibrateKinectInterface.messagebox")
+    def test_failed_calibration_restores_interface(self, messagebox):
+        solver = CameraCalibrationSolver(max_workers=1)
+        solver.submit(stream="COLOR", obj_points=[], img_points=[], image_size=IMAGE_SIZE)
+        wait(list(solver.futures.values()))
+
+        interface = SimpleNamespace(camera_solver=solver, window=MagicMock(), countdown_label=MagicMock(),
+                                    enable_buttons=MagicMock(), exit_after=MagicMock())
+        CalibrateKinectInterface.poll_camera_calibrations(interface)
+
+        messagebox.showerror.assert_called_once()
+        self.assertIsNone(interface.camera_solver)
+        interface.countdown_label.place_forget.assert_called_once()
+        interface.enable_buttons.assert_called_once()
+        interface.exit_after.assert_not_called()
+        interface.window.after.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
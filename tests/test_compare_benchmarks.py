@@ -0,0 +1,52 @@
+import unittest
+
+from performance.compare_benchmarks import compare_stage, compare_results, get_failures, get_corpus_mismatch, \
+    REGRESSION_STATUS, OK_STATUS, IMPROVED_STATUS, MISSING_STATUS
+
+
+def generate_results(stages, corpus="synthetic_30_frames"):
+    return {"metadata": {"corpus": corpus}, "scenarios": {"512x424_steps10": {"stages": {
+        stage_name: {"mean_ms": sum(values) / len(values), "repeat_means_ms": values}
+        for stage_name, values in stages.items()}}}}
+
+
+class TestCompareBenchmarks(unittest.TestCase):
+
+    def test_clear_regression(self):
+        comparison = compare_stage(baseline_values=[10.0, 10.2, 9.9, 10.1], current_values=[13.0, 13.1, 12.9, 13.2],
+                                   tolerance=0.1)
+        self.assertEqual(comparison["status"], REGRESSION_STATUS)
+        self.assertGreater(comparison["change_low"], 0.1)
+
+    def test_noise_is_not_regression(self):
+        comparison = compare_stage(baseline_values=[10.0, 12.0, 9.0, 11.0], current_values=[11.0, 10.0, 12.5, 9.5],
+                                   tolerance=0.1)
+        self.assertEqual(comparison["status"], OK_STATUS)
+
+    def test_improvement(self):
+        comparison = compare_stage(baseline_values=[10.0, 10.1, 9.9], current_values=[5.0, 5.1, 4.9], tolerance=0.1)
+        self.assertEqual(comparison["status"], IMPROVED_STATUS)
+
+    def test_small_absolute_change_ignored(self):
+        comparison = compare_stage(baseline_values=[0.010, 0.010, 0.011], current_values=[0.020, 0.021, 0.020],
+                                   tolerance=0.1, min_delta_ms=0.05)
+        self.assertNotEqual(comparison["status"], REGRESSION_STATUS)
+
+    def test_missing_stage(self):
+        baseline = generate_results({"remove_zeros": [1.0, 1.1], "projector_step": [5.0, 5.1]})
+        current = generate_results({"remove_zeros": [1.0, 1.05]})
+        statuses = {comparison["stage"]: comparison["status"] for comparison in compare_results(baseline, current)}
+        self.assertEqual(statuses["projector_step"], MISSING_STATUS)
+        self.assertEqual(statuses["remove_zeros"], OK_STATUS)
+        self.assertEqual([failure["stage"] for failure in get_failures(compare_results(baseline, current))],
+                         ["projector_step"])
+
+    def test_corpus_mismatch(self):
+        baseline = generate_results({"remove_zeros": [1.0, 1.1]}, corpus="/recordings/sandbox")
+        self.assertIsNotNone(get_corpus_mismatch(baseline, generate_results({"remove_zeros": [1.0, 1.1]})))
+        self.assertIsNone(get_corpus_mismatch(baseline, generate_results({"remove_zeros": [1.0, 1.1]},
+                                                                         corpus="/recordings/sandbox")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import time
+import unittest
+
+import numpy as np
+
+from literals import ConfigControllerEnum
+from performance.equivalence_harness import EquivalenceCase, CONTOURS_CASE, compare_images, compare_contours, \
+    run_case, ShadowComparator
+
+
+class TestEquivalenceHarness(unittest.TestCase):
+
+    def test_compare_images(self):
+        reference = np.zeros((4, 4), dtype=np.uint8)
+        candidate = np.copy(reference)
+        candidate[0, 0] = 3
+
+        metrics = compare_images(reference=reference, candidate=candidate)
+        self.assertEqual(metrics["max_abs_error"], 3.0)
+        self.assertEqual(metrics["different_pixels"], 1)
+        with self.assertRaises(ValueError):
+            compare_images(reference=reference, candidate=np.zeros((2, 2)))
+
+    def test_compare_contours_hausdorff(self):
+        square = [np.array([[[0, 0]], [[0, 10]], [[10, 10]], [[10, 0]]], dtype=np.int32)]
+        shifted = [contour + 2 for contour in square]
+
+        self.assertEqual(compare_contours(reference=square, candidate=square)["hausdorff"], 0.0)
+        self.assertAlmostEqual(compare_contours(reference=square, candidate=shifted)["hausdorff"], np.sqrt(8))
+        self.assertEqual(compare_contours(reference=square, candidate=[])["hausdorff"], float("inf"))
+
+    def test_run_case_and_shadow(self):
+        frames = [np.full((20, 30), 1000 + index, dtype=np.uint16) for index in range(3)]
+        config_values = {ConfigControllerEnum.MIN_DEPTH.name: 900, ConfigControllerEnum.MAX_DEPTH.name: 1100}
+        case = EquivalenceCase(name="offset", reference=lambda inputs: inputs["depth_image"],
+                               candidate=lambda inputs: inputs["depth_image"] + 1, max_abs_error=1.0)
+
+        summary = run_case(case=case, frames=frames, config_values=config_values)
+        self.assertEqual(summary["frames"], 3)
+        self.assertTrue(summary["passed"])
+
+        contours_case = EquivalenceCase(name="empty", reference=lambda inputs: [], candidate=lambda inputs: [],
+                                        kind=CONTOURS_CASE)
+        shadow = ShadowComparator(case=contours_case, every_frames=1)
+        self.assertTrue(shadow.submit(depth_image=frames[0], previous_depth=frames[0], config_values=config_values))
+        deadline = time.perf_counter() + 5
+        while shadow.busy.is_set() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(shadow.summary()["frames"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
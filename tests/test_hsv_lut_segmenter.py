@@ -0,0 +1,45 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from image_management.HsvLutSegmenter import HsvLutSegmenter
+
+
+def generate_hsv_planes(seed, shape=(120, 160, 3)):
+    image = np.random.default_rng(seed).integers(0, 255, size=shape, dtype=np.uint8)
+    return image, cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+
+
+class TestHsvLutSegmenter(unittest.TestCase):
+
+    def test_same_mask_as_in_range(self):
+        image, hsv_planes = generate_hsv_planes(seed=0)
+        hsv_image = cv2.merge(hsv_planes)
+        segmenter = HsvLutSegmenter()
+        for lower_bound, upper_bound in [((0, 100, 100), (10, 255, 255)), ((30, 0, 50), (90, 200, 255)),
+                                         ((0, 0, 0), (179, 255, 255)), ((40, 200, 0), (60, 100, 255))]:
+            segmenter.set_bounds(lower_bound=lower_bound, upper_bound=upper_bound)
+            expected = cv2.inRange(hsv_image, np.array(lower_bound), np.array(upper_bound))
+            np.testing.assert_array_equal(segmenter.get_mask(hsv_planes=hsv_planes), expected)
+            np.testing.assert_array_equal(segmenter.get_mask_from_bgr(image=image), expected)
+
+    def test_hue_wraps_around(self):
+        _, hsv_planes = generate_hsv_planes(seed=1)
+        hsv_image = cv2.merge(hsv_planes)
+        segmenter = HsvLutSegmenter(lower_bound=(170, 50, 50), upper_bound=(10, 255, 255))
+        expected = cv2.bitwise_or(cv2.inRange(hsv_image, np.array([170, 50, 50]), np.array([179, 255, 255])),
+                                  cv2.inRange(hsv_image, np.array([0, 50, 50]), np.array([10, 255, 255])))
+        np.testing.assert_array_equal(segmenter.get_mask(hsv_planes=hsv_planes), expected)
+
+    def test_segment_keeps_only_masked_pixels(self):
+        image, hsv_planes = generate_hsv_planes(seed=2)
+        segmenter = HsvLutSegmenter(lower_bound=(0, 0, 128), upper_bound=(179, 255, 255))
+        segmented = segmenter.segment(image=image, hsv_planes=hsv_planes)
+        mask = segmenter.get_mask(hsv_planes=hsv_planes) > 0
+        np.testing.assert_array_equal(segmented[mask], image[mask])
+        self.assertFalse(segmented[~mask].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from image_management.ImageMemoryBudget import ImageMemoryBudget
+from image_management.ImageObject import ImageObject
+from image_management.ImageTransformerRGB import ImageTransformerRGB
+
+
+def generate_photo(seed, shape=(120, 160, 3)):
+    return np.random.default_rng(seed).integers(0, 255, size=shape, dtype=np.uint8)
+
+
+class TestImageObject(unittest.TestCase):
+
+    def test_default_object_copies_initial_image(self):
+        image = generate_photo(seed=0)
+        image_obj = ImageObject(image=image)
+        self.assertIs(image_obj.image, image)
+
+        cv2.circle(image_obj.image, (10, 10), 5, (0, 255, 0), -1)
+        self.assertFalse(np.array_equal(image_obj.image, image_obj.initial_image))
+        image_obj.restore()
+        np.testing.assert_array_equal(image_obj.image, image_obj.initial_image)
+
+    def test_copy_on_write(self):
+        image = generate_photo(seed=1)
+        image_obj = ImageObject(image=image, copy_on_write=True)
+        self.assertIs(image_obj.image, image_obj.initial_image)
+        self.assertFalse(image_obj.image.flags.writeable)
+
+        writable = image_obj.get_writable_image()
+        cv2.circle(writable, (10, 10), 5, (0, 255, 0), -1)
+        image_obj.update(image=writable)
+        np.testing.assert_array_equal(image_obj.initial_image, image)
+        self.assertFalse(np.array_equal(image_obj.image, image))
+
+        image_obj.restore()
+        self.assertIs(image_obj.image, image_obj.initial_image)
+
+    def test_lazy_loading(self):
+        with tempfile.TemporaryDirectory() as temporal_folder:
+            image_path = os.path.join(temporal_folder, "photo.png")
+            cv2.imwrite(image_path, generate_photo(seed=2))
+
+            image_obj = ImageObject(image_absolute_path=image_path, image_transform_class=ImageTransformerRGB,
+                                    lazy=True, copy_on_write=True)
+            self.assertFalse(image_obj.is_loaded())
+            self.assertEqual(image_obj.image_shape, (120, 160))
+            np.testing.assert_array_equal(image_obj.image, generate_photo(seed=2))
+            self.assertTrue(image_obj.is_loaded())
+
+    def test_lazy_thumbnail_from_header_pass(self):
+        with tempfile.TemporaryDirectory() as temporal_folder:
+            image_path = os.path.join(temporal_folder, "photo.jpg")
+            photo = cv2.resize(generate_photo(seed=3, shape=(12, 16, 3)), (160, 120), interpolation=cv2.INTER_NEAREST)
+            cv2.imwrite(image_path, photo)
+
+            image_obj = ImageObject(image_absolute_path=image_path, image_transform_class=ImageTransformerRGB,
+                                    lazy=True, copy_on_write=True, thumbnail_width=40)
+            self.assertFalse(image_obj.is_loaded())
+            self.assertEqual(image_obj.thumbnail.shape, (30, 40, 3))
+
+            # Same orientation and channel order as the thumbnail built from the loaded pixels
+            header_thumbnail = image_obj.thumbnail.astype(np.int16)
+            image_obj.load_pixels()
+            image_obj.update_thumbnail()
+            self.assertLess(np.mean(np.abs(header_thumbnail - image_obj.thumbnail)), 10)
+
+    def test_memory_budget_spills_and_reloads(self):
+        photo_bytes = generate_photo(seed=0).nbytes
+        memory_budget = ImageMemoryBudget(budget_mb=2.5 * photo_bytes / 1024 / 1024)
+        try:
+            image_objs = [ImageObject(image=generate_photo(seed=seed), memory_budget=memory_budget,
+                                      thumbnail_width=40) for seed in range(6)]
+
+            # Modified images are spilled with their changes
+            drawn = image_objs[0].get_writable_image()
+            cv2.circle(drawn, (10, 10), 5, (0, 255, 0), -1)
+            image_objs[0].update(image=drawn)
+            expected = drawn.copy()
+
+            for image_obj in image_objs[1:]:
+                _ = image_obj.image
+            self.assertLessEqual(memory_budget.get_memory_bytes(), memory_budget.budget_bytes)
+            self.assertFalse(image_objs[0].is_loaded())
+            self.assertEqual(image_objs[0].thumbnail.shape, (30, 40, 3))
+
+            np.testing.assert_array_equal(image_objs[0].image, expected)
+            np.testing.assert_array_equal(image_objs[0].initial_image, generate_photo(seed=0))
+            np.testing.assert_array_equal(image_objs[1].image, generate_photo(seed=1))
+
+            image_objs[1].release()
+            self.assertNotIn(id(image_objs[1]), memory_budget.image_objects)
+        finally:
+            memory_budget.close()
+        self.assertFalse(os.path.isdir(memory_budget.spill_folder))
+
+    def test_memory_budget_running_total(self):
+        photo_bytes = generate_photo(seed=0).nbytes
+        memory_budget = ImageMemoryBudget(budget_mb=3.5 * photo_bytes / 1024 / 1024)
+        try:
+            image_objs = [ImageObject(image=generate_photo(seed=seed), memory_budget=memory_budget)
+                          for seed in range(6)]
+            drawn = image_objs[-1].get_writable_image()
+            image_objs[-1].update(image=drawn)
+            _ = image_objs[0].image
+            image_objs[2].release()
+            self.assertEqual(memory_budget.get_memory_bytes(),
+                             sum(image_obj.get_memory_bytes() for image_obj in image_objs if image_obj is not
+                                 image_objs[2]))
+            self.assertLessEqual(memory_budget.get_memory_bytes(), memory_budget.budget_bytes)
+
+            # Accessing loaded pixels under the budget does not look at the other objects
+            with patch.object(ImageObject, "get_memory_bytes") as get_memory_bytes:
+                for _ in range(10):
+                    _ = image_objs[0].image
+                    _ = image_objs[-1].image
+            get_memory_bytes.assert_not_called()
+        finally:
+            memory_budget.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from itertools import cycle
 from unittest.mock import MagicMock, patch
 
 import cv2
@@ -47,6 +48,35 @@ class TestKinectController(unittest.TestCase):
         self.assertIsNotNone(image)
         self.assertEqual(image.shape, (1080, 1920, 3))
 
+    @patch('kinect_module.PyKinectRuntime.PyKinectRuntime')
+    def test_wait_until_ready(self, MockPyKinectRuntime):
+        mock_kinect_instance = MagicMock()
+        MockPyKinectRuntime.return_value = mock_kinect_instance
+        mock_kinect_instance.has_new_color_frame.return_value = True
+        mock_kinect_instance.has_new_depth_frame.return_value = False
+
+        controller = KinectController([KinectFrames.COLOR, KinectFrames.DEPTH], wait_ready=False)
+        with self.assertRaises(RuntimeError):
+            controller.wait_until_ready(timeout=0.05)
+        self.assertTrue(controller.frames_ready[KinectFrames.COLOR.name].is_set())
+        self.assertFalse(controller.frames_ready[KinectFrames.DEPTH.name].is_set())
+
+        mock_kinect_instance.has_new_depth_frame.return_value = True
+        controller.wait_until_ready(timeout=1)
+        self.assertIn("ready", [event for event, elapsed in controller.startup_timeline])
+
+    @patch('kinect_module.PyKinectRuntime.PyKinectRuntime')
+    def test_failed_startup_closes_runtime(self, MockPyKinectRuntime):
+        mock_kinect_instance = MockPyKinectRuntime.return_value
+        mock_kinect_instance.has_new_color_frame.return_value = False
+
+        with patch.object(KinectController, "close", autospec=True, side_effect=KinectController.close) as close:
+            with self.assertRaises(RuntimeError):
+                KinectController([KinectFrames.COLOR], startup_timeout=0.05)
+        close.assert_called_once()
+        mock_kinect_instance.close.assert_called_once()
+        self.assertTrue(close.call_args[0][0].calibrations_executor._shutdown)
+
     @patch('kinect_module.PyKinectRuntime')
     def test_display_rgb_image(self, MockPyKinectRuntime):
         mock_kinect_instance = MagicMock()
@@ -97,6 +127,67 @@ class TestKinectController(unittest.TestCase):
         cv2.waitKey(0)
         cv2.destroyAllWindows()
 
+    def test_combine_burst(self):
+        depth_frames = [np.array([[0, 1000], [1200, 0]], dtype=np.uint16),
+                        np.array([[0, 1010], [0, 0]], dtype=np.uint16),
+                        np.array([[900, 990], [1210, 0]], dtype=np.uint16)]
+        np.testing.assert_array_equal(KinectController.combine_burst(KinectFrames.DEPTH, depth_frames),
+                                      np.array([[900, 1000], [1205, 0]], dtype=np.uint16))
+
+        infrared_frames = [np.full((2, 2), value, dtype=np.uint16) for value in (10, 500, 20)]
+        np.testing.assert_array_equal(KinectController.combine_burst(KinectFrames.INFRARED, infrared_frames),
+                                      np.full((2, 2), 20, dtype=np.uint16))
+
+        color_frames = [np.full((2, 2, 3), value, dtype=np.uint8) for value in (10, 20, 31)]
+        combined = KinectController.combine_burst(KinectFrames.COLOR, color_frames)
+        self.assertEqual(combined.dtype, np.uint8)
+        np.testing.assert_array_equal(combined, np.full((2, 2, 3), 20, dtype=np.uint8))
+
+    @patch('kinect_module.PyKinectRuntime.PyKinectRuntime')
+    def test_capture_burst(self, MockPyKinectRuntime):
+        mock_kinect_instance = MockPyKinectRuntime.return_value
+        mock_kinect_instance.has_new_depth_frame.return_value = True
+        mock_kinect_instance.has_new_infrared_frame.return_value = False
+        mock_kinect_instance.depth_frame_desc.Height = 2
+        mock_kinect_instance.depth_frame_desc.Width = 2
+        mock_kinect_instance.get_last_depth_frame.side_effect = cycle([np.full(4, value) for value in (800, 810, 805)])
+
+        controller = KinectController([KinectFrames.DEPTH, KinectFrames.INFRARED], wait_ready=False)
+        images = controller.capture_burst_async(kinect_frames=[KinectFrames.DEPTH], frames=3).result(timeout=1)
+        np.testing.assert_array_equal(images[KinectFrames.DEPTH], np.full((2, 2), 805, dtype=np.uint16))
+
+        with self.assertRaises(RuntimeError):
+            controller.capture_burst(frames=3, timeout=0.05)
+        controller.close()
+
+    @patch('kinect_module.PyKinectRuntime.PyKinectRuntime')
+    def test_get_bundle(self, MockPyKinectRuntime):
+        mock_kinect_instance = MockPyKinectRuntime.return_value
+        mock_kinect_instance.has_new_depth_frame.return_value = True
+        mock_kinect_instance.depth_frame_desc.Height = 2
+        mock_kinect_instance.depth_frame_desc.Width = 2
+        mock_kinect_instance.infrared_frame_desc.Height = 2
+        mock_kinect_instance.infrared_frame_desc.Width = 2
+        mock_kinect_instance._last_depth_frame_time = 1.0
+        mock_kinect_instance.get_last_depth_frame.return_value = np.full(4, 800)
+
+        # Infrared frames arrive 100 ms and 50 ms before the depth frame, then 5 ms after it
+        infrared_arrivals = iter([0.9, 0.95, 1.005])
+
+        def has_new_infrared_frame():
+            mock_kinect_instance._last_infrared_frame_time = next(infrared_arrivals)
+            return True
+
+        mock_kinect_instance.has_new_infrared_frame.side_effect = has_new_infrared_frame
+        mock_kinect_instance.get_last_infrared_frame.return_value = np.full(4, 300)
+
+        controller = KinectController([KinectFrames.DEPTH, KinectFrames.INFRARED], wait_ready=False)
+        bundle = controller.get_bundle(tolerance=0.02, timeout=1)
+        self.assertAlmostEqual(bundle.skew, 0.005)
+        self.assertEqual(bundle.arrivals[KinectFrames.INFRARED], 1.005)
+        self.assertEqual(mock_kinect_instance.get_last_depth_frame.call_count, 1)
+        np.testing.assert_array_equal(bundle.images[KinectFrames.INFRARED], np.full((2, 2), 300, dtype=np.uint16))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from kinect_controller.KinectFrameProducer import KinectFrameProducer
+from literals import KinectFrames
+
+
+class FakeKinect:
+    def __init__(self, images):
+        self.images = list(images)
+        self.calls = []
+
+    def get_image_calibrate(self, kinect_frame, avoid_camera_matrix=False, avoid_camera_focus=False):
+        self.calls.append((kinect_frame, avoid_camera_matrix, avoid_camera_focus))
+        return self.images.pop(0) if self.images else None
+
+
+class TestKinectFrameProducer(unittest.TestCase):
+
+    def test_frames_are_downsampled_to_rgb(self):
+        image = np.zeros((108, 192, 3), dtype=np.uint8)
+        image[..., 0] = 255
+        kinect = FakeKinect(images=[image])
+        producer = KinectFrameProducer(kinect=kinect, output_size=(96, 54))
+
+        self.assertTrue(producer.produce_frame())
+        sequence, latest_image, source_size = producer.get_latest()
+        self.assertEqual(sequence, 1)
+        self.assertEqual(latest_image.shape, (54, 96, 3))
+        self.assertEqual(source_size, (192, 108))
+        self.assertTrue((latest_image[..., 2] == 255).all())
+        self.assertEqual(kinect.calls[0], (KinectFrames.COLOR, False, True))
+
+    def test_only_newer_frames_are_returned(self):
+        producer = KinectFrameProducer(kinect=FakeKinect(images=[np.zeros((10, 10, 3), dtype=np.uint8)]),
+                                       output_size=(5, 5))
+        self.assertTrue(producer.produce_frame())
+        sequence, latest_image, _ = producer.get_latest()
+        self.assertIsNotNone(latest_image)
+
+        self.assertFalse(producer.produce_frame())
+        self.assertEqual(producer.get_latest(sequence=sequence), (sequence, None, (10, 10)))
+
+    def test_thread_stops(self):
+        producer = KinectFrameProducer(kinect=FakeKinect(images=[]), output_size=(5, 5))
+        producer.start()
+        producer.stop()
+        producer.join(timeout=1)
+        self.assertFalse(producer.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import cv2
+
+from literals import KinectFrames, ConfigControllerEnum
+
+
+class TestLiterals(unittest.TestCase):
+
+    def test_literals_do_not_import_heavy_modules(self):
+        process = subprocess.run(
+            [sys.executable, "-c", "import sys, literals; print('cv2' in sys.modules, 'comtypes' in sys.modules)"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.PIPE,
+            universal_newlines=True, check=True)
+        self.assertEqual(process.stdout.split(), ["False", "False"])
+
+    def test_values_match_libraries(self):
+        self.assertEqual(ConfigControllerEnum.COLORMAP.value, cv2.COLORMAP_JET)
+        try:
+            from kinect_module import PyKinectV2
+        except Exception:
+            self.skipTest("PyKinectV2 bindings not available on this platform")
+        self.assertEqual(KinectFrames.COLOR.value, PyKinectV2.FrameSourceTypes_Color)
+        self.assertEqual(KinectFrames.DEPTH.value, PyKinectV2.FrameSourceTypes_Depth)
+        self.assertEqual(KinectFrames.INFRARED.value, PyKinectV2.FrameSourceTypes_Infrared)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import cv2
+import numpy as np
+
+from image_management.CornerCache import CornerCache
+from image_management.ImageTransformerIR import ImageTransformerIR
+from image_management.ImageTransformerRGB import ImageTransformerRGB
+from image_management.PatternDetector import PatternDetector, detect_chessboard
+from interfaces.CalibrateKinectProjectorInterface import CalibrateKinectProjectorInterface
+
+
+def wait_detections(detector):
+    results = {}
+    deadline = time.time() + 30
+    while not detector.is_finished() and time.time() < deadline:
+        results.update(detector.poll())
+        time.sleep(0.05)
+    return results
+
+
+def generate_chessboard(pattern_size=(7, 5), square=30, margin=40):
+    columns, rows = pattern_size[0] + 1, pattern_size[1] + 1
+    image = np.full((rows * square + 2 * margin, columns * square + 2 * margin), 255, dtype=np.uint8)
+    for row in range(rows):
+        for column in range(columns):
+            if (row + column) % 2 == 0:
+                image[margin + row * square:margin + (row + 1) * square,
+                      margin + column * square:margin + (column + 1) * square] = 0
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+class TestPatternDetector(unittest.TestCase):
+
+    def test_detect_chessboard(self):
+        corners = detect_chessboard(image=generate_chessboard(), pattern_size=(7, 5),
+                                    image_transform_class=ImageTransformerRGB)
+        self.assertEqual(corners.reshape(-1, 2).shape, (35, 2))
+        self.assertIsNone(detect_chessboard(image=np.zeros((200, 200, 3), dtype=np.uint8), pattern_size=(7, 5),
+                                            image_transform_class=ImageTransformerRGB))
+
+    def test_coarse_to_fine_matches_full_search(self):
+        photo = np.full((1080, 1920, 3), 128, dtype=np.uint8)
+        photo[300:300 + 320, 900:900 + 400] = generate_chessboard(square=40)[:320, :400]
+
+        ret_full, corners_full = ImageTransformerRGB.find_chessboard_corners(image=photo, pattern_size=(7, 5),
+                                                                             coarse_width=None)
+        ret_coarse, corners_coarse = ImageTransformerRGB.find_chessboard_corners(image=photo, pattern_size=(7, 5),
+                                                                                 coarse_width=640)
+        self.assertTrue(ret_full and ret_coarse)
+        np.testing.assert_allclose(corners_coarse.reshape(-1, 2), corners_full.reshape(-1, 2), atol=0.05)
+
+        ret, corners = ImageTransformerRGB.find_chessboard_corners(image=np.full((1080, 1920, 3), 128, np.uint8),
+                                                                   pattern_size=(7, 5), coarse_width=640)
+        self.assertFalse(ret)
+        self.assertIsNone(corners)
+
+    def test_infrared_uses_normalized_gray(self):
+        infrared = cv2.cvtColor(generate_chessboard(), cv2.COLOR_BGR2GRAY).astype(np.uint16) * 40 + 1000
+        corners = detect_chessboard(image=infrared, pattern_size=(7, 5), image_transform_class=ImageTransformerIR)
+        self.assertEqual(corners.reshape(-1, 2).shape, (35, 2))
+
+    def test_poll_returns_every_submission(self):
+        detector = PatternDetector(max_workers=2)
+        try:
+            detector.submit(key="found", image=generate_chessboard(), pattern_size=(7, 5),
+                            image_transform_class=ImageTransformerRGB)
+            detector.submit(key="empty", image=np.zeros((200, 200, 3), dtype=np.uint8), pattern_size=(7, 5),
+                            image_transform_class=ImageTransformerRGB)
+
+            results = wait_detections(detector)
+        finally:
+            detector.shutdown()
+
+        self.assertEqual(detector.completed, detector.total)
+        statistics = detector.get_statistics()
+        self.assertEqual((statistics["images"], statistics["found"]), (2, 1))
+        self.assertEqual(statistics["hit_rate"], 0.5)
+        self.assertIsNone(results["empty"])
+        self.assertEqual(results["found"].reshape(-1, 2).shape, (35, 2))
+
+    def test_failed_detections_are_not_reported_as_not_found(self):
+        detector = PatternDetector(max_workers=1)
+        try:
+            detector.submit(key="empty", image=np.zeros((200, 200, 3), dtype=np.uint8), pattern_size=(7, 5),
+                            image_transform_class=ImageTransformerRGB)
+            detector.submit(key="broken", image=None, pattern_size=(7, 5), image_transform_class=ImageTransformerRGB)
+            results = wait_detections(detector)
+        finally:
+            detector.shutdown()
+
+        self.assertEqual(results, {"empty": None})
+        self.assertEqual(detector.failed, ["broken"])
+        self.assertEqual(detector.get_statistics()["failed"], 1)
+
+    @patch("interfaces.CalibrateKinectProjectorInterface.messagebox")
+    def test_failed_photos_are_kept_by_the_interface(self, messagebox):
+        photos_taken = {"found": {}, "empty": {}, "broken": {}}
+        detector = MagicMock(failed=["broken"], completed=3, total=3)
+        detector.poll.return_value = [("empty", None)]
+        detector.is_finished.return_value = True
+        interface = MagicMock(pattern_detector=detector, photos_taken=photos_taken, pattern_size=(7, 5),
+                              image_names_to_delete=[], patterns_finished_callbacks=[MagicMock()])
+
+        CalibrateKinectProjectorInterface.poll_patterns(interface)
+
+        self.assertEqual(set(photos_taken.keys()), {"found", "broken"})
+        messagebox.showerror.assert_called_once()
+        self.assertEqual(interface.patterns_finished_callbacks, [])
+
+    def test_corner_cache_skips_known_images(self):
+        images = {"found": generate_chessboard(), "empty": np.zeros((200, 200, 3), dtype=np.uint8)}
+        with tempfile.TemporaryDirectory() as temporal_folder:
+            cache_path = os.path.join(temporal_folder, "corners_cache.npz")
+
+            detector = PatternDetector(max_workers=1, corner_cache=CornerCache(cache_path=cache_path))
+            for key, image in images.items():
+                detector.submit(key=key, image=image, pattern_size=(7, 5), image_transform_class=ImageTransformerRGB)
+            first_results = wait_detections(detector)
+            detector.log_statistics()
+            detector.shutdown()
+            self.assertFalse(os.path.isfile(cache_path))
+            detector.corner_cache.save()
+            self.assertTrue(os.path.isfile(cache_path))
+
+            detector = PatternDetector(max_workers=1, corner_cache=CornerCache(cache_path=cache_path))
+            for key, image in images.items():
+                detector.submit(key=key, image=image, pattern_size=(7, 5), image_transform_class=ImageTransformerRGB)
+            self.assertEqual(detector.futures, {})
+            second_results = wait_detections(detector)
+            detector.shutdown()
+
+        self.assertEqual(detector.get_statistics()["cache_hits"], 2)
+        self.assertIsNone(second_results["empty"])
+        np.testing.assert_array_equal(second_results["found"], first_results["found"])
+
+    def test_corner_cache_hits_photos_saved_as_jpg(self):
+        # A new photo is searched with its in memory pixels, the next session reads the lossy .jpg saved from it
+        noise = np.random.default_rng(0).integers(-20, 20, generate_chessboard().shape)
+        photo = np.clip(generate_chessboard().astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        with tempfile.TemporaryDirectory() as temporal_folder:
+            cache_path = os.path.join(temporal_folder, "corners_cache.npz")
+            photo_path = os.path.join(temporal_folder, "photo.jpg")
+
+            detector = PatternDetector(max_workers=1, corner_cache=CornerCache(cache_path=cache_path))
+            detector.submit(key="photo", image=photo, pattern_size=(7, 5), image_transform_class=ImageTransformerRGB,
+                            cache_image=ImageTransformerRGB.encode_decode(image=photo, extension=".jpg"))
+            detector.submit(key="deleted", image=np.zeros((200, 200, 3), dtype=np.uint8), pattern_size=(7, 5),
+                            image_transform_class=ImageTransformerRGB)
+            wait_detections(detector)
+            detector.shutdown()
+            detector.corner_cache.save(prune=True)
+            ImageTransformerRGB.save(image=photo, output_path=photo_path)
+
+            saved_photo = ImageTransformerRGB.load(image_path=photo_path)
+            self.assertFalse(np.array_equal(saved_photo, photo))
+            corner_cache = CornerCache(cache_path=cache_path)
+            detector = PatternDetector(max_workers=1, corner_cache=corner_cache)
+            detector.submit(key="photo", image=saved_photo, pattern_size=(7, 5),
+                            image_transform_class=ImageTransformerRGB)
+            self.assertEqual(detector.futures, {})
+            wait_detections(detector)
+            detector.shutdown()
+
+            # The photo deleted before this session is not kept
+            self.assertEqual(len(corner_cache.entries), 2)
+            corner_cache.save(prune=True)
+            self.assertEqual(len(CornerCache(cache_path=cache_path).entries), 1)
+
+    def test_corner_cache_key_depends_on_pattern_and_detector(self):
+        image = generate_chessboard()
+        key = CornerCache.get_key(image=image, pattern_size=(7, 5), detector_signature="classic")
+        self.assertEqual(key, CornerCache.get_key(image=image.copy(), pattern_size=(7, 5),
+                                                  detector_signature="classic"))
+        self.assertNotEqual(key, CornerCache.get_key(image=image, pattern_size=(5, 7), detector_signature="classic"))
+        self.assertNotEqual(key, CornerCache.get_key(image=image, pattern_size=(7, 5), detector_signature="sb"))
+        image[0, 0] = 1
+        self.assertNotEqual(key, CornerCache.get_key(image=image, pattern_size=(7, 5), detector_signature="classic"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from image_management.ImageGenerator import ImageGenerator
+from image_management.PatternRenderer import PatternRenderer
+
+
+class TestPatternRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.pattern = np.random.default_rng(0).integers(0, 255, size=(90, 120, 3), dtype=np.uint8)
+        self.shape = (320, 240)
+
+    def test_same_image_as_generator(self):
+        renderer = PatternRenderer(pattern_image=self.pattern, shape=self.shape)
+        for position, image_shape in [((0, 0), (90, 120)), ((15, 30), (90, 120)), ((-20, -10), (99, 132)),
+                                      ((250, 200), (81, 108)), ((15, 30), (90, 120))]:
+            expected = ImageGenerator.generate_image_with_other_image(image=self.pattern, position=position,
+                                                                      image_shape=image_shape, shape=self.shape)
+            np.testing.assert_array_equal(renderer.render(position=position, image_shape=image_shape), expected)
+
+    def test_pattern_outside_canvas_and_clear(self):
+        renderer = PatternRenderer(pattern_image=self.pattern, shape=self.shape)
+        renderer.render(position=(10, 10), image_shape=(90, 120))
+        self.assertFalse(renderer.render(position=(400, 10), image_shape=(90, 120)).any())
+
+        renderer.render(position=(10, 10), image_shape=(90, 120))
+        self.assertFalse(renderer.clear().any())
+
+    def test_resized_patterns_are_cached(self):
+        renderer = PatternRenderer(pattern_image=self.pattern, shape=self.shape, cache_size=2)
+        first = renderer.get_resized_pattern(image_shape=(90, 120))
+        self.assertIs(renderer.get_resized_pattern(image_shape=(90, 120)), first)
+
+        renderer.get_resized_pattern(image_shape=(45, 60))
+        renderer.get_resized_pattern(image_shape=(99, 132))
+        self.assertEqual(list(renderer.resized_patterns.keys()), [(45, 60), (99, 132)])
+
+
+if __name__ == '__main__':
+    unittest.main()
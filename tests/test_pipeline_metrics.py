@@ -0,0 +1,38 @@
+import time
+import unittest
+
+from literals import KINECT_FRAMES_PER_SECOND
+from performance.PipelineMetrics import PipelineMetrics, get_process_rss_bytes
+
+
+class TestPipelineMetrics(unittest.TestCase):
+
+    def test_summary(self):
+        metrics = PipelineMetrics(ring_size=5)
+        arrival = time.perf_counter()
+        for index in range(8):
+            # Every frame skips one Kinect frame
+            metrics.record_frame(stage_ms={"process_depth": 10.0 + index, "frame": 20.0},
+                                 frame_arrival=arrival + index * 2 / KINECT_FRAMES_PER_SECOND,
+                                 frame_consumed=arrival + index * 2 / KINECT_FRAMES_PER_SECOND + 0.005)
+        metrics.record_lock_wait(lock_name="kinect", wait_seconds=0.002)
+
+        summary = metrics.get_summary()
+        self.assertEqual(len(metrics.frames), 5)
+        self.assertEqual(summary["total_frames"], 8)
+        self.assertEqual(summary["total_dropped_frames"], 7)
+        self.assertEqual(summary["dropped_frames"], 5)
+        self.assertEqual(summary["stages_ms"]["process_depth"]["max"], 17.0)
+        self.assertAlmostEqual(summary["frame_age_ms"]["mean"], 5.0)
+        self.assertAlmostEqual(summary["lock_wait_ms"]["kinect"]["max"], 2.0)
+        self.assertGreater(summary["fps"], 0)
+        self.assertIn("process_depth", metrics.format_summary())
+
+    def test_process_rss(self):
+        rss_bytes = get_process_rss_bytes()
+        self.assertIsNotNone(rss_bytes)
+        self.assertGreater(rss_bytes, 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
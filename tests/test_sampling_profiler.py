@@ -0,0 +1,42 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from performance.SamplingProfiler import SamplingProfiler
+
+
+def busy_loop(stop_event):
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_samples_other_threads(self):
+        stop_event = threading.Event()
+        worker = threading.Thread(target=busy_loop, name="projector_application", args=(stop_event,))
+        worker.start()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, "profile.collapsed")
+            profiler = SamplingProfiler(output_path=output_path, interval=0.001)
+            profiler.start()
+            time.sleep(0.1)
+            profiler.stop()
+            stop_event.set()
+            worker.join()
+
+            with open(output_path, encoding="utf-8") as collapsed_file:
+                lines = collapsed_file.read().splitlines()
+
+        self.assertTrue(lines)
+        self.assertTrue(any(line.startswith("projector_application;") and "busy_loop" in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
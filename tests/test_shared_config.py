@@ -0,0 +1,104 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from app.app import generate_preview
+from image_management.ApplicationController import SharedConfig, DerivedConfigValue
+from image_management.ImageTransformerBase import ImageTransformerBase
+from interfaces.PrincipalApplicationInterface import PrincipalApplicationInterface
+from literals import PREVIEW_SIZE, ConfigControllerEnum
+
+MIN_DEPTH = ConfigControllerEnum.MIN_DEPTH.name
+MAX_DEPTH = ConfigControllerEnum.MAX_DEPTH.name
+COLORMAP = ConfigControllerEnum.COLORMAP.name
+
+
+class TestSharedConfig(unittest.TestCase):
+
+    def test_previews_are_versioned(self):
+        config = SharedConfig()
+        version, current, second = config.get_previews()
+        self.assertIsNone(current)
+        self.assertIsNone(second)
+
+        color_preview = generate_preview(image=np.zeros((1080, 1920, 3), dtype=np.uint8))
+        config.set_previews(current_preview=generate_preview(image=np.zeros((424, 512), dtype=np.uint8)),
+                            second_preview=color_preview)
+        config.set_previews(current_preview=generate_preview(image=np.ones((424, 512, 3), dtype=np.uint8)))
+
+        new_version, current, second = config.get_previews()
+        self.assertEqual(new_version, version + 2)
+        self.assertEqual(current.shape, (PREVIEW_SIZE[1], PREVIEW_SIZE[0], 3))
+        self.assertIs(second, color_preview)
+
+    def test_snapshots_are_immutable_and_versioned(self):
+        config = SharedConfig()
+        snapshot = config.get_values()
+        with self.assertRaises(TypeError):
+            snapshot[MIN_DEPTH] = 1
+
+        config.update(MIN_DEPTH=snapshot[MIN_DEPTH])
+        self.assertIs(config.get_values(), snapshot)
+
+        config.update(MIN_DEPTH=700, COLORMAP=snapshot[COLORMAP])
+        new_snapshot = config.get_values()
+        self.assertEqual(new_snapshot.version, snapshot.version + 1)
+        self.assertEqual(new_snapshot.changed_since(snapshot.version), {MIN_DEPTH})
+        self.assertEqual(snapshot[MIN_DEPTH], ConfigControllerEnum.MIN_DEPTH.value)
+        self.assertEqual(config.get_value(MIN_DEPTH), 700)
+        self.assertEqual(config.MIN_DEPTH, 700)
+
+        config.set_value(key=MAX_DEPTH, value=1200)
+        self.assertEqual(config.get_values().changed_since(snapshot.version), {MIN_DEPTH, MAX_DEPTH})
+
+        # Unknown keys are rejected instead of silently creating an attribute outside the snapshot
+        current_snapshot = config.get_values()
+        with self.assertRaises(KeyError):
+            config.set_value(key="UNKNOWN_KEY", value=1)
+        self.assertIs(config.get_values(), current_snapshot)
+        self.assertFalse(hasattr(config, "UNKNOWN_KEY"))
+
+    def test_subscriptions_and_derived_values(self):
+        config = SharedConfig()
+        notifications = []
+        config.subscribe(lambda snapshot, changed_keys: notifications.append(changed_keys), keys=[COLORMAP])
+
+        builds = []
+        colormap_lut = DerivedConfigValue(keys=[COLORMAP], build=lambda snapshot: builds.append(snapshot[COLORMAP]) or
+                                          ImageTransformerBase.generate_colormap_lut(colormap=snapshot[COLORMAP]))
+        colormap_lut.get(config.get_values())
+        config.update(MIN_DEPTH=800)
+        colormap_lut.get(config.get_values())
+        self.assertEqual(notifications, [])
+        self.assertEqual(len(builds), 1)
+
+        config.update(COLORMAP=cv2.COLORMAP_BONE)
+        lut = colormap_lut.get(config.get_values())
+        self.assertEqual(notifications, [{COLORMAP}])
+        self.assertEqual(builds, [ConfigControllerEnum.COLORMAP.value, cv2.COLORMAP_BONE])
+
+        image = np.random.default_rng(0).integers(0, 255, (40, 50), dtype=np.uint8)
+        np.testing.assert_array_equal(ImageTransformerBase.apply_colormap(image=image, colormap=lut),
+                                      cv2.applyColorMap(image, cv2.COLORMAP_BONE))
+
+    @patch("interfaces.PrincipalApplicationInterface.messagebox")
+    def test_reset_and_reload_buttons_are_independent(self, _):
+        config = SharedConfig()
+        interface = SimpleNamespace(config=config)
+
+        PrincipalApplicationInterface.reset_image(interface)
+        self.assertTrue(config.get_value(ConfigControllerEnum.RESET_IMAGE.name))
+        self.assertFalse(config.consume_calibration_reload())
+
+        config.set_value(key=ConfigControllerEnum.RESET_IMAGE.name, value=False)
+        PrincipalApplicationInterface.reload_calibration(interface)
+        self.assertFalse(config.get_value(ConfigControllerEnum.RESET_IMAGE.name))
+        self.assertTrue(config.consume_calibration_reload())
+        self.assertFalse(config.consume_calibration_reload())
+
+
+if __name__ == '__main__':
+    unittest.main()
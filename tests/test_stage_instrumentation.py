@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from image_management.ImageTransformerBase import ImageTransformerBase
+from performance.StageInstrumentation import StageInstrumentation
+
+
+class ImageTransformerTest(ImageTransformerBase):
+    @staticmethod
+    def invert(image):
+        return 255 - image
+
+
+class TestStageInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.instrumentation = StageInstrumentation()
+        self.instrumentation.register_class(ImageTransformerBase, method_names=["resize", "get_image_shape"])
+        self.instrumentation.register_class(ImageTransformerTest, method_names=["resize", "invert"])
+
+    def tearDown(self):
+        self.instrumentation.disable()
+
+    def test_disabled_keeps_original_methods(self):
+        original_resize = ImageTransformerBase.__dict__["resize"]
+
+        self.instrumentation.enable()
+        self.assertIsNot(ImageTransformerBase.__dict__["resize"], original_resize)
+
+        self.instrumentation.disable()
+        self.assertIs(ImageTransformerBase.__dict__["resize"], original_resize)
+        self.assertNotIn("resize", ImageTransformerTest.__dict__)
+
+    def test_records_calls_and_bytes(self):
+        image = np.zeros((100, 200), dtype=np.uint8)
+
+        self.instrumentation.enable()
+        ImageTransformerBase.resize(image=image, width=100)
+        ImageTransformerTest.invert(image=image)
+        ImageTransformerTest.invert(image=image)
+        self.instrumentation.disable()
+
+        # Calls after disabling are not recorded
+        ImageTransformerTest.invert(image=image)
+
+        records = {stage["name"]: stage for stage in self.instrumentation.get_summary()}
+        self.assertEqual(records["ImageTransformerBase.resize"]["calls"], 1)
+        self.assertEqual(records["ImageTransformerBase.resize"]["bytes_in"], image.nbytes)
+        self.assertEqual(records["ImageTransformerBase.resize"]["bytes_out"], 100 * 50)
+        self.assertEqual(records["ImageTransformerTest.invert"]["calls"], 2)
+        self.assertIn("ImageTransformerBase.get_image_shape", records)
+        self.assertIn("ImageTransformerTest.invert", self.instrumentation.format_summary())
+
+    def test_reset(self):
+        self.instrumentation.record(stage_name="stage", elapsed=0.5)
+        self.instrumentation.reset()
+        self.assertEqual(self.instrumentation.get_summary(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from itertools import permutations
+
+import cv2
+import numpy as np
+
+from calibrations.CalibrationFile import CalibrationClass
+from utils import ordering_points
+
+
+def brute_force_ordering(l_point1, l_point2):
+    return min(([l_point2[index] for index in ordering] for ordering in permutations(range(len(l_point1)))),
+               key=lambda ordered: sum(np.linalg.norm(np.subtract(point1, point2))
+                                       for point1, point2 in zip(l_point1, ordered)))
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_ordering_points_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        for points_count in [4, 6]:
+            reference = rng.uniform(0, 500, (points_count, 2)).tolist()
+            clicked = [reference[index] for index in rng.permutation(points_count)]
+            clicked = (np.array(clicked) + rng.normal(0, 5, (points_count, 2))).tolist()
+
+            self.assertEqual(ordering_points(reference, clicked), brute_force_ordering(reference, clicked))
+
+    def test_ordering_many_points(self):
+        reference = [(x * 20.0, y * 20.0) for x in range(10) for y in range(10)]
+        shuffled = [reference[index] for index in np.random.default_rng(2).permutation(len(reference))]
+        self.assertEqual(ordering_points(reference, shuffled), reference)
+
+    def test_dense_homography_rejects_outliers(self):
+        homography = np.array([[1.05, 0.02, -12.0], [-0.01, 0.97, 8.0], [1e-5, 2e-5, 1.0]])
+        original_cords = np.float32([(x * 50.0, y * 40.0) for x in range(10) for y in range(10)])
+        cords = cv2.perspectiveTransform(original_cords.reshape(-1, 1, 2), np.linalg.inv(homography)).reshape(-1, 2)
+        cords[::17] += 60
+
+        calibration = CalibrationClass()
+        calibration.calculate_homography(cords=cords, original_cords=original_cords)
+
+        np.testing.assert_allclose(calibration.matrix_homography / calibration.matrix_homography[2, 2], homography,
+                                   rtol=1e-3, atol=1e-3)
+        self.assertIsNotNone(calibration.matrix_inverse_homography)
+
+
+if __name__ == '__main__':
+    unittest.main()
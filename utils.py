@@ -1,7 +1,8 @@
 import os
-from itertools import permutations
 
 import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
 
 
 def generate_cords(size, initial_position=None):
@@ -55,17 +56,13 @@ def generate_folders(path):
 
 
 def ordering_points(l_point1, l_point2):
-    l_distance_ordered = []
-    for l_ordering in permutations(list(range(len(l_point1)))):
-        d = 0
-        l_ordered_point = []
-        for i1, i2 in enumerate(l_ordering):
-            d += np.linalg.norm(np.array(l_point1[i1])
-                                - np.array(l_point2[i2]))
-            l_ordered_point += [l_point2[i2]]
-
-        l_distance_ordered += [[d, l_ordered_point]]
-
-    l_ordered_point = min(l_distance_ordered, key=lambda x: x[0])[1]
+    # Order l_point2 so the total distance to l_point1 is minimal (Hungarian assignment, O(n^3) instead of O(n!))
+    distances = cdist(np.asarray(l_point1, dtype=np.float64).reshape(len(l_point1), -1),
+                      np.asarray(l_point2, dtype=np.float64).reshape(len(l_point2), -1))
+    rows, columns = linear_sum_assignment(distances)
+
+    l_ordered_point = [None] * len(rows)
+    for row, column in zip(rows, columns):
+        l_ordered_point[row] = l_point2[column]
 
     return l_ordered_point
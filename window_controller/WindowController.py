@@ -9,7 +9,7 @@ from kinect_controller.KinectLock import lock
 
 class WindowController(threading.Thread):
     def __init__(self, window_name, image, width=None, height=None, position=None, fullscreen=False):
-        super(WindowController, self).__init__()
+        super(WindowController, self).__init__(name=f"window-{window_name}")
         self.window_name = window_name
         self.image = image
         self.position = position